@@ -1,11 +1,18 @@
 import ccxt
 import gspread
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 from google.oauth2.service_account import Credentials
 from time import sleep
 import logging
+import os
+import sys
+
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.candle_store import CandleStore
+from common.range_model import RangeModel
+from common.result_sinks import ResultSinks, SheetSink, file_sink
 
 # --- Setup Basic Logging ---
 logging.basicConfig(
@@ -28,6 +35,16 @@ GOOGLE_SHEETS_CREDENTIALS = "credentials1.json"
 SPREADSHEET_KEY = "1_DZ6ztD5M2eUBKwPurz2Zcvvu3s8EFWsVTwV33o2zU8" 
 WORKSHEET_NAME = "Sheet1"
 
+# --- Results ---
+# Every cycle is recorded as numbers to the Google Sheet (at once) and to each file
+# below (.sqlite / .db, .csv, or .parquet / .arrow with pyarrow), written every
+# RESULTS_FLUSH_SECONDS. drawdown.py reads all of these files.
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'results')
+RESULTS_FILES = [os.path.join(RESULTS_DIR, 'pancake_eth_usdt_paper.sqlite')]
+RESULTS_FLUSH_SECONDS = 300
+# Rows waiting here while Google Sheets is unreachable are sent by the next run.
+SHEET_SPOOL_FILE = os.path.join(RESULTS_DIR, 'pancake_eth_usdt_paper_sheet_spool.jsonl')
+
 # --- Strategy Parameters ---
 PAIR = "ETH/USDT"
 FEE_TIER = 0.003  # Represents 0.05%
@@ -55,7 +72,10 @@ class PaperTradingBot:
     def __init__(self):
         logging.info("Initializing Paper Trading Bot...")
         self.exchange = self._init_exchange()
-        self.worksheet = self._init_google_sheets()
+        self.results = self._init_results()
+        self.candle_store = CandleStore()
+        # Rolling stats of the last hourly closes; only new candles are fed in each cycle.
+        self.range_model = RangeModel(LOOKBACK_PERIOD_HOURS, ddof=1, fallback_std_pct=0.01)
 
         # --- State Management ---
         self.balance_usd = SIMULATION_CAPITAL_USD
@@ -80,11 +100,8 @@ class PaperTradingBot:
             logging.error(f"❌ Exchange connection failed: {e}")
             exit()
 
-    def _init_google_sheets(self):
-        """Initializes the connection to Google Sheets."""
-        if not SPREADSHEET_KEY or SPREADSHEET_KEY == "YOUR_GOOGLE_SHEET_KEY_HERE":
-            logging.warning("⚠️ Google Sheet key not provided. Skipping sheet logging.")
-            return None
+    def _open_worksheet(self):
+        """Opens the Google Sheet (called by the sheet writer thread)."""
         logging.info("Connecting to Google Sheets...")
         try:
             scopes = ["https://www.googleapis.com/auth/spreadsheets"]
@@ -96,7 +113,16 @@ class PaperTradingBot:
             return worksheet
         except Exception as e:
             logging.error(f"❌ Google Sheets connection failed: {e}")
-            return None
+            raise
+
+    def _init_results(self):
+        """The Google Sheet and the RESULTS_FILES, written in the background."""
+        sinks = [file_sink(path, flush_seconds=RESULTS_FLUSH_SECONDS) for path in RESULTS_FILES]
+        if not SPREADSHEET_KEY or SPREADSHEET_KEY == "YOUR_GOOGLE_SHEET_KEY_HERE":
+            logging.warning("⚠️ Google Sheet key not provided. Skipping sheet logging.")
+        else:
+            sinks.insert(0, SheetSink(self._open_worksheet, SHEET_SPOOL_FILE, name=WORKSHEET_NAME))
+        return ResultSinks(sinks)
 
     def _get_market_data(self):
         """Fetches the latest price and 1-minute volume from Binance."""
@@ -114,17 +140,19 @@ class PaperTradingBot:
         logging.info("Calculating dynamic range...")
         try:
             since = self.exchange.parse8601((datetime.utcnow() - timedelta(hours=LOOKBACK_PERIOD_HOURS)).isoformat())
-            ohlcv = self.exchange.fetch_ohlcv(PAIR, '1h', since=since, limit=LOOKBACK_PERIOD_HOURS)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            
-            average_price = df['close'].mean()
-            price_std_dev = df['close'].std()
-
-            if pd.isna(price_std_dev) or price_std_dev == 0:
-                price_std_dev = average_price * 0.01
-
-            self.price_range_min = average_price - (price_std_dev * VOLATILITY_MULTIPLIER)
-            self.price_range_max = average_price + (price_std_dev * VOLATILITY_MULTIPLIER)
+            df = self.candle_store.sync(self.exchange, PAIR, '1h', since).tail(LOOKBACK_PERIOD_HOURS)
+
+            # Feed only candles the model has not seen yet; the forming candle refreshes in place.
+            last_seen = self.range_model.last_timestamp
+            new_candles = df if last_seen is None else df[df['timestamp'] >= last_seen]
+            for timestamp, close in zip(new_candles['timestamp'], new_candles['close']):
+                self.range_model.update_candle(timestamp, close)
+
+            lower, upper = self.range_model.bounds(VOLATILITY_MULTIPLIER)
+            if lower is None:
+                logging.warning("No candles available for the range calculation yet.")
+                return
+            self.price_range_min, self.price_range_max = lower, upper
             logging.info(f"New range calculated: [${self.price_range_min:,.2f} - ${self.price_range_max:,.2f}]")
         except Exception as e:
             logging.error(f"❌ Failed to calculate dynamic range: {e}")
@@ -144,18 +172,10 @@ class PaperTradingBot:
         price_ratio = current_price / self.entry_price
         return ((2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1) * 100
 
-    def _update_google_sheet(self, status, price, pos_value, il, fees, pnl, alert):
-        """Appends a new row to the Google Sheet."""
-        if not self.worksheet: return
-        try:
-            timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-            row_data = [
-                timestamp, status, f"${price:,.2f}", f"${pos_value:,.2f}",
-                f"{il:.2f}%", f"${fees:.4f}", f"${pnl:.2f}", alert
-            ]
-            self.worksheet.append_row(row_data, value_input_option='USER_ENTERED')
-        except Exception as e:
-            logging.error(f"⚠️ Could not update Google Sheet: {e}")
+    def _record_result(self, status, price, pos_value, il, fees, pnl, alert):
+        """Queues one typed row for the Google Sheet and the results files."""
+        equity = self.balance_usd + pos_value + self.total_fees_earned
+        self.results.record(datetime.utcnow(), status, price, pos_value, il, fees, pnl, equity=equity, alert=alert)
 
     def run(self):
         """Main paper trading loop."""
@@ -210,10 +230,10 @@ class PaperTradingBot:
                         alert = f"Entered at ${current_price:,.2f}. Range: [${self.price_range_min:,.2f} - ${self.price_range_max:,.2f}]"
                         logging.info(f"🟢 {alert}")
 
-                # Log the current state to the console and Google Sheet
+                # Log the current state to the console, the Google Sheet and the results files
                 log_message = f"Status: {status}, Price: ${current_price:,.2f}, PnL: ${total_pnl:,.2f}"
                 logging.info(log_message)
-                self._update_google_sheet(status, current_price, position_value, il_percent, fees_this_period, total_pnl, alert)
+                self._record_result(status, current_price, position_value, il_percent, fees_this_period, total_pnl, alert)
 
                 sleep(LOOP_INTERVAL_SECONDS)
 
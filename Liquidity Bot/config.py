@@ -1,4 +1,5 @@
 # core/config.py
+import os
 
 # --- NETWORK & CHAIN CONFIGURATION ---
 
@@ -49,11 +50,32 @@ LOOKBACK_HOURS = 2
 VOLATILITY_MULTIPLIER = 1.5
 
 
+# --- EXCHANGE MARKET CACHE ---
+
+# The market lists of the CCXT exchanges are cached here, so a restart does not download
+# them again. Caches older than the TTL are used at once and refreshed in the background.
+MARKET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'markets')
+MARKET_CACHE_TTL_HOURS = 24
+
+# Exchanges asked in parallel for candles; the first non-empty answer is used.
+CANDLE_HEDGED_REQUESTS = 2
+
+# The range calculation reads hourly candles from an in-memory buffer per symbol. A
+# buffer refreshed less than this many seconds ago is used without a new request.
+CANDLE_REFRESH_SECONDS = 30
+
+# A pair without a direct market is built from its two USDT legs, matched by candle
+# time. A leg missing up to this many hourly candles in a row keeps its last close.
+SYNTHETIC_MAX_FILL_CANDLES = 2
+
+
 # --- GOOGLE SHEETS ---
 
 SHEET_NAME = "LiquidityBot_Performance"
 WORKSHEET_NAME = "Live_Trades"
 GCP_CREDENTIALS_FILENAME = "credentials.json"
+# Rows wait here while Google Sheets is unreachable and are sent once it is back.
+SHEET_SPOOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'sheets', 'live_trades_spool.jsonl')
 # Add this to your config.py file
 
 # --- POOL & TOKEN CONFIGURATION ---
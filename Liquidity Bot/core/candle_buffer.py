@@ -0,0 +1,115 @@
+# liquidity_bot/core/candle_buffer.py
+"""
+In-memory hourly candle buffers for the live range calculation.
+
+`StrategyEngine._calculate_dynamic_range` needs the last LOOKBACK_HOURS of hourly candles
+on every SEARCHING cycle, and it used to download all of them again each time, even
+though they were fetched a minute earlier. `CandleBuffers` keeps a ring buffer of the
+newest candles per symbol. A buffer is seeded once through the candle router. After
+that, only candles from the newest held timestamp on are fetched, from the exchange
+that seeded it. The newest candle is fetched again because it may still be open. A
+buffer refreshed less than `min_refresh_seconds` ago is used as it is, so engines
+sharing a symbol (e.g. a USDT leg) share one request.
+"""
+
+import threading
+import time
+from collections import deque
+
+HOUR_MS = 60 * 60 * 1000
+
+
+class CandleRingBuffer:
+    """The newest `capacity` candles of one symbol from one exchange, oldest first."""
+
+    def __init__(self, exchange, capacity):
+        self.exchange = exchange
+        self.capacity = capacity
+        self.candles = deque(maxlen=capacity)
+        self.refreshed_at = None  # clock time of the last fetch
+
+    @property
+    def last_timestamp(self):
+        return self.candles[-1][0] if self.candles else None
+
+    def merge(self, candles):
+        """
+        Appends the candles newer than the newest one held. A candle with the newest
+        timestamp replaces it, because that candle was still open when it was fetched.
+        """
+        for candle in candles:
+            last_timestamp = self.last_timestamp
+            if last_timestamp is None or candle[0] > last_timestamp:
+                self.candles.append(candle)
+            elif candle[0] == last_timestamp:
+                self.candles[-1] = candle
+
+    def since(self, since_ms):
+        return [candle for candle in self.candles if candle[0] >= since_ms]
+
+
+class CandleBuffers:
+    """
+    Hourly candle buffers per symbol, fed by a `CandleRouter`.
+
+    :param router: Seeds new buffers (`fetch_ohlcv(symbol, timeframe, since)`).
+    :param min_refresh_seconds: A buffer younger than this is not refreshed.
+    :param clock: Monotonic clock in seconds (replaceable in tests).
+    :param now_ms: Wall clock in epoch milliseconds (replaceable in tests).
+    """
+
+    def __init__(self, router, min_refresh_seconds=30, clock=time.monotonic,
+                 now_ms=lambda: int(time.time() * 1000)):
+        self.router = router
+        self.min_refresh_seconds = min_refresh_seconds
+        self._clock = clock
+        self._now_ms = now_ms
+        self._buffers = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, symbol):
+        with self._locks_lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _seed(self, symbol, lookback_hours, since):
+        exchange, candles = self.router.fetch_ohlcv(symbol, '1h', since)
+        if not candles:
+            self._buffers.pop(symbol, None)
+            return None
+        # Room for the lookback plus the open candle and the one before it.
+        buffer = CandleRingBuffer(exchange, lookback_hours + 2)
+        buffer.merge(candles)
+        buffer.refreshed_at = self._clock()
+        self._buffers[symbol] = buffer
+        return buffer
+
+    def _update(self, symbol, buffer):
+        """Fetches the candles from the newest held one on; False if that failed."""
+        try:
+            candles = buffer.exchange.fetch_ohlcv(symbol, '1h', buffer.last_timestamp)
+        except Exception as e:
+            print(f"Info: Could not update {symbol} from {buffer.exchange.name} ({e.__class__.__name__}). Reseeding...")
+            return False
+        buffer.merge(candles)
+        buffer.refreshed_at = self._clock()
+        return True
+
+    def candles(self, symbol, lookback_hours):
+        """
+        The hourly candles of `symbol` opened in the last `lookback_hours`, as
+        `exchange.fetch_ohlcv(symbol, '1h', since)` returns them, or [] if no exchange
+        has the symbol.
+        """
+        now_ms = self._now_ms()
+        since = now_ms - lookback_hours * HOUR_MS
+        with self._lock_for(symbol):
+            buffer = self._buffers.get(symbol)
+            if (buffer is None or buffer.capacity < lookback_hours + 2
+                    or now_ms - buffer.last_timestamp > buffer.capacity * HOUR_MS):
+                # New symbol, a longer lookback, or a gap the buffer cannot bridge.
+                buffer = self._seed(symbol, lookback_hours, since)
+            elif self._clock() - buffer.refreshed_at >= self.min_refresh_seconds:
+                if not self._update(symbol, buffer):
+                    buffer = self._seed(symbol, lookback_hours, since)
+            return buffer.since(since) if buffer else []
@@ -0,0 +1,142 @@
+# liquidity_bot/core/candle_router.py
+"""
+Routing of candle requests across the CCXT exchanges.
+
+services.get_historical_data used to try KuCoin, then Binance, then Gate.io one after
+the other, so a pair missing on KuCoin cost a failed round trip on every cycle. A
+`CandleRouter` skips exchanges that do not list a symbol, according to their (cached)
+markets, an earlier BadSymbol error or an earlier empty answer. It asks the best
+`hedge` sources in parallel and takes the first non-empty answer. Sources are ranked by
+their measured latency and error rate, so a slow or failing exchange moves back in the
+order.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_HEDGE = 2
+# How long an exchange that answered a symbol with no candles is skipped for it.
+EMPTY_ANSWER_TTL_SECONDS = 3600
+# Weight of the newest request in the latency / error-rate averages.
+STATS_ALPHA = 0.3
+
+
+def _is_unlisted_error(error):
+    import ccxt
+    return isinstance(error, ccxt.BadSymbol)
+
+
+class SourceStats:
+    """Moving averages of one exchange's request latency and error rate."""
+
+    __slots__ = ('latency', 'error_rate', 'requests', 'errors')
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, seconds, failed):
+        self.requests += 1
+        self.errors += int(failed)
+        self.latency = seconds if self.latency is None else self.latency + STATS_ALPHA * (seconds - self.latency)
+        self.error_rate += STATS_ALPHA * (float(failed) - self.error_rate)
+
+    def cost(self):
+        """
+        Rough expected wait for a valid answer. A source that was never asked counts as
+        free, so every exchange gets measured.
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(1.0 - self.error_rate, 0.05)
+
+
+class CandleRouter:
+    """
+    Fetches candles from the best exchange that lists a symbol.
+
+    :param exchanges: ccxt clients in priority order, e.g. services.exchanges. The
+                      priority breaks ties between sources with equal statistics.
+    :param hedge: Sources asked in parallel; 1 asks them one at a time.
+    :param clock: Monotonic clock in seconds (replaceable in tests).
+    """
+
+    def __init__(self, exchanges, hedge=DEFAULT_HEDGE, empty_answer_ttl=EMPTY_ANSWER_TTL_SECONDS,
+                 clock=time.monotonic, max_workers=8):
+        self.exchanges = exchanges
+        self.hedge = max(1, int(hedge))
+        self.empty_answer_ttl = empty_answer_ttl
+        self.stats = {}  # exchange id -> SourceStats
+        self._clock = clock
+        self._skipped = {}  # (exchange id, symbol) -> clock time until which it is skipped
+        self._lock = threading.Lock()
+        # Threads start on the first request, so creating a router connects to nothing.
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='candles')
+
+    def _stats(self, exchange):
+        with self._lock:
+            return self.stats.setdefault(exchange.id, SourceStats())
+
+    def _may_list(self, exchange, symbol, now):
+        markets = getattr(exchange, 'markets', None)
+        if markets and symbol not in markets:
+            return False
+        with self._lock:
+            until = self._skipped.get((exchange.id, symbol))
+        return until is None or now >= until
+
+    def _skip(self, exchange, symbol, seconds):
+        with self._lock:
+            self._skipped[(exchange.id, symbol)] = self._clock() + seconds
+
+    def sources(self, symbol):
+        """The exchanges that may list `symbol`, best first."""
+        now = self._clock()
+        candidates = [exchange for exchange in self.exchanges if self._may_list(exchange, symbol, now)]
+        # sorted() is stable, so equal costs keep the configured priority.
+        return sorted(candidates, key=lambda exchange: self._stats(exchange).cost())
+
+    def _fetch(self, exchange, symbol, timeframe, since, limit):
+        started = self._clock()
+        try:
+            candles = exchange.fetch_ohlcv(symbol, timeframe, since, limit)
+        except Exception as e:
+            unlisted = _is_unlisted_error(e)
+            self._stats(exchange).record(self._clock() - started, failed=not unlisted)
+            if unlisted:
+                self._skip(exchange, symbol, float('inf'))
+            raise
+        self._stats(exchange).record(self._clock() - started, failed=False)
+        if not candles:
+            self._skip(exchange, symbol, self.empty_answer_ttl)
+        return candles
+
+    def fetch_ohlcv(self, symbol, timeframe='1h', since=None, limit=None):
+        """
+        Returns (exchange, candles) from the first source with a non-empty answer, or
+        (None, []) when no exchange has candles for `symbol`.
+        """
+        sources = self.sources(symbol)
+        for first in range(0, len(sources), self.hedge):
+            group = sources[first:first + self.hedge]
+            print(f"Attempting to fetch {symbol} from {', '.join(exchange.name for exchange in group)}...")
+            futures = {self._executor.submit(self._fetch, exchange, symbol, timeframe, since, limit): rank
+                       for rank, exchange in enumerate(group)}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # Of answers arriving together, the better-ranked source wins.
+                for future in sorted(done, key=futures.get):
+                    exchange = group[futures[future]]
+                    try:
+                        candles = future.result()
+                    except Exception as e:
+                        print(f"Info: Could not fetch {symbol} from {exchange.name} ({e.__class__.__name__}).")
+                        continue
+                    if candles:
+                        # Hedged requests still running finish in the background.
+                        return exchange, candles
+        return None, []
@@ -0,0 +1,116 @@
+# liquidity_bot/core/exchange_cache.py
+"""
+Lazily created ccxt clients with their market metadata cached on disk.
+
+`load_markets()` downloads the full market list of an exchange, several MB for Binance,
+and services.py used to do that for three exchanges at import time. An `ExchangePool`
+creates a client only when it is first used. Its markets come from a JSON file in the
+cache directory when there is one. A file older than the TTL is still used at once,
+while a background thread downloads fresh markets and rewrites it. Only a run without
+any cache file waits for `load_markets()`.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+def _create_client(name):
+    import ccxt  # imported on first use; importing ccxt alone takes a noticeable moment
+    return getattr(ccxt, name)()
+
+
+def read_market_cache(path):
+    """Returns (markets, currencies, fetched_at) from a cache file, or None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        return cached['markets'], cached.get('currencies'), float(cached['fetched_at'])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable market cache {path}: {e}")
+        return None
+
+
+def write_market_cache(path, exchange):
+    """Saves the loaded markets of `exchange` (atomically)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump({'exchange': exchange.id, 'fetched_at': time.time(),
+                   'markets': exchange.markets, 'currencies': exchange.currencies}, f, default=str)
+    os.replace(temporary, path)
+
+
+class ExchangePool:
+    """
+    ccxt clients in priority order, each created on first use.
+
+    :param names: ccxt exchange ids, e.g. ['kucoin', 'binance', 'gateio'].
+    :param cache_dir: Directory of the `<name>_markets.json` cache files.
+    :param ttl_seconds: Age after which cached markets are refreshed in the background.
+    :param factory: Creates a client from its name (replaceable in tests).
+    """
+
+    def __init__(self, names, cache_dir, ttl_seconds, factory=_create_client):
+        self.names = list(names)
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self._factory = factory
+        self._clients = {}
+        self._failed = set()
+        # One lock per exchange: concurrent first uses wait for a single initialization.
+        self._locks = {name: threading.Lock() for name in self.names}
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}_markets.json")
+
+    def get(self, name):
+        """The client of `name` with its markets set, or None if it could not be initialized."""
+        with self._locks[name]:
+            if name in self._clients:
+                return self._clients[name]
+            if name in self._failed:
+                return None
+            try:
+                exchange = self._factory(name)
+                self._load_markets(name, exchange)
+            except Exception as e:
+                # Like a failed start-up connection before, the exchange stays skipped.
+                print(f"Could not initialize {name} client: {e}")
+                self._failed.add(name)
+                return None
+            self._clients[name] = exchange
+            print(f"Successfully initialized {name} client.")
+            return exchange
+
+    def __iter__(self):
+        """Yields the available clients in priority order, creating each one when reached."""
+        for name in self.names:
+            exchange = self.get(name)
+            if exchange is not None:
+                yield exchange
+
+    def _load_markets(self, name, exchange):
+        path = self._cache_path(name)
+        cached = read_market_cache(path)
+        if cached is None:
+            exchange.load_markets()
+            write_market_cache(path, exchange)
+            return
+        markets, currencies, fetched_at = cached
+        exchange.set_markets(markets, currencies)
+        if time.time() - fetched_at > self.ttl_seconds:
+            threading.Thread(target=self._refresh, args=(name, exchange), name=f"markets-{name}", daemon=True).start()
+
+    def _refresh(self, name, exchange):
+        """Downloads fresh markets with a separate client and hands them to `exchange`."""
+        try:
+            fresh = self._factory(name)
+            fresh.load_markets()
+            exchange.set_markets(fresh.markets, fresh.currencies)
+            write_market_cache(self._cache_path(name), fresh)
+        except Exception as e:
+            print(f"⚠️ Could not refresh the {name} markets, keeping the cached ones: {e}")
@@ -0,0 +1,156 @@
+# liquidity_bot/core/multicall.py
+"""
+Batched slot0 reads for many pools on one chain.
+
+`services.get_onchain_price` makes one `slot0()` eth_call per pool, so RPC requests
+and latency grow with the number of pools. `BatchedPriceReader` reads every pool of a
+chain in one round trip instead. By default it sends one eth_call to Multicall3's
+`aggregate3`; mode='batch' sends a JSON-RPC batch of plain eth_calls instead. The ABI
+encoding and decoding is done by hand (common/multicall3.py for aggregate3,
+common/slot0.py for slot0), so a read needs no contract objects. The pools come from
+the `PoolRegistry`, which holds their checksummed addresses and token decimals.
+`JsonRpcClient` speaks plain JSON-RPC over HTTP, which makes the reader easy to test
+against a local stub server.
+"""
+
+import http.client
+import itertools
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlsplit
+
+# Make the shared modules in the repository root importable.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.multicall3 import MULTICALL3_ADDRESS, decode_aggregate3, encode_aggregate3
+from common.slot0 import SLOT0_SELECTOR, decode_slot0, hex_bytes
+
+MODE_MULTICALL = 'multicall'
+MODE_BATCH = 'batch'
+
+
+# --- Transport ---
+
+class JsonRpcClient:
+    """
+    Minimal JSON-RPC over HTTP(S) on one persistent connection (thread-safe).
+
+    :param url: The RPC endpoint, e.g. the Alchemy URL with the key.
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        parts = urlsplit(url)
+        self._https = parts.scheme == 'https'
+        self._host = parts.netloc
+        self._path = parts.path + (f"?{parts.query}" if parts.query else '') or '/'
+        self._timeout = timeout
+        self._connection = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.requests_sent = 0  # HTTP round trips, for monitoring
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return connection_class(self._host, timeout=self._timeout)
+
+    def _post(self, payload):
+        body = json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json'}
+        with self._lock:
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = self._connect()
+                try:
+                    self._connection.request('POST', self._path, body, headers)
+                    response = self._connection.getresponse()
+                    data = response.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # A dropped keep-alive connection is reopened once.
+                    self._connection.close()
+                    self._connection = None
+                    if attempt:
+                        raise
+            self.requests_sent += 1
+        if response.status != 200:
+            raise ConnectionError(f"JSON-RPC HTTP {response.status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def _request(self, method, params):
+        return {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params}
+
+    def call(self, method, params):
+        """Sends one request and returns its result."""
+        reply = self._post(self._request(method, params))
+        if 'error' in reply:
+            raise ConnectionError(f"JSON-RPC error: {reply['error']}")
+        return reply['result']
+
+    def batch(self, calls):
+        """
+        Sends [(method, params), ...] as one JSON-RPC batch. Returns the results in order;
+        a failed request gives an Exception instance in its place.
+        """
+        requests = [self._request(method, params) for method, params in calls]
+        replies = {reply.get('id'): reply for reply in self._post(requests)}
+        results = []
+        for request in requests:
+            reply = replies.get(request['id'], {'error': 'missing reply'})
+            results.append(ConnectionError(f"JSON-RPC error: {reply['error']}") if 'error' in reply else reply['result'])
+        return results
+
+
+# --- Reader ---
+
+class BatchedPriceReader:
+    """
+    Reads slot0 prices of many pools on one chain in a single round trip.
+
+    :param rpc: A `JsonRpcClient` (or anything with `call` / `batch`).
+    :param pools: The `RegisteredPool`s of one chain (see core/pool_registry.py); prices
+                  are returned under their names.
+    :param mode: 'multicall' (one eth_call to Multicall3 aggregate3) or 'batch' (a
+                 JSON-RPC batch of eth_calls).
+    """
+
+    def __init__(self, rpc, pools, mode=MODE_MULTICALL, multicall_address=MULTICALL3_ADDRESS):
+        if mode not in (MODE_MULTICALL, MODE_BATCH):
+            raise ValueError(f"Unknown mode '{mode}'")
+        self.rpc = rpc
+        self.pools = {pool.name: pool for pool in pools}
+        self.mode = mode
+        self.multicall_address = multicall_address
+        self._names = list(self.pools)
+        self._batch_calls = [self.pools[name].call for name in self._names]
+        self._multicall_data = '0x' + encode_aggregate3(
+            [(self.pools[name].address, True, SLOT0_SELECTOR) for name in self._names]).hex()
+
+    def _price(self, name, return_data):
+        try:
+            sqrt_price_x96, _ = decode_slot0(return_data)
+        except ValueError as e:
+            print(f"⚠️ Could not decode slot0 of {name}: {e}")
+            return None
+        return self.pools[name].price(sqrt_price_x96)
+
+    def read(self, block='latest'):
+        """Returns {pool name: price or None} for every pool, from one RPC round trip."""
+        if not self._names:
+            return {}
+        if self.mode == MODE_MULTICALL:
+            result = self.rpc.call('eth_call', [{'to': self.multicall_address, 'data': self._multicall_data}, block])
+            returns = decode_aggregate3(hex_bytes(result))
+            return {name: (self._price(name, data) if success else None)
+                    for name, (success, data) in zip(self._names, returns)}
+
+        results = self.rpc.batch([('eth_call', [call, block]) for call in self._batch_calls])
+        prices = {}
+        for name, result in zip(self._names, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ slot0 of {name} failed: {result}")
+                prices[name] = None
+            else:
+                prices[name] = self._price(name, hex_bytes(result))
+        return prices
@@ -0,0 +1,83 @@
+# liquidity_bot/core/pool_registry.py
+"""
+Pools of config.KNOWN_POOLS, prepared once for cheap price reads.
+
+`get_onchain_price` used to build a web3 contract from MINIMAL_POOL_ABI and checksum the
+pool address on every call, and then go through web3's contract-function machinery
+(ABI lookup, argument encoding, output decoding) to read slot0. A `PoolRegistry` does
+the fixed work once at startup: it checksums the addresses and precomputes the eth_call
+parameters of every pool. A read is then one raw `eth_call` through the provider, and
+the returned bytes are decoded directly (see common/slot0.py). The batched reads of
+core/multicall.py read the same registered pools.
+"""
+
+import os
+import sys
+
+from web3 import Web3
+
+# Make the shared modules in the repository root importable.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.slot0 import SLOT0_CALLDATA, decode_slot0, hex_bytes, slot0_price
+
+
+class RegisteredPool:
+    """One pool with everything a price read needs precomputed."""
+
+    __slots__ = ('chain_name', 'name', 'address', 'token0', 'token1', 'call')
+
+    def __init__(self, chain_name, name, pool_info, checksum=Web3.to_checksum_address):
+        self.chain_name = chain_name
+        self.name = name
+        self.address = checksum(pool_info['pool_address'])
+        self.token0 = pool_info['token0']
+        self.token1 = pool_info['token1']
+        self.call = {'to': self.address, 'data': SLOT0_CALLDATA}
+
+    def price(self, sqrt_price_x96):
+        """token0 per token1 for a sqrtPriceX96. None for an uninitialized pool."""
+        return slot0_price(sqrt_price_x96, self.token0['decimals'], self.token1['decimals'], token0_per_token1=True)
+
+    def read_price(self, w3, block='latest'):
+        """
+        Reads slot0 with one raw eth_call through `w3.provider`, skipping web3's
+        middleware and contract machinery.
+
+        :raises ConnectionError: If the node answers with an error.
+        """
+        response = w3.provider.make_request('eth_call', [self.call, block])
+        if 'error' in response:
+            raise ConnectionError(f"eth_call to {self.name} failed: {response['error']}")
+        sqrt_price_x96, _ = decode_slot0(hex_bytes(response['result']))
+        return self.price(sqrt_price_x96)
+
+
+class PoolRegistry:
+    """
+    Every pool of `known_pools` (config.KNOWN_POOLS layout: chain -> pair -> pool info),
+    looked up by chain and pair or by address.
+    """
+
+    def __init__(self, known_pools):
+        self._pools = {}
+        self._by_address = {}
+        for chain_name, pools in known_pools.items():
+            for name, pool_info in pools.items():
+                self.add(chain_name, name, pool_info)
+
+    def add(self, chain_name, name, pool_info):
+        pool = RegisteredPool(chain_name, name, pool_info)
+        self._pools[(chain_name, name)] = pool
+        self._by_address[pool.address.lower()] = pool
+        return pool
+
+    def get(self, chain_name, name):
+        """The pool of `name` on `chain_name`; KeyError if it is not registered."""
+        return self._pools[(chain_name, name)]
+
+    def by_address(self, address):
+        """The pool at `address` (any case), or None."""
+        return self._by_address.get(address.lower())
+
+    def __len__(self):
+        return len(self._pools)
@@ -1,37 +1,37 @@
 # liquidity_bot/core/services.py
 
 import os
+import sys
 import time
 import math
-import ccxt
 from web3 import Web3
 from dotenv import load_dotenv
 import traceback
 import gspread,config
+from core.candle_buffer import CandleBuffers
+from core.candle_router import CandleRouter
+from core.exchange_cache import ExchangePool
+from core.multicall import BatchedPriceReader, JsonRpcClient, MODE_MULTICALL
+from core.pool_registry import PoolRegistry, RegisteredPool
+from core.synthetic_pairs import SyntheticPairs
 
-# Load environment variables from .env file
-load_dotenv()
+# Make the shared modules in the repository root importable.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.fee_tracker import PoolFeeReader
+from common.sheet_writer import SheetWriter
 
-# --- INITIALIZE EXTERNAL CONNECTIONS ---
+# --- EXTERNAL CONNECTIONS ---
 
-# Initialize CCXT exchange client (KuCoin)
-# We use this for reliable historical data
-# In core/services.py
-
-# --- INITIALIZE EXTERNAL CONNECTIONS ---
-
-# Initialize multiple CCXT exchange clients in a prioritized list
+# Multiple CCXT exchange clients in a prioritized list. Importing this module connects to
+# nothing: each client is created on first use, with its markets from the disk cache.
 exchange_names = ['kucoin', 'binance', 'gateio']
-exchanges = []
-for name in exchange_names:
-    try:
-        exchange_class = getattr(ccxt, name)
-        exchange = exchange_class()
-        exchange.load_markets()
-        exchanges.append(exchange)
-        print(f"Successfully initialized {name} client.")
-    except Exception as e:
-        print(f"Could not initialize {name} client: {e}")
+exchanges = ExchangePool(exchange_names, config.MARKET_CACHE_DIR, config.MARKET_CACHE_TTL_HOURS * 3600)
+# Routes candle requests to the exchanges that list a pair, fastest and most reliable first.
+candle_router = CandleRouter(exchanges, hedge=config.CANDLE_HEDGED_REQUESTS)
+# Hourly candles held in memory for the range calculation, updated incrementally.
+candle_buffers = CandleBuffers(candle_router, min_refresh_seconds=config.CANDLE_REFRESH_SECONDS)
+# Cross pairs without a direct market, built from their USDT legs in candle_buffers.
+synthetic_pairs = SyntheticPairs(candle_buffers, max_fill_candles=config.SYNTHETIC_MAX_FILL_CANDLES)
 # A minimal ABI for a Uniswap V3 style pool to get the current price
 # In core/services.py
 
@@ -71,13 +71,32 @@ MINIMAL_POOL_ABI = [
     }
 ]
 
-def get_web3_instance(chain_config):
-    """Initializes and returns a Web3 instance for a given chain."""
+# Built by get_pool_registry() on first use.
+_pool_registry = None
+# Fee-growth readers by pool address, shared by the engines of a pool.
+_fee_readers = {}
+
+def get_rpc_url(chain_config):
+    """Returns the RPC URL of a chain with the Alchemy API key appended."""
+    # Load environment variables from .env file
+    load_dotenv()
     alchemy_api_key = os.getenv("ALCHEMY_API_KEY")
     if not alchemy_api_key:
         raise ValueError("ALCHEMY_API_KEY not found in .env file!")
-    
-    rpc_url = f"{chain_config['rpc_url']}{alchemy_api_key}"
+    return f"{chain_config['rpc_url']}{alchemy_api_key}"
+
+def get_ws_url(chain_config):
+    """
+    Returns the websocket URL of a chain for newHeads subscriptions: its 'ws_url' entry,
+    or the Alchemy RPC URL with wss:// instead of https://.
+    """
+    if chain_config.get('ws_url'):
+        return chain_config['ws_url']
+    return get_rpc_url(chain_config).replace('https://', 'wss://', 1)
+
+def get_web3_instance(chain_config):
+    """Initializes and returns a Web3 instance for a given chain."""
+    rpc_url = get_rpc_url(chain_config)
     w3 = Web3(Web3.HTTPProvider(rpc_url))
     
     if w3.is_connected():
@@ -93,32 +112,27 @@ def get_web3_instance(chain_config):
 # Replace the entire get_onchain_price function with this one:
 # In core/services.py
 
-def get_onchain_price(w3, pool_address, token0_config, token1_config):
+def get_pool_registry():
+    """The `PoolRegistry` of config.KNOWN_POOLS, built on first use."""
+    global _pool_registry
+    if _pool_registry is None:
+        _pool_registry = PoolRegistry(config.KNOWN_POOLS)
+    return _pool_registry
+
+def get_fee_reader(w3, pool):
+    """The `PoolFeeReader` of a registered pool; its per-block cache is shared."""
+    reader = _fee_readers.get(pool.address)
+    if reader is None:
+        reader = _fee_readers.setdefault(pool.address, PoolFeeReader(w3, pool.address))
+    return reader
+
+def get_pool_price(w3, pool):
     """
-    Fetches the current price from a Uniswap V3 style pool.
-    The price is returned in the standard format: amount of token0 per token1.
+    Current price of a registered pool, in token0 per token1 like get_onchain_price.
+    Returns None when the read fails.
     """
-    pool_contract = w3.eth.contract(address=w3.to_checksum_address(pool_address), abi=MINIMAL_POOL_ABI)
-    
     try:
-        # We now explicitly ask for data from the 'latest' block to be more robust.
-        slot0_data = pool_contract.functions.slot0().call(block_identifier='latest')
-
-        if isinstance(slot0_data, (list, tuple)):
-            sqrt_price_x96 = slot0_data[0]
-        else:
-            sqrt_price_x96 = slot0_data
-        
-        raw_price_t1_per_t0 = (sqrt_price_x96 / 2**96)**2
-        
-        if raw_price_t1_per_t0 == 0:
-            return None
-            
-        price_t0_per_t1 = 1 / raw_price_t1_per_t0
-        
-        adjusted_price = price_t0_per_t1 * (10**token1_config['decimals'] / 10**token0_config['decimals'])
-        
-        return adjusted_price
+        return pool.read_price(w3)
     except Exception as e:
         print("--- ERROR DETAILS ---")
         print(f"Caught Exception: {e}")
@@ -126,108 +140,122 @@ def get_onchain_price(w3, pool_address, token0_config, token1_config):
         print("--- END ERROR DETAILS ---")
         return None
 
-    except Exception as e:
-        print(f"--- ERROR DETAILS ---")
-        print(f"Caught Exception: {e}")
-        # This will print the full, detailed traceback to find the exact line
-        traceback.print_exc()
-        print(f"--- END ERROR DETAILS ---")
-        return None
-# Add this function to the end of core/services.py
-
-def log_to_google_sheet(data_row):
+def get_onchain_price(w3, pool_address, token0_config, token1_config):
     """
-    Logs a list of data as a new row to the configured Google Sheet.
-    
-    :param data_row: A list of values to append (e.g., [timestamp, pair, action, price]).
+    Fetches the current price from a Uniswap V3 style pool.
+    The price is returned in the standard format: amount of token0 per token1.
+    Pools of config.KNOWN_POOLS come prepared from the pool registry; others are
+    prepared for this call only.
     """
+    pool = get_pool_registry().by_address(pool_address)
+    if pool is None or pool.token0 != token0_config or pool.token1 != token1_config:
+        pool = RegisteredPool(None, pool_address, {
+            'pool_address': pool_address, 'token0': token0_config, 'token1': token1_config})
+    return get_pool_price(w3, pool)
+
+# Add this function to the end of core/services.py
+
+def _open_worksheet():
+    """Authenticates and opens the configured worksheet (once per sheet writer connection)."""
     try:
         # Authenticate with Google Sheets using the JSON credentials file
         gc = gspread.service_account(filename=config.GCP_CREDENTIALS_FILENAME)
-        
+
         # Open the spreadsheet and the specific worksheet
-        sh = gc.open(config.SHEET_NAME).worksheet(config.WORKSHEET_NAME)
-        
-        # Append the data as a new row
-        sh.append_row(data_row)
-        print(f"✅ Successfully logged action to Google Sheet: {data_row[2]}")
+        return gc.open(config.SHEET_NAME).worksheet(config.WORKSHEET_NAME)
 
     except FileNotFoundError:
         print(f"❌ Google Sheets Error: Credentials file not found at '{config.GCP_CREDENTIALS_FILENAME}'.")
+        raise
     except gspread.exceptions.SpreadsheetNotFound:
         print(f"❌ Google Sheets Error: Spreadsheet named '{config.SHEET_NAME}' not found.")
+        raise
     except gspread.exceptions.WorksheetNotFound:
         print(f"❌ Google Sheets Error: Worksheet named '{config.WORKSHEET_NAME}' not found.")
-    except Exception as e:
-        print(f"❌ An unexpected error occurred with Google Sheets: {e}")
+        raise
 
-# In core/services.py
+# Rows are appended in batches by a background thread and spooled to disk while Google
+# Sheets is unreachable (see common/sheet_writer.py).
+sheet_writer = SheetWriter(_open_worksheet, config.SHEET_SPOOL_FILE, name=config.WORKSHEET_NAME)
 
-def get_historical_data(trading_pair, lookback_hours):
-    """
-    Fetches historical OHLCV data by trying a chain of exchanges.
-    It tries KuCoin, then Binance, then Gate.io until it finds the data.
+def log_to_google_sheet(data_row):
     """
-    if not exchanges:
-        print("No CCXT exchange clients available.")
-        return []
+    Logs a list of data as a new row to the configured Google Sheet. The row is queued
+    for the sheet writer, so this returns at once.
 
-    since = exchanges[0].parse8601(exchanges[0].iso8601(int(time.time() * 1000) - lookback_hours * 60 * 60 * 1000))
+    :param data_row: A list of values to append (e.g., [timestamp, pair, action, price]).
+    """
+    sheet_writer.append(data_row)
+    print(f"✅ Queued action for Google Sheet: {data_row[2]}")
 
-    for exchange in exchanges:
-        try:
-            # Attempt to fetch data from the current exchange
-            print(f"Attempting to fetch {trading_pair} from {exchange.name}...")
-            ohlcv = exchange.fetch_ohlcv(trading_pair, '1h', since)
+# In core/services.py
 
-            # If data is found (list is not empty), process and return it
-            if ohlcv:
-                print(f"✅ Success! Found data for {trading_pair} on {exchange.name}.")
-                closing_prices = [candle[4] for candle in ohlcv]
-                return closing_prices
+def get_historical_data(trading_pair, lookback_hours):
+    """
+    Fetches historical OHLCV data from the exchanges.
+    The candle router skips exchanges that do not list the pair and asks the best
+    CANDLE_HEDGED_REQUESTS of the others in parallel (KuCoin, Binance, Gate.io at first).
+    """
+    since = int(time.time() * 1000) - lookback_hours * 60 * 60 * 1000
 
-        except Exception as e:
-            # This error means the market doesn't exist on this exchange, which is okay.
-            print(f"Info: Could not fetch from {exchange.name} ({e.__class__.__name__}). Trying next exchange...")
-            continue # Move to the next exchange in the list
+    exchange, ohlcv = candle_router.fetch_ohlcv(trading_pair, '1h', since)
+    if ohlcv:
+        print(f"✅ Success! Found data for {trading_pair} on {exchange.name}.")
+        closing_prices = [candle[4] for candle in ohlcv]
+        return closing_prices
 
-    # This line is reached only if the loop completes without finding the data on any exchange
+    # This line is reached only if no exchange had data for the pair
     print(f"❌ Data for {trading_pair} not found on any of the configured exchanges.")
     return []
+def get_recent_closes(trading_pair, lookback_hours):
+    """
+    The closing prices get_historical_data returns, from the in-memory candle buffer:
+    after the first call only the newest candles are fetched.
+    """
+    candles = candle_buffers.candles(trading_pair, lookback_hours)
+    if not candles:
+        print(f"❌ Data for {trading_pair} not found on any of the configured exchanges.")
+        return []
+    return [candle[4] for candle in candles]
+
+
+def get_synthetic_closes(base, quote, lookback_hours):
+    """
+    Hourly `base`/`quote` closes built from the base/USDT and quote/USDT legs, joined on
+    their candle timestamps. Each leg is fetched once for all pairs that use it.
+    """
+    return synthetic_pairs.closes(base, quote, lookback_hours)
 # Add this function to core/services.py
 
 # In core/services.py
 
 def get_recent_trading_volume(trading_pair, hours_to_check):
     """
-    Fetches the total trading volume by trying a chain of exchanges.
+    Fetches the total trading volume from the exchanges (routed like get_historical_data).
     Volume is correctly calculated and returned in the quote currency (e.g., USD).
     """
-    if not exchanges:
-        print("No CCXT exchange clients available.")
-        return 0
-
-    since = exchanges[0].parse8601(exchanges[0].iso8601(int(time.time() * 1000) - hours_to_check * 60 * 60 * 1000))
-
-    # This loop tries each exchange until it finds the data.
-    for exchange in exchanges:
-        try:
-            print(f"Attempting to fetch volume for {trading_pair} from {exchange.name}...")
-            ohlcv = exchange.fetch_ohlcv(trading_pair, '1h', since)
-            
-            if ohlcv:
-                # --- CORRECTED VOLUME CALCULATION ---
-                # We multiply the base volume (candle[5]) by the closing price (candle[4])
-                # for each candle to get the volume in the quote currency (USD).
-                total_quote_volume = sum(candle[5] * candle[4] for candle in ohlcv)
-                
-                print(f"✅ Success! Found volume data on {exchange.name}.")
-                print(f"Fetched total volume for {trading_pair} in last {hours_to_check}h: ${total_quote_volume:,.2f}")
-                return total_quote_volume
-
-        except Exception as e:
-            print(f"Info: Could not fetch volume from {exchange.name} ({e.__class__.__name__}). Trying next exchange...")
-            continue
+    since = int(time.time() * 1000) - hours_to_check * 60 * 60 * 1000
+
+    exchange, ohlcv = candle_router.fetch_ohlcv(trading_pair, '1h', since)
+    if ohlcv:
+        # --- CORRECTED VOLUME CALCULATION ---
+        # We multiply the base volume (candle[5]) by the closing price (candle[4])
+        # for each candle to get the volume in the quote currency (USD).
+        total_quote_volume = sum(candle[5] * candle[4] for candle in ohlcv)
+
+        print(f"✅ Success! Found volume data on {exchange.name}.")
+        print(f"Fetched total volume for {trading_pair} in last {hours_to_check}h: ${total_quote_volume:,.2f}")
+        return total_quote_volume
 
     print(f"❌ Volume data for {trading_pair} not found on any of the configured exchanges.")
-    return 0
\ No newline at end of file
+    return 0
+
+def get_batched_price_reader(chain_name, trading_pairs, mode=MODE_MULTICALL):
+    """
+    Returns a reader for the slot0 prices of `trading_pairs` (pools of `chain_name` in
+    the pool registry) that reads them all in one RPC round trip.
+    """
+    registry = get_pool_registry()
+    pools = [registry.get(chain_name, pair) for pair in trading_pairs]
+    rpc = JsonRpcClient(get_rpc_url(config.CHAIN_CONFIG[chain_name]))
+    return BatchedPriceReader(rpc, pools, mode=mode)
\ No newline at end of file
@@ -1,17 +1,29 @@
 # liquidity_bot/core/strategy_engine.py
 from datetime import datetime  # <--- ADD THIS LINE
+import os
+import sys
 from . import services
 import numpy as np
 from . import services      # Use a dot (.) for a file in the same directory
 import config             # Import from the root directory directly
 from utils import helpers # This line was already correct
 
+# Make the shared modules in the repository root importable.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.range_model import RangeModel
+from common import lp_math
+from common.fee_tracker import PositionFeeTracker, range_ticks, raw_liquidity
+
 class StrategyEngine:
-    def __init__(self, trading_pair, investment_capital):
+    def __init__(self, trading_pair, investment_capital, chain_name=None, web3_clients=None):
         """
         Initializes the trading bot engine.
         :param trading_pair: The pair to trade, e.g., "WETH/USDC".
         :param investment_capital: The amount in USD to invest.
+        :param chain_name: The chain of the pool in config.KNOWN_POOLS; detected from the
+                           quote token when not given.
+        :param web3_clients: Optional dict of chain name -> Web3 shared by several engines.
+                             A missing chain is connected once and added to it.
         """
         print(f"Initializing Strategy Engine for {trading_pair} with ${investment_capital}...")
 
@@ -23,7 +35,7 @@ class StrategyEngine:
         self.log_row=None
         # --- Dynamic Chain and Pool Setup ---
         base_token = trading_pair.split('/')[1] # e.g., 'USDC' from 'WETH/USDC'
-        self.chain_name = config.TOKEN_TO_CHAIN_MAP.get(base_token)
+        self.chain_name = chain_name or config.TOKEN_TO_CHAIN_MAP.get(base_token)
 
         if not self.chain_name:
             raise ValueError(f"Could not determine chain for token {base_token}")
@@ -39,9 +51,23 @@ class StrategyEngine:
         self.pool_address = pool_info['pool_address']
         self.token0_config = pool_info['token0']
         self.token1_config = pool_info['token1']
+        # Checksummed address, slot0 calldata and decimal scaling, prepared once.
+        self.pool = services.get_pool_registry().get(self.chain_name, trading_pair)
         
         # --- Initialize Services ---
-        self.w3 = services.get_web3_instance(self.chain_config)
+        if web3_clients is None:
+            self.w3 = services.get_web3_instance(self.chain_config)
+        else:
+            if self.chain_name not in web3_clients:
+                web3_clients[self.chain_name] = services.get_web3_instance(self.chain_config)
+            self.w3 = web3_clients[self.chain_name]
+        # Optional callable returning the current price, e.g. from a batched per-chain
+        # read (see multi_pool_runner.py); None reads slot0 of this pool directly.
+        self.price_feed = None
+        # Price, monotonic time and block number of the last cycle started on a new block.
+        self.last_cycle_price = None
+        self.last_cycle_time = None
+        self.last_cycle_block = None
 # In core/strategy_engine.py
 
     def _calculate_dynamic_range(self):
@@ -57,7 +83,7 @@ class StrategyEngine:
         cex_pair_direct = f"{base_cex}/{quote_cex}"
 
         print(f"\n--- Tier 1 Search: Looking for direct pair '{cex_pair_direct}' on all exchanges ---")
-        direct_prices = services.get_historical_data(cex_pair_direct, config.LOOKBACK_HOURS)
+        direct_prices = services.get_recent_closes(cex_pair_direct, config.LOOKBACK_HOURS)
 
         if direct_prices:
             # Success with Tier 1
@@ -66,35 +92,65 @@ class StrategyEngine:
         else:
             # --- Tier 2: Fallback to Synthetic Pair History ---
             print(f"\n--- Tier 2 Search: Building synthetic history for '{cex_pair_direct}' via USDT ---")
-            base_usdt_pair = f"{base_cex}/USDT"
-            quote_usdt_pair = f"{quote_cex}/USDT"
-            
-            base_prices_usdt = services.get_historical_data(base_usdt_pair, config.LOOKBACK_HOURS)
-            quote_prices_usdt = services.get_historical_data(quote_usdt_pair, config.LOOKBACK_HOURS)
+            # The USDT legs are matched by candle time and shared with the other engines.
+            final_prices = services.get_synthetic_closes(base_cex, quote_cex, config.LOOKBACK_HOURS)
 
-            if not base_prices_usdt or not quote_prices_usdt:
-                print("❌ Synthetic history failed: Could not fetch one or both USDT pairs from any exchange.")
+            if len(final_prices) == 0:
+                print("❌ Synthetic history failed: Could not line up the two USDT pairs.")
                 return None, None
 
-            min_len = min(len(base_prices_usdt), len(quote_prices_usdt))
-            base_prices_usdt = np.array(base_prices_usdt[-min_len:])
-            quote_prices_usdt = np.array(quote_prices_usdt[-min_len:])
-
-            if np.any(quote_prices_usdt == 0):
-                print("Error: Quote price is zero, cannot create synthetic history.")
-                return None, None
-            
-            final_prices = base_prices_usdt / quote_prices_usdt
-
         # --- Final Calculation (applies to both tiers) ---
-        std_dev = np.std(final_prices)
-        mean_price = np.mean(final_prices)
-        lower_bound = mean_price - (std_dev * config.VOLATILITY_MULTIPLIER)
-        upper_bound = mean_price + (std_dev * config.VOLATILITY_MULTIPLIER)
+        # Population std (ddof=0), as np.std uses.
+        range_model = RangeModel.from_prices(final_prices, ddof=0)
+        lower_bound, upper_bound = range_model.bounds(config.VOLATILITY_MULTIPLIER)
 
         print(f"✅ Successfully calculated dynamic range: [{lower_bound:.8f} - {upper_bound:.8f}]")
         return lower_bound, upper_bound
 
+    def _open_fee_tracker(self, lower, upper, liquidity):
+        """
+        Starts reading the pool's fee growth for the new position, or returns None (the
+        position then earns no fees) when the pool cannot be read.
+        """
+        reader = services.get_fee_reader(self.w3, self.pool)
+        decimals0, decimals1 = self.token0_config['decimals'], self.token1_config['decimals']
+        # Our prices are token0 per token1; the pool's raw price is token1 wei per token0 wei.
+        scale = 10**(decimals1 - decimals0)
+        try:
+            tick_lower, tick_upper = range_ticks(scale / upper, scale / lower if lower > 0 else float('inf'),
+                                                 reader.tick_spacing)
+            return PositionFeeTracker.open(reader, tick_lower, tick_upper,
+                                           raw_liquidity(liquidity, decimals0, decimals1), self._fee_block())
+        except Exception as e:
+            print(f"⚠️ Could not read the fee growth of {self.trading_pair}: {e}. Fees will not be counted.")
+            return None
+
+    def _accrued_fees(self, price):
+        """
+        Fees the position earned since entry, from the pool's fee growth, valued in token0
+        like the position. A failed read keeps the amount of the last successful one.
+        """
+        tracker = self.current_position.get('fee_tracker')
+        if tracker is None:
+            return 0.0
+        try:
+            tracker.update(self._fee_block())
+        except Exception as e:
+            print(f"⚠️ Could not read the fee growth ({e}). Using the fees as of block {tracker.last.block}.")
+        fees0 = tracker.fees0 / 10**self.token0_config['decimals']
+        fees1 = tracker.fees1 / 10**self.token1_config['decimals']
+        return fees0 + fees1 * price
+
+    def _fee_block(self):
+        """The block of the current cycle when it runs on a new block, else 'latest'."""
+        return self.last_cycle_block if self.last_cycle_block is not None else 'latest'
+
+    def _get_current_price(self):
+        """The pool's current on-chain price, from the price feed if one is set."""
+        if self.price_feed is not None:
+            return self.price_feed()
+        return services.get_pool_price(self.w3, self.pool)
+
     def _check_for_entry(self):
         """Checks if the current price is within the calculated range to enter a position."""
         print("\nState: SEARCHING. Looking for an entry point...")
@@ -103,12 +159,7 @@ class StrategyEngine:
         if lower is None:
             return
         # NEW CORRECT LINE
-        current_price = services.get_onchain_price(
-            self.w3, 
-            self.pool_address, 
-            self.token0_config, 
-            self.token1_config
-        )
+        current_price = self._get_current_price()
         if current_price is None:
             return
 
@@ -125,8 +176,10 @@ class StrategyEngine:
                 'lower_bound': lower,
                 'upper_bound': upper,
                 'capital': self.investment_capital,
+                'liquidity': lp_math.liquidity_for_capital(self.investment_capital, current_price, lower, upper),
                 'entry_timestamp': datetime.now() # <-- ADD THIS LINE
             }
+            self.current_position['fee_tracker'] = self._open_fee_tracker(lower, upper, self.current_position['liquidity'])
             print(f"Calculated dynamic range: [{helpers.format_price(lower)} - {helpers.format_price(upper)}]")
             print(f"--- FAKING ENTRY: State changed to IN_POSITION ---")
             # Inside the _check_for_entry method in the `if` block
@@ -151,46 +204,34 @@ class StrategyEngine:
         """Checks if the current price has moved out of the position's range and calculates full PnL."""
         print(f"\nState: IN_POSITION. Monitoring position with range [{helpers.format_price(self.current_position['lower_bound'])} - {helpers.format_price(self.current_position['upper_bound'])}]")
 
-        current_price = services.get_onchain_price(
-            self.w3, 
-            self.pool_address, 
-            self.token0_config, 
-            self.token1_config
-        )
+        current_price = self._get_current_price()
         if current_price is None:
             return
             
         print(f"Current on-chain price for {self.trading_pair}: {helpers.format_price(current_price)}")
 
+        # Read on every check (one batched eth_call), so a failed read at exit still has
+        # the fees of the previous check.
+        fees_usd = self._accrued_fees(current_price)
+
         if not (self.current_position['lower_bound'] <= current_price <= self.current_position['upper_bound']):
             print(f"🛑 EXIT SIGNAL: Price has moved out of range.")
             print(f"--- FAKING EXIT: State changed to SEARCHING ---")
 
             # --- FULL PNL CALCULATION ---
-            # 1. Calculate time in position to fetch relevant volume
-            time_in_position_hours = (datetime.now() - self.current_position['entry_timestamp']).total_seconds() / 3600
-            
-            # 2. Get recent trading volume from CEX
-            ccxt_pair = self.trading_pair.replace('WETH', 'ETH')
-            recent_volume = services.get_recent_trading_volume(ccxt_pair, int(time_in_position_hours) + 1)
-            
-            # 3. Estimate fees earned
-            pool_config = config.KNOWN_POOLS[self.chain_name][self.trading_pair]
-            pool_fee_tier = pool_config['fee_tier_percent'] / 100
-            pool_tvl = pool_config['tvl_usd']
-            
-            total_fees_generated = recent_volume * pool_fee_tier
-            our_pool_share = self.investment_capital / pool_tvl
-            estimated_fees_usd = total_fees_generated * our_pool_share
+            # 1-3. Fees earned: the pool's fee growth inside our range since entry, times
+            # our liquidity (read above).
+            estimated_fees_usd = fees_usd
 
-            # 4. Calculate Impermanent Loss
+            # 4. Calculate Impermanent Loss of the concentrated position
             entry_price = self.current_position['entry_price']
-            price_ratio = current_price / entry_price
-            impermanent_loss_pct = (2 * (price_ratio**0.5) / (1 + price_ratio)) - 1
+            lower_bound = self.current_position['lower_bound']
+            upper_bound = self.current_position['upper_bound']
+            impermanent_loss_pct = lp_math.concentrated_il(entry_price, current_price, lower_bound, upper_bound)
             
             # 5. Calculate final position value (including IL and estimated fees)
-            hodl_value = self.investment_capital * price_ratio
-            final_position_value = (hodl_value * (1 + impermanent_loss_pct)) + estimated_fees_usd
+            position_value = lp_math.position_value(self.current_position['liquidity'], current_price, lower_bound, upper_bound)
+            final_position_value = position_value + estimated_fees_usd
             
             # 6. Calculate final PnL in USD
             pnl_usd = final_position_value - self.investment_capital
@@ -204,14 +245,35 @@ class StrategyEngine:
                 f"Exited Range: {helpers.format_price(self.current_position['lower_bound'])} - {helpers.format_price(self.current_position['upper_bound'])}",
                 self.investment_capital,
                 f"{impermanent_loss_pct:.4%}",
-                estimated_fees_usd,         # New Column H: Estimated Fees
+                estimated_fees_usd,         # New Column H: Fees (from the pool's fee growth)
                 final_position_value,       # New Column I: Final Value
                 pnl_usd                     # New Column J: PnL (USD)
             ]
             self.current_position = {}
             services.log_to_google_sheet(self.log_row)
         else:
-            print(f"✅ HOLD SIGNAL: Price remains in range. Position active.")
+            print(f"✅ HOLD SIGNAL: Price remains in range. Position active. Fees earned: {helpers.format_price(fees_usd)}")
+
+    def is_due_on_block(self, price, now, search_interval):
+        """
+        Whether a new block with `price` needs a strategy cycle. An open position is checked
+        on every block that moved the price. The entry search fetches CEX candles, so it
+        still runs at most once every `search_interval` seconds.
+        """
+        if price is None:
+            return False
+        if self.state == 'IN_POSITION':
+            return price != self.last_cycle_price
+        return self.last_cycle_time is None or now - self.last_cycle_time >= search_interval
+
+    def run_block_cycle(self, price, now, block=None):
+        """Runs a strategy cycle on `price`, read once for the new `block`."""
+        self.last_cycle_price, self.last_cycle_time, self.last_cycle_block = price, now, block
+        price_feed, self.price_feed = self.price_feed, lambda: price
+        try:
+            self.run_strategy_cycle()
+        finally:
+            self.price_feed = price_feed
 
     def run_strategy_cycle(self):
         """The main loop of the strategy logic."""
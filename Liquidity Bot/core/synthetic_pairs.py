@@ -0,0 +1,96 @@
+# liquidity_bot/core/synthetic_pairs.py
+"""
+Synthetic price history of a cross pair, built from its two USDT legs.
+
+When no exchange lists a pair like LINK/ETH directly, its hourly closes are derived as
+LINK/USDT divided by ETH/USDT. The legs used to be cut to the same length and divided
+element by element. When one exchange skipped or added an hour, every ratio after
+that point divided closes of different hours. `align_ratio` joins the legs on their
+candle timestamps instead. A leg missing at most `max_fill_candles` candles in a row
+is forward-filled, and hours beyond that are left out.
+
+The legs come from the shared `CandleBuffers`. A leg like ETH/USDT or BNB/USDT is
+therefore fetched once per refresh interval for the whole process, and every cross
+pair that needs it reads it from there. The number of CEX requests grows with the
+number of distinct legs, not with the number of pairs.
+"""
+
+import numpy as np
+
+from core.candle_buffer import HOUR_MS
+
+# Hours a leg may be carried forward over a gap in its candles.
+DEFAULT_MAX_FILL_CANDLES = 2
+
+
+def align_ratio(base_candles, quote_candles, max_fill_candles=DEFAULT_MAX_FILL_CANDLES, interval_ms=HOUR_MS):
+    """
+    Divides the base closes by the quote closes of the same candle time.
+
+    Both inputs are OHLCV lists as ccxt returns them (timestamp first, close at index 4),
+    sorted by time. Every interval between the first and the last candle of either leg
+    gets the newest close of each leg at or before it. The interval is left out when that
+    close is more than `max_fill_candles` intervals old (or missing) for either leg, or
+    when the quote close is not positive.
+
+    :return: (timestamps, ratios) as numpy arrays in epoch ms; both empty when the legs
+             do not overlap.
+    """
+    if not base_candles or not quote_candles:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    base = np.asarray(base_candles, dtype=np.float64)
+    quote = np.asarray(quote_candles, dtype=np.float64)
+    base_times, quote_times = base[:, 0].astype(np.int64), quote[:, 0].astype(np.int64)
+
+    first = min(base_times[0], quote_times[0])
+    last = max(base_times[-1], quote_times[-1])
+    grid = np.arange(first, last + 1, interval_ms, dtype=np.int64)
+    max_age = max_fill_candles * interval_ms
+
+    def leg_closes(times, closes):
+        # The newest candle at or before each grid time, and whether it is recent enough.
+        index = np.searchsorted(times, grid, side='right') - 1
+        present = index >= 0
+        index = np.maximum(index, 0)
+        valid = present & (grid - times[index] <= max_age)
+        return closes[index], valid
+
+    base_closes, base_valid = leg_closes(base_times, base[:, 4])
+    quote_closes, quote_valid = leg_closes(quote_times, quote[:, 4])
+    valid = base_valid & quote_valid & (quote_closes > 0)
+    return grid[valid], base_closes[valid] / quote_closes[valid]
+
+
+class SyntheticPairs:
+    """
+    Hourly closes of cross pairs built from `<asset>/USDT` legs.
+
+    :param buffers: The shared `CandleBuffers` the legs are read from.
+    :param leg_quote: The currency both legs are quoted in.
+    :param max_fill_candles: Hours a leg is forward-filled over a gap.
+    """
+
+    def __init__(self, buffers, leg_quote='USDT', max_fill_candles=DEFAULT_MAX_FILL_CANDLES):
+        self.buffers = buffers
+        self.leg_quote = leg_quote
+        self.max_fill_candles = max_fill_candles
+
+    def legs(self, base, quote):
+        return f"{base}/{self.leg_quote}", f"{quote}/{self.leg_quote}"
+
+    def closes(self, base, quote, lookback_hours):
+        """
+        The synthetic `base`/`quote` closes of the last `lookback_hours`, oldest first, as
+        a numpy array. Empty when a leg has no candles or the legs do not overlap.
+        """
+        base_pair, quote_pair = self.legs(base, quote)
+        base_candles = self.buffers.candles(base_pair, lookback_hours)
+        if not base_candles:
+            print(f"❌ Synthetic history failed: no candles for {base_pair} on any exchange.")
+            return np.empty(0)
+        quote_candles = self.buffers.candles(quote_pair, lookback_hours)
+        if not quote_candles:
+            print(f"❌ Synthetic history failed: no candles for {quote_pair} on any exchange.")
+            return np.empty(0)
+        _, ratios = align_ratio(base_candles, quote_candles, self.max_fill_candles)
+        return ratios
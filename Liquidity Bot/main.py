@@ -4,10 +4,19 @@ import os
 import time
 import getpass
 from dotenv import load_dotenv
+from core import services
 from core.strategy_engine import StrategyEngine
+# core.strategy_engine makes the shared modules in the repository root importable.
+from common.block_source import BlockWatcher, chain_head_source
 
 # Define the interval for the strategy cycle in seconds
 CYCLE_INTERVAL = 60
+# 'interval' runs a cycle every CYCLE_INTERVAL seconds. Set it to 'block' to evaluate an
+# open position on every new block (newHeads over ALCHEMY_WS_URL, which needs the
+# websockets package, or eth_blockNumber polling every BLOCK_POLL_INTERVAL seconds as
+# fallback); while searching, a cycle still runs every CYCLE_INTERVAL seconds.
+PRICE_UPDATES = 'interval'
+BLOCK_POLL_INTERVAL = 2
 
 def get_secure_keys():
     """
@@ -28,6 +37,29 @@ def get_secure_keys():
 
     return private_key, alchemy_api_key
 
+def run_on_blocks(engine):
+    """
+    Reads the pool price once per new block and runs a cycle when the engine needs one:
+    on every price move while in a position, every CYCLE_INTERVAL seconds while searching.
+    """
+    source = chain_head_source(services.get_ws_url(engine.chain_config), engine.w3.eth.get_block_number,
+                               BLOCK_POLL_INTERVAL)
+    watcher = BlockWatcher(source, name=engine.chain_name).start()
+    block = None
+    while True:
+        block = watcher.wait_for_block(block)
+        if block is None:
+            raise ConnectionError("The block source stopped.")
+        now = time.monotonic()
+        # While searching only the elapsed time makes a cycle due, so the price is not
+        # read on the blocks in between.
+        if (engine.state == 'SEARCHING' and engine.last_cycle_time is not None
+                and now - engine.last_cycle_time < CYCLE_INTERVAL):
+            continue
+        price = services.get_pool_price(engine.w3, engine.pool)
+        if engine.is_due_on_block(price, now, CYCLE_INTERVAL):
+            engine.run_block_cycle(price, now, block)
+
 def main():
     """The main function to run the liquidity bot."""
     print("--- Welcome to the Liquidity Bot ---")
@@ -57,13 +89,18 @@ def main():
             investment_capital=investment_capital
         )
         
-        print(f"\n✅ Bot initialized successfully! Starting main loop (runs every {CYCLE_INTERVAL} seconds)...")
-        print("Press Ctrl+C to stop the bot gracefully.")
+        if PRICE_UPDATES == 'block':
+            print("\n✅ Bot initialized successfully! Starting main loop (evaluates every new block)...")
+            print("Press Ctrl+C to stop the bot gracefully.")
+            run_on_blocks(engine)
+        else:
+            print(f"\n✅ Bot initialized successfully! Starting main loop (runs every {CYCLE_INTERVAL} seconds)...")
+            print("Press Ctrl+C to stop the bot gracefully.")
 
-        # Main loop
-        while True:
-            engine.run_strategy_cycle()
-            time.sleep(CYCLE_INTERVAL)
+            # Main loop
+            while True:
+                engine.run_strategy_cycle()
+                time.sleep(CYCLE_INTERVAL)
 
     except ValueError as e:
         print(f"\n❌ Error initializing bot: {e}")
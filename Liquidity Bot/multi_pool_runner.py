@@ -0,0 +1,298 @@
+# liquidity_bot/multi_pool_runner.py
+"""
+Runs many StrategyEngine instances in one process.
+
+main.py runs a single pair in a blocking loop, so covering every pool in
+config.KNOWN_POOLS meant one process per pair, each with its own Web3 and ccxt
+clients. This runner reads the pools from a JSON file (pools.json by default) and hosts
+them all in one asyncio event loop:
+
+- One Web3 client per chain is shared by all engines on that chain. The ccxt clients
+  in core/services.py are already shared by everything in the process.
+- Every pool has its own asyncio task. It runs the (blocking) strategy cycle in a
+  thread pool and then sleeps until its next cycle, so slow RPC or exchange calls for
+  one pair never delay the others.
+- Start times are staggered over the cycle interval, so 50+ pools do not all hit the
+  RPC and the exchanges in the same second.
+- With "batch_price_reads" set ("multicall" or "batch"), the pools of a chain instead
+  cycle together. Their slot0 prices are read once per cycle in one RPC round trip (see
+  core/multicall.py) and handed to the engines.
+- With "price_updates": "block", the pools of a chain are evaluated on new blocks
+  instead of a timer (see common/block_source.py). A block gets one batched price read
+  for the whole chain, skipped while every pool is searching between cycles. An open
+  position is checked on every block that moved its price; the entry search still runs
+  once per cycle interval.
+
+Usage: python multi_pool_runner.py [pools.json]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from core import services
+from core.strategy_engine import StrategyEngine
+from main import get_secure_keys
+# core.strategy_engine makes the shared modules in the repository root importable.
+from common.block_source import BlockWatcher, DEFAULT_POLL_INTERVAL, chain_head_source
+
+DEFAULT_POOLS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pools.json')
+DEFAULT_CYCLE_INTERVAL = 60
+DEFAULT_MAX_WORKERS = 64
+
+
+def chain_of_pool(trading_pair):
+    """The chain listing `trading_pair` in config.KNOWN_POOLS, or None."""
+    for chain_name, pools in config.KNOWN_POOLS.items():
+        if trading_pair in pools:
+            return chain_name
+    return None
+
+
+def load_pool_specs(path):
+    """
+    Reads the runner configuration. Returns (settings, pools), where every pool is a dict
+    with `trading_pair`, `investment_capital` and `chain`.
+
+    With "include_all_known_pools": true, every pool in config.KNOWN_POOLS that is not
+    listed explicitly is added with "default_investment_capital".
+    """
+    with open(path) as f:
+        settings = json.load(f)
+
+    pools = []
+    listed = set()
+    for entry in settings.get('pools', []):
+        trading_pair = entry['trading_pair']
+        chain_name = entry.get('chain') or chain_of_pool(trading_pair)
+        pools.append({
+            'trading_pair': trading_pair,
+            'investment_capital': float(entry.get('investment_capital', settings.get('default_investment_capital', 1000))),
+            'chain': chain_name,
+        })
+        listed.add((chain_name, trading_pair))
+    if settings.get('include_all_known_pools'):
+        for chain_name, known in config.KNOWN_POOLS.items():
+            for trading_pair in known:
+                if (chain_name, trading_pair) not in listed:
+                    pools.append({
+                        'trading_pair': trading_pair,
+                        'investment_capital': float(settings.get('default_investment_capital', 1000)),
+                        'chain': chain_name,
+                    })
+    return settings, pools
+
+
+def build_engines(pools, engine_factory=StrategyEngine):
+    """
+    Creates one engine per pool, sharing one Web3 client per chain. Pools that fail to
+    initialize are reported and skipped. Returns (engines, web3_clients).
+    """
+    web3_clients = {}
+    engines = []
+    for pool in pools:
+        try:
+            engines.append(engine_factory(pool['trading_pair'], pool['investment_capital'],
+                                          chain_name=pool['chain'], web3_clients=web3_clients))
+        except (ValueError, ConnectionError) as e:
+            print(f"❌ Skipping {pool['trading_pair']} ({pool['chain']}): {e}")
+    return engines, web3_clients
+
+
+async def run_pool(engine, executor, interval, start_delay, stop_event):
+    """Runs the strategy cycle of one engine every `interval` seconds until stopped."""
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout=start_delay)
+        return
+    except asyncio.TimeoutError:
+        pass
+
+    while not stop_event.is_set():
+        started = time.monotonic()
+        try:
+            await loop.run_in_executor(executor, engine.run_strategy_cycle)
+        except Exception as e:
+            print(f"❌ {engine.trading_pair}: cycle failed: {e}")
+        elapsed = time.monotonic() - started
+        if elapsed > interval:
+            print(f"⚠️ {engine.trading_pair}: cycle took {elapsed:.1f}s, longer than the {interval}s interval.")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, interval - elapsed))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_chain_batched(chain_name, engines, reader, executor, interval, stop_event):
+    """
+    Cycles all engines of one chain together: one batched price read, then every engine
+    not still busy with its previous cycle starts a new one with those prices.
+    """
+    loop = asyncio.get_running_loop()
+    prices = {}
+    busy = {}
+    for engine in engines:
+        engine.price_feed = lambda pair=engine.trading_pair: prices.get(pair)
+
+    while not stop_event.is_set():
+        started = time.monotonic()
+        try:
+            latest = await loop.run_in_executor(executor, reader.read)
+        except Exception as e:
+            print(f"❌ {chain_name}: batched price read failed: {e}")
+            latest = {}
+        prices.clear()
+        prices.update(latest)
+
+        for engine in engines:
+            if engine in busy:
+                print(f"⚠️ {engine.trading_pair}: previous cycle still running, skipping this one.")
+                continue
+            busy[engine] = loop.run_in_executor(executor, engine.run_strategy_cycle)
+            busy[engine].add_done_callback(lambda future, engine=engine: busy.pop(engine, None))
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, interval - (time.monotonic() - started)))
+        except asyncio.TimeoutError:
+            pass
+    await asyncio.gather(*busy.values(), return_exceptions=True)
+
+
+async def run_chain_on_blocks(chain_name, engines, reader, watcher, executor, interval, stop_event):
+    """
+    Evaluates the engines of one chain on new blocks. A new block gets one batched price
+    read at that block, shared by all engines, unless every engine is searching and none
+    has reached `interval` since its last cycle. Each engine that `is_due_on_block` and is
+    not still busy with its previous cycle then starts a new one with that price.
+    """
+    loop = asyncio.get_running_loop()
+    busy = {}
+    block = None
+    while not stop_event.is_set():
+        # A short timeout keeps the loop responsive to stop_event between blocks.
+        newer = await loop.run_in_executor(None, watcher.wait_for_block, block, 1.0)
+        if newer is None:
+            if watcher.stopped:
+                break
+            continue
+        block = newer
+        now = time.monotonic()
+        # While every engine is searching only the elapsed time makes a cycle due, so the
+        # prices are not read on the blocks in between.
+        if not any(engine.state == 'IN_POSITION' or engine.last_cycle_time is None
+                   or now - engine.last_cycle_time >= interval for engine in engines):
+            continue
+        try:
+            # Read at the block being handled, the block run_block_cycle pins the fees to.
+            prices = await loop.run_in_executor(executor, reader.read, hex(block))
+        except Exception as e:
+            print(f"❌ {chain_name}: batched price read for block {block} failed: {e}")
+            continue
+
+        for engine in engines:
+            price = prices.get(engine.trading_pair)
+            if engine in busy or not engine.is_due_on_block(price, now, interval):
+                continue
+            busy[engine] = loop.run_in_executor(executor, engine.run_block_cycle, price, now, block)
+            busy[engine].add_done_callback(lambda future, engine=engine: busy.pop(engine, None))
+    await asyncio.gather(*busy.values(), return_exceptions=True)
+
+
+async def run_engines(engines, interval=DEFAULT_CYCLE_INTERVAL, max_workers=DEFAULT_MAX_WORKERS, stop_event=None,
+                      price_readers=None, block_watchers=None):
+    """
+    Runs all engines concurrently until `stop_event` is set (or the task is cancelled).
+
+    :param max_workers: Threads available for blocking cycles; at most this many cycles
+                        run at the same moment.
+    :param price_readers: Optional dict of chain name -> `BatchedPriceReader`. The
+                          engines of those chains cycle together on batched prices.
+    :param block_watchers: Optional dict of chain name -> `BlockWatcher`. The engines of
+                           those chains (which also need a price reader) are evaluated
+                           on new blocks instead of every `interval` seconds.
+    """
+    stop_event = stop_event or asyncio.Event()
+    price_readers = price_readers or {}
+    block_watchers = {chain_name: watcher for chain_name, watcher in (block_watchers or {}).items()
+                      if chain_name in price_readers}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(engines) + len(price_readers))),
+                                  thread_name_prefix='pool-cycle')
+    try:
+        batched = [engine for engine in engines if engine.chain_name in price_readers]
+        staggered = [engine for engine in engines if engine.chain_name not in price_readers]
+        tasks = [
+            asyncio.create_task(run_pool(engine, executor, interval, k * interval / len(staggered), stop_event))
+            for k, engine in enumerate(staggered)
+        ]
+        for chain_name, reader in price_readers.items():
+            chain_engines = [engine for engine in batched if engine.chain_name == chain_name]
+            if not chain_engines:
+                continue
+            if chain_name in block_watchers:
+                watcher = block_watchers[chain_name].start()
+                tasks.append(asyncio.create_task(
+                    run_chain_on_blocks(chain_name, chain_engines, reader, watcher, executor, interval, stop_event)))
+            else:
+                tasks.append(asyncio.create_task(
+                    run_chain_batched(chain_name, chain_engines, reader, executor, interval, stop_event)))
+        await asyncio.gather(*tasks)
+    finally:
+        for watcher in block_watchers.values():
+            watcher.stop()
+        # Cycles already running finish in their threads; no new ones are started.
+        executor.shutdown(wait=False)
+
+
+def main(pools_file=DEFAULT_POOLS_FILE):
+    print("--- Liquidity Bot: multi-pool runner ---")
+    settings, pools = load_pool_specs(pools_file)
+    if not pools:
+        print(f"No pools configured in {pools_file}. Exiting.")
+        return
+
+    # Note: For this simulation, the keys are loaded but not used for transactions yet.
+    pk, api_key = get_secure_keys()
+    if not pk or not api_key:
+        print("Private key and Alchemy API key are required. Exiting.")
+        return
+    # services.get_web3_instance reads the key from the environment.
+    os.environ.setdefault("ALCHEMY_API_KEY", api_key)
+
+    engines, web3_clients = build_engines(pools)
+    if not engines:
+        print("No pool could be initialized. Exiting.")
+        return
+
+    block_driven = settings.get('price_updates') == 'block'
+    price_readers, block_watchers = {}, {}
+    if settings.get('batch_price_reads') or block_driven:
+        # Block-driven updates read every block's prices in one batched read per chain.
+        mode = settings.get('batch_price_reads') or 'multicall'
+        for chain_name in web3_clients:
+            pairs = [engine.trading_pair for engine in engines if engine.chain_name == chain_name]
+            price_readers[chain_name] = services.get_batched_price_reader(chain_name, pairs, mode)
+    if block_driven:
+        for chain_name, reader in price_readers.items():
+            source = chain_head_source(services.get_ws_url(config.CHAIN_CONFIG[chain_name]),
+                                       lambda rpc=reader.rpc: int(rpc.call('eth_blockNumber', []), 16),
+                                       settings.get('block_poll_interval_seconds', DEFAULT_POLL_INTERVAL))
+            block_watchers[chain_name] = BlockWatcher(source, name=chain_name)
+
+    interval = settings.get('cycle_interval_seconds', DEFAULT_CYCLE_INTERVAL)
+    if block_driven:
+        print(f"\n✅ Running {len(engines)} pools on {len(web3_clients)} chain(s), evaluated on every new block.")
+    else:
+        print(f"\n✅ Running {len(engines)} pools on {len(web3_clients)} chain(s), one cycle per pool every {interval} seconds.")
+    print("Press Ctrl+C to stop the bot gracefully.")
+    try:
+        asyncio.run(run_engines(engines, interval, settings.get('max_workers', DEFAULT_MAX_WORKERS),
+                                price_readers=price_readers, block_watchers=block_watchers))
+    except KeyboardInterrupt:
+        print("\n\nBot stopped by user. Shutting down gracefully...")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_POOLS_FILE)
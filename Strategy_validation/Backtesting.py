@@ -1,9 +1,14 @@
+import os
+import sys
 import pandas as pd
 import ccxt
 from datetime import datetime, timedelta
-import time
 import numpy as np
-from tqdm import tqdm
+
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.candle_store import CandleStore
+from common.ohlcv_downloader import download_ohlcv
 
 # ========================================================================
 # CONFIGURATION
@@ -20,6 +25,11 @@ SYMBOL = 'ETH/USDT'
 # 2.0 = Wider range (less fees, lower risk)
 VOLATILITY_MULTIPLIER = 1.5
 
+# --- Walk-Forward Check ---
+# Each month is also scored with the range and multiplier fitted on the month before it,
+# which shows how the strategy does out of sample. Set to None to skip.
+WALK_FORWARD_MULTIPLIERS = [1.0, 1.5, 2.0]
+
 # ========================================================================
 
 # Initialize exchange with rate limiting
@@ -31,106 +41,184 @@ exchange = ccxt.binance({
     }
 })
 
+# Local OHLCV cache shared by every backtest and paper trading script
+candle_store = CandleStore()
+
 def fetch_historical_data(symbol, timeframe, months):
-    """Fetch OHLCV data in chunks with a progress bar."""
-    print(f"Fetching {months} months of historical data for {symbol}...")
+    """
+    Loads OHLCV data from the local candle store, downloading only the candles
+    that are newer than (or missing from) what is already stored. Downloads run as
+    concurrent windows under the exchange's rate limit (see common/ohlcv_downloader.py).
+    """
+    print(f"Loading {months} months of historical data for {symbol}...")
     end_date = datetime.now()
     # Fetch a bit more data to ensure we have full months
     start_date = end_date - timedelta(days=30 * months + 5)
-    
-    all_ohlcv = []
-    current_since = int(start_date.timestamp() * 1000)
-    end_timestamp = int(end_date.timestamp() * 1000)
-    
-    with tqdm(total=end_timestamp - current_since, unit='ms', desc='Fetching data') as pbar:
-        while current_since < end_timestamp:
-            try:
-                ohlcv = exchange.fetch_ohlcv(
-                    symbol=symbol,
-                    timeframe=timeframe,
-                    since=current_since,
-                    limit=1000
-                )
-                if not ohlcv:
-                    break
-                
-                all_ohlcv.extend(ohlcv)
-                last_ts = ohlcv[-1][0]
-                pbar.update(last_ts - current_since + 1)
-                current_since = last_ts + 1
-                
-                time.sleep(exchange.rateLimit / 2000)
-            except Exception as e:
-                print(f"\nError fetching data: {e}")
-                break
-    return all_ohlcv
-
-def calculate_profit_with_dynamic_range(df):
+    since = int(start_date.timestamp() * 1000)
+    return candle_store.sync(exchange, symbol, timeframe, since, fetch=download_ohlcv)
+
+def _prepare_months(df):
+    """
+    Groups the hourly candles by month (and symbol) and computes everything that does not
+    depend on the range: the per-month mean / std of the closes and the per-hour fee pool.
+    """
+    if isinstance(df, dict):
+        df = pd.concat([frame.assign(symbol=symbol) for symbol, frame in df.items()], ignore_index=True)
+    with_symbol = 'symbol' in df.columns
+
+    df['month'] = df['time'].dt.to_period('M')
+    grouped = df.groupby(['symbol', 'month'] if with_symbol else 'month', sort=True)
+    group = grouped.ngroup().to_numpy()
+    group_keys = grouped.size()
+    total_hours = group_keys.to_numpy()
+    n_groups = len(total_hours)
+
+    close = df['close'].to_numpy(dtype=float)
+    volume = df['volume'].to_numpy(dtype=float)
+
+    # --- 1. Calculate Optimal Range inputs for every month at once ---
+    average_price = np.bincount(group, weights=close, minlength=n_groups) / total_hours
+    squared = (average_price[group] - close) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_std_dev = np.sqrt(np.bincount(group, weights=squared, minlength=n_groups) / (total_hours - 1))
+    # Handle cases with no volatility (e.g., very short data period): assume 5% volatility
+    no_volatility = ~np.isfinite(price_std_dev) | (price_std_dev == 0)
+    price_std_dev = np.where(no_volatility, average_price * 0.05, price_std_dev)
+
+    # --- 2. Per-hour market conditions (independent of the range) ---
+    exec_price = (df['high'].to_numpy(dtype=float) + df['low'].to_numpy(dtype=float) + 2 * close) / 4
+    volume_mult = 0.2 + 0.1 * np.sin(df['time'].dt.day.to_numpy() * 0.5)
+    fee_pool = (volume * exec_price * volume_mult) * FEE_TIER
+
+    return {
+        'with_symbol': with_symbol,
+        'group': group,
+        'group_keys': group_keys,
+        'total_hours': total_hours,
+        'n_groups': n_groups,
+        'average_price': average_price,
+        'price_std_dev': price_std_dev,
+        'exec_price': exec_price,
+        'fee_pool': fee_pool,
+    }
+
+
+def _profit_in_range(months, price_min, price_max):
+    """Monthly profit and active hours when every month uses the given (per-month) range."""
+    group, n_groups, exec_price = months['group'], months['n_groups'], months['exec_price']
+    row_min, row_max = price_min[group], price_max[group]
+
+    # --- 3. Calculate Profit using the determined range ---
+    in_range = (row_min <= exec_price) & (exec_price <= row_max)
+    # Simplified simulation of market conditions
+    with np.errstate(divide='ignore', invalid='ignore'):
+        liquidity = 25_000_000 * (0.8 + 0.4 * (exec_price - row_min) / (row_max - row_min))
+    profit = np.where(in_range, (YOUR_LIQUIDITY / liquidity) * months['fee_pool'], 0.0)
+    monthly_profit = np.bincount(group, weights=profit, minlength=n_groups)
+    active_hours = np.bincount(group, weights=in_range, minlength=n_groups).astype(int)
+    return monthly_profit, active_hours
+
+
+def _month_row(months, g, extra, monthly_profit, active_hours, price_min, price_max):
+    symbol, month = months['group_keys'].index[g] if months['with_symbol'] else (None, months['group_keys'].index[g])
+    total_hours = months['total_hours']
+    row = {}
+    if months['with_symbol']:
+        row['Symbol'] = symbol
+    row.update(extra)
+    row.update({
+        'Month': month.strftime('%Y-%m'),
+        'Total Profit ($)': round(monthly_profit[g], 2),
+        'Active Hours': active_hours[g],
+        'Total Hours': total_hours[g],
+        'In Range (%)': round((active_hours[g] / total_hours[g]) * 100, 1) if total_hours[g] > 0 else 0,
+        'Optimal Range': f"${price_min[g]:,.0f} - ${price_max[g]:,.0f}"
+    })
+    return row
+
+
+def calculate_profit_with_dynamic_range(df, multipliers=None):
     """
     Calculates monthly profit by first determining an optimal range for each month.
+
+    Every step is a whole-column operation: the per-month mean/std, the in-range mask and
+    the per-hour fee contributions are computed for all rows at once and summed per month.
+
+    :param df: Hourly candles with `time`, `high`, `low`, `close` and `volume` columns.
+               Several symbols can be analysed together by adding a `symbol` column or by
+               passing a dict of symbol -> DataFrame.
+    :param multipliers: Optional list of volatility multipliers to evaluate in one call
+                        (defaults to VOLATILITY_MULTIPLIER).
+    :return: One row per month (and symbol / multiplier when more than one is analysed).
     """
+    months = _prepare_months(df)
+    if months['n_groups'] == 0:
+        return pd.DataFrame()
+    with_multiplier = multipliers is not None
+    multipliers = multipliers if with_multiplier else [VOLATILITY_MULTIPLIER]
+
     results = []
-    df['month'] = df['time'].dt.to_period('M')
-    
-    for month, month_df in df.groupby('month'):
-        if month_df.empty:
-            continue
-
-        # --- 1. Calculate Optimal Range for THIS month ---
-        average_price = month_df['close'].mean()
-        price_std_dev = month_df['close'].std()
-        
-        # Handle cases with no volatility (e.g., very short data period)
-        if pd.isna(price_std_dev) or price_std_dev == 0:
-            price_std_dev = average_price * 0.05 # Assume 5% volatility
-
-        price_min = average_price - (price_std_dev * VOLATILITY_MULTIPLIER)
-        price_max = average_price + (price_std_dev * VOLATILITY_MULTIPLIER)
-        
-        monthly_profit = 0
-        active_hours = 0
-        
-        # --- 2. Calculate Profit using the determined range ---
-        for _, row in month_df.iterrows():
-            exec_price = (row['high'] + row['low'] + 2 * row['close']) / 4
-            
-            if price_min <= exec_price <= price_max:
-                # Simplified simulation of market conditions
-                liquidity = 25_000_000 * (0.8 + 0.4 * (exec_price - price_min) / (price_max - price_min))
-                volume_mult = 0.2 + 0.1 * np.sin(row['time'].day * 0.5)
-                
-                volume_usd = row['volume'] * exec_price * volume_mult
-                your_share = YOUR_LIQUIDITY / liquidity
-                monthly_profit += your_share * (volume_usd * FEE_TIER)
-                active_hours += 1
-        
-        results.append({
-            'Month': month.strftime('%Y-%m'),
-            'Total Profit ($)': round(monthly_profit, 2),
-            'Active Hours': active_hours,
-            'Total Hours': len(month_df),
-            'In Range (%)': round((active_hours / len(month_df)) * 100, 1) if len(month_df) > 0 else 0,
-            'Optimal Range': f"${price_min:,.0f} - ${price_max:,.0f}"
-        })
-    
+    for multiplier in multipliers:
+        price_min = months['average_price'] - (months['price_std_dev'] * multiplier)
+        price_max = months['average_price'] + (months['price_std_dev'] * multiplier)
+        monthly_profit, active_hours = _profit_in_range(months, price_min, price_max)
+        extra = {'Multiplier': multiplier} if with_multiplier else {}
+        for g in range(months['n_groups']):
+            results.append(_month_row(months, g, extra, monthly_profit, active_hours, price_min, price_max))
+
+    return pd.DataFrame(results)
+
+def calculate_walk_forward_profit(df, multipliers):
+    """
+    Out-of-sample version of `calculate_profit_with_dynamic_range`: every month is scored
+    with the range (mean +/- std * multiplier) fitted on the previous month, using the
+    multiplier that earned the most on that previous month. The first month of every
+    symbol has nothing to be fitted on and is skipped.
+    """
+    months = _prepare_months(df)
+    n_groups = months['n_groups']
+    if n_groups < 2:
+        return pd.DataFrame()
+    average_price, price_std_dev = months['average_price'], months['price_std_dev']
+
+    # In-sample profit of every multiplier on every month picks the multiplier to carry forward.
+    in_sample = np.array([
+        _profit_in_range(months, average_price - (price_std_dev * k), average_price + (price_std_dev * k))[0]
+        for k in multipliers
+    ])
+    best_multiplier = np.asarray(multipliers, dtype=float)[in_sample.argmax(axis=0)]
+
+    previous = np.arange(n_groups) - 1
+    keys = months['group_keys'].index
+    has_previous = previous >= 0
+    if months['with_symbol']:
+        symbols = keys.get_level_values(0)
+        has_previous[1:] &= symbols[1:] == symbols[:-1]
+    previous = np.maximum(previous, 0)
+
+    multiplier = best_multiplier[previous]
+    price_min = average_price[previous] - (price_std_dev[previous] * multiplier)
+    price_max = average_price[previous] + (price_std_dev[previous] * multiplier)
+    monthly_profit, active_hours = _profit_in_range(months, price_min, price_max)
+
+    results = []
+    for g in np.flatnonzero(has_previous):
+        fitted_on = keys[previous[g]][-1] if months['with_symbol'] else keys[previous[g]]
+        extra = {'Multiplier': multiplier[g], 'Fitted On': fitted_on.strftime('%Y-%m')}
+        results.append(_month_row(months, g, extra, monthly_profit, active_hours, price_min, price_max))
     return pd.DataFrame(results)
 
 # ========================================================================
 # Main Execution
 # ========================================================================
 if __name__ == "__main__":
-    ohlcv_data = fetch_historical_data(SYMBOL, '1h', MONTHS_TO_ANALYZE)
+    df = fetch_historical_data(SYMBOL, '1h', MONTHS_TO_ANALYZE)
     
-    if not ohlcv_data:
+    if df.empty:
         print("Failed to fetch data. Please check your internet connection or API status.")
         exit()
     
-    df = pd.DataFrame(ohlcv_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-    df['time'] = pd.to_datetime(df['timestamp'], unit='ms')
-    df['close'] = pd.to_numeric(df['close'])
-    df['high'] = pd.to_numeric(df['high'])
-    df['low'] = pd.to_numeric(df['low'])
-    df['volume'] = pd.to_numeric(df['volume'])
+    df['time'] = df['timestamp']
     
     print(f"\nData Range: {df['time'].min().date()} to {df['time'].max().date()}")
     print(f"Total Data Points: {len(df):,}")
@@ -153,3 +241,10 @@ if __name__ == "__main__":
         print(f"- Most Profitable Month: ${results_df['Total Profit ($)'].max():,.2f}")
         print(f"- Average Monthly Profit: ${results_df['Total Profit ($)'].mean():,.2f}")
     print(f"----------------------")
+
+    if WALK_FORWARD_MULTIPLIERS:
+        walk_forward_df = calculate_walk_forward_profit(df, WALK_FORWARD_MULTIPLIERS)
+        print("\n--- Out-of-Sample (Walk-Forward) Analysis ---")
+        print(walk_forward_df.to_string(index=False))
+        if not walk_forward_df.empty:
+            print(f"- Out-of-Sample Profit ({len(walk_forward_df)} months): ${walk_forward_df['Total Profit ($)'].sum():,.2f}")
@@ -2,11 +2,17 @@ import ccxt
 import gspread
 import numpy as np
 import os
-import pandas as pd
 from datetime import datetime, timedelta
 from google.oauth2.service_account import Credentials
 from time import sleep
 import random
+import sys
+
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.candle_store import CandleStore
+from common.range_model import RangeModel
+from common.result_sinks import ResultSinks, SheetSink, file_sink
 
 # ========================================================================
 # CONFIGURATION (Edit these values)
@@ -18,6 +24,16 @@ GOOGLE_SHEETS_CREDENTIALS = "credentials.json"
 SPREADSHEET_KEY = "1cUD41LW8KyWMnp9xflX6ZR6XI2382i107p-eVw0qdPo" 
 WORKSHEET_NAME = "Sheet1"
 
+# --- Results ---
+# Every cycle is recorded as numbers to the Google Sheet (at once) and to each file
+# below (.sqlite / .db, .csv, or .parquet / .arrow with pyarrow), written every
+# RESULTS_FLUSH_SECONDS. drawdown.py reads all of these files.
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'results')
+RESULTS_FILES = [os.path.join(RESULTS_DIR, 'uniswap_eth_usdt_paper.sqlite')]
+RESULTS_FLUSH_SECONDS = 300
+# Rows waiting here while Google Sheets is unreachable are sent by the next run.
+SHEET_SPOOL_FILE = os.path.join(RESULTS_DIR, 'uniswap_eth_usdt_paper_sheet_spool.jsonl')
+
 # --- Strategy Parameters ---
 SYMBOL = "ETH/USDT"
 INITIAL_BALANCE_USD = 10000
@@ -34,7 +50,8 @@ RANGE_LOOKBACK_DAYS = 14
 class ConcentratedLiquidityBot:
     def __init__(self):
         self.exchange = self._init_exchange()
-        self.worksheet = self._init_google_sheets()
+        self.results = self._init_results()
+        self.candle_store = CandleStore()
 
         # Dynamic range will be set here
         self.price_range_min = 0
@@ -65,8 +82,8 @@ class ConcentratedLiquidityBot:
             print(f"❌ Exchange connection failed: {e}")
             exit()
 
-    def _init_google_sheets(self):
-        """Initializes the connection to Google Sheets using a key."""
+    def _open_worksheet(self):
+        """Opens the Google Sheet using a key (called by the sheet writer thread)."""
         print("📝 Connecting to Google Sheets...")
         try:
             scopes = ["https://www.googleapis.com/auth/spreadsheets"]
@@ -78,7 +95,13 @@ class ConcentratedLiquidityBot:
             return worksheet
         except Exception as e:
             print(f"❌ Google Sheets connection failed: {e}")
-            return None
+            raise
+
+    def _init_results(self):
+        """The Google Sheet and the RESULTS_FILES, written in the background."""
+        sinks = [SheetSink(self._open_worksheet, SHEET_SPOOL_FILE, name=WORKSHEET_NAME)]
+        sinks += [file_sink(path, flush_seconds=RESULTS_FLUSH_SECONDS) for path in RESULTS_FILES]
+        return ResultSinks(sinks)
 
     def _calculate_optimal_range(self):
         """
@@ -87,20 +110,16 @@ class ConcentratedLiquidityBot:
         print(f"\n📈 Calculating optimal range based on last {RANGE_LOOKBACK_DAYS} days of data...")
         try:
             since = self.exchange.parse8601((datetime.utcnow() - timedelta(days=RANGE_LOOKBACK_DAYS)).isoformat())
-            ohlcv = self.exchange.fetch_ohlcv(SYMBOL, '1h', since=since)
+            df = self.candle_store.sync(self.exchange, SYMBOL, '1h', since)
             
-            if not ohlcv:
+            if df.empty:
                 print("⚠️ Could not fetch historical data for range calculation. Exiting.")
                 exit()
-
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['close'] = pd.to_numeric(df['close'])
             
-            average_price = df['close'].mean()
-            price_std_dev = df['close'].std()
-
-            self.price_range_min = average_price - (price_std_dev * VOLATILITY_MULTIPLIER)
-            self.price_range_max = average_price + (price_std_dev * VOLATILITY_MULTIPLIER)
+            range_model = RangeModel.from_prices(df['close'])
+            average_price = range_model.mean
+            price_std_dev = range_model.std
+            self.price_range_min, self.price_range_max = range_model.bounds(VOLATILITY_MULTIPLIER)
 
             print(f"✅ Optimal range calculated:")
             print(f"   - Average Price: ${average_price:,.2f}")
@@ -174,21 +193,13 @@ class ConcentratedLiquidityBot:
         fees = your_share_of_pool * volume_usd_1m * FEE_TIER
         return fees
 
-    def _update_google_sheet(self, data, status, il_percent, fees, pnl, alert):
-        if not self.worksheet:
-            print("-> Sheet not available. Skipping update.")
-            return
-        try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            position_value = self.asset_amount * data['price'] if self.is_in_position else 0
-            row = [
-                timestamp, status, f"${data['price']:,.2f}", f"${position_value:,.2f}",
-                f"{il_percent:.2f}%", f"${fees:,.6f}", f"${pnl:,.2f}", alert
-            ]
-            self.worksheet.append_row(row, value_input_option='USER_ENTERED')
-            print(f"  -> Sheet Updated: {status} | PnL: ${pnl:,.2f} | Alert: {alert if alert else 'None'}")
-        except Exception as e:
-            print(f"⚠️ Could not update Google Sheet: {e}")
+    def _record_result(self, data, status, il_percent, fees, pnl, alert):
+        """Queues one typed row for the Google Sheet and the results files."""
+        position_value = self.asset_amount * data['price'] if self.is_in_position else 0
+        equity = self.balance_usd + position_value + self.total_fees_earned
+        self.results.record(datetime.now(), status, data['price'], position_value, il_percent, fees, pnl,
+                            equity=equity, alert=alert)
+        print(f"  -> Recorded: {status} | PnL: ${pnl:,.2f} | Alert: {alert if alert else 'None'}")
 
     def run(self):
         self._calculate_optimal_range()
@@ -225,7 +236,7 @@ class ConcentratedLiquidityBot:
                     self.is_in_position = False
                     print(f"🔴 Exited position at ${current_price:,.2f}")
 
-                self._update_google_sheet(data, status, il_percent, fees_this_interval, pnl, alert)
+                self._record_result(data, status, il_percent, fees_this_interval, pnl, alert)
 
             else:
                 if self.price_range_min <= current_price <= self.price_range_max:
@@ -239,10 +250,10 @@ class ConcentratedLiquidityBot:
                     status = "POSITION OPENED"
                     alert = f"Entered position at ${current_price:,.2f}"
                     print(f"🟢 {alert}")
-                    self._update_google_sheet(data, status, 0, 0, 0, alert)
+                    self._record_result(data, status, 0, 0, 0, alert)
                 else:
                     pnl = self.balance_usd - INITIAL_BALANCE_USD
-                    self._update_google_sheet(data, status, 0, 0, pnl, alert)
+                    self._record_result(data, status, 0, 0, pnl, alert)
             
             sleep(LOOP_INTERVAL_SECONDS)
 
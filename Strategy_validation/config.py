@@ -15,6 +15,10 @@ ALCHEMY_RPC_URL = "https://eth-mainnet.g.alchemy.com/v2/RmoFnGYZ3M0DDzRVlyYGe"
 # This ID corresponds to the ETH / USDT 0.30% fee tier pool.
 UNISWAP_POOL_ID = "0x11b815efb8f581194ae79006d24e0d814b7697f6"
 FEE_TIER=0.0005
+# Pool layout needed to decode raw on-chain values (token0 = WETH, token1 = USDT).
+POOL_TOKEN0_DECIMALS = 18
+POOL_TOKEN1_DECIMALS = 6
+POOL_TICK_SPACING = 10
 
 # ===================================================================
 # SIMULATION PARAMETERS
@@ -26,6 +30,14 @@ SIMULATED_GAS_FEE_USD = 0.1
 # The interval in seconds for the main simulation loop.
 LOOP_INTERVAL_SECONDS = 30
 
+# 'interval' runs a simulation tick every LOOP_INTERVAL_SECONDS. Set it to 'block' to
+# run a tick on every new block instead. New blocks come from a newHeads subscription
+# on ALCHEMY_WS_URL (needs the websockets package), or from polling eth_blockNumber
+# every BLOCK_POLL_INTERVAL_SECONDS while the websocket is unavailable.
+PRICE_UPDATES = 'interval'
+ALCHEMY_WS_URL = ALCHEMY_RPC_URL.replace('https://', 'wss://', 1)
+BLOCK_POLL_INTERVAL_SECONDS = 2
+
 
 # ===================================================================
 # STRATEGY PARAMETERS
@@ -38,4 +50,17 @@ IL_EXIT_THRESHOLD_PERCENT = -2.0
 # ===================================================================
 # FILE PATHS
 # ===================================================================
-LOG_FILE = 'defi_simulation.log'
\ No newline at end of file
+LOG_FILE = 'defi_simulation.log'
+
+# Per-tick results of simulation_engine.py (.csv, .parquet or .arrow), flushed every
+# RESULTS_FLUSH_EVERY ticks. CONSOLE_VIEW: 'all' prints every tick, 'events' only
+# entries / exits / alerts, 'none' nothing.
+RESULTS_FILE = 'simulation_results.csv'
+RESULTS_FLUSH_EVERY = 10
+CONSOLE_VIEW = 'all'
+
+# Swap events of UNISWAP_POOL_ID written by ingest_swaps.py and replayed by
+# swap_replay.py (.ndjson, or .parquet when pyarrow is installed).
+SWAP_EVENTS_FILE = '../data/swaps/eth_usdt_swaps.ndjson'
+# First block ingest_swaps.py downloads when the events file does not exist yet.
+SWAP_INGEST_START_BLOCK = 20_000_000
\ No newline at end of file
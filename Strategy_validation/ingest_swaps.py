@@ -0,0 +1,197 @@
+# ingest_swaps.py
+"""
+Downloads the Swap events of UNISWAP_POOL_ID into a local NDJSON file for swap_replay.py.
+
+This is the only step that talks to the chain. Events are fetched with eth_getLogs in
+block windows; the window is halved whenever the node rejects a request as too large.
+Each event is decoded and appended as one JSON line, so a run that is interrupted (or
+started again later) continues after the last stored event instead of starting over.
+
+Block timestamps are fetched for the first and last block of every window and
+interpolated in between. With 12s slots this is accurate to a few seconds and saves
+one RPC call per block.
+"""
+
+import json
+import os
+import sys
+
+from web3 import Web3
+
+import config
+
+from swap_replay import SWAP_COLUMNS, iter_swap_chunks
+
+SWAP_EVENT_SIGNATURE = "Swap(address,address,int256,int256,uint160,uint128,int24)"
+SWAP_TOPIC = Web3.keccak(text=SWAP_EVENT_SIGNATURE).hex()
+if not SWAP_TOPIC.startswith('0x'):
+    SWAP_TOPIC = '0x' + SWAP_TOPIC
+
+DEFAULT_BLOCK_WINDOW = 2_000
+MIN_BLOCK_WINDOW = 10
+
+
+def _word(data, index, signed=False):
+    return int.from_bytes(data[32 * index:32 * (index + 1)], 'big', signed=signed)
+
+
+def decode_swap_log(log, timestamp, token0_decimals=config.POOL_TOKEN0_DECIMALS,
+                    token1_decimals=config.POOL_TOKEN1_DECIMALS):
+    """
+    Turns a raw Swap log into an events-file record. Amounts are signed and in token
+    units (positive = paid into the pool); sqrtPriceX96 and liquidity stay exact strings.
+    """
+    data = log['data']
+    data = bytes.fromhex(data[2:]) if isinstance(data, str) else bytes(data)
+    return {
+        'block_number': int(log['blockNumber']),
+        'log_index': int(log['logIndex']),
+        'timestamp': int(timestamp),
+        'amount0': _word(data, 0, signed=True) / 10 ** token0_decimals,
+        'amount1': _word(data, 1, signed=True) / 10 ** token1_decimals,
+        'sqrt_price_x96': str(_word(data, 2)),
+        'liquidity': str(_word(data, 3)),
+        'tick': _word(data, 4, signed=True),
+    }
+
+
+def _block_timestamp(w3, block_number):
+    return int(w3.eth.get_block(block_number)['timestamp'])
+
+
+def fetch_swap_logs(w3, pool_address, from_block, to_block):
+    """Returns the Swap logs of the pool between two blocks (inclusive)."""
+    return w3.eth.get_logs({
+        'address': Web3.to_checksum_address(pool_address),
+        'topics': [SWAP_TOPIC],
+        'fromBlock': from_block,
+        'toBlock': to_block,
+    })
+
+
+def _drop_partial_line(output_path):
+    """Truncates a last line left unfinished by an interrupted run."""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, 'rb+') as handle:
+        handle.seek(0, os.SEEK_END)
+        end = handle.tell()
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            handle.seek(position - step)
+            buffer = handle.read(step)
+            newline = buffer.rfind(b'\n')
+            if position == end and newline == step - 1:
+                return  # The file ends with a complete line.
+            if newline != -1:
+                handle.truncate(position - step + newline + 1)
+                return
+            position -= step
+        handle.truncate(0)
+
+
+def _last_stored_event(output_path):
+    """(block_number, log_index) of the last line of the events file, or None."""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return None
+    with open(output_path, 'rb') as handle:
+        handle.seek(0, os.SEEK_END)
+        position = handle.tell()
+        buffer = b''
+        # Read backwards until the buffer holds the whole last line.
+        while position > 0 and buffer.count(b'\n') < 2:
+            step = min(4096, position)
+            position -= step
+            handle.seek(position)
+            buffer = handle.read(step) + buffer
+    record = json.loads(buffer.splitlines()[-1])
+    return record['block_number'], record['log_index']
+
+
+def ingest(w3, pool_address, output_path, from_block, to_block=None, block_window=DEFAULT_BLOCK_WINDOW):
+    """
+    Appends the pool's Swap events up to `to_block` (default: latest) to `output_path`.
+    Resumes after the last event already in the file; returns the number of new events.
+    """
+    to_block = w3.eth.block_number if to_block is None else to_block
+    _drop_partial_line(output_path)
+    last_event = _last_stored_event(output_path)
+    if last_event is not None:
+        # Restart at the last stored block: it may only have been written in part.
+        from_block = max(from_block, last_event[0])
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    written = 0
+    window = block_window
+    start = from_block
+    with open(output_path, 'a') as handle:
+        while start <= to_block:
+            end = min(start + window - 1, to_block)
+            try:
+                logs = fetch_swap_logs(w3, pool_address, start, end)
+            except Exception as e:
+                if window <= MIN_BLOCK_WINDOW:
+                    raise
+                window = max(MIN_BLOCK_WINDOW, window // 2)
+                print(f"⚠️ get_logs for blocks {start}-{end} failed ({e}). Retrying with {window} blocks.")
+                continue
+
+            if logs:
+                start_time = _block_timestamp(w3, start)
+                end_time = _block_timestamp(w3, end) if end != start else start_time
+                seconds_per_block = (end_time - start_time) / max(end - start, 1)
+                logs = sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex']))
+                for log in logs:
+                    if last_event is not None and (log['blockNumber'], log['logIndex']) <= last_event:
+                        continue
+                    timestamp = start_time + (log['blockNumber'] - start) * seconds_per_block
+                    handle.write(json.dumps(decode_swap_log(log, timestamp)) + '\n')
+                    written += 1
+                handle.flush()
+
+            print(f"📥 Blocks {start:,}-{end:,}: {len(logs)} swaps")
+            start = end + 1
+            # Grow back towards the configured window after a successful request.
+            window = min(block_window, window * 2)
+    return written
+
+
+def convert_to_parquet(ndjson_path, parquet_path, chunk_rows=500_000):
+    """Rewrites an NDJSON events file as Parquet, one row group per chunk."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet swap files requires pyarrow (pip install pyarrow).")
+    writer = None
+    try:
+        for chunk in iter_swap_chunks(ndjson_path, chunk_rows):
+            table = pa.Table.from_pandas(chunk[SWAP_COLUMNS], preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+if __name__ == '__main__':
+    output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), config.SWAP_EVENTS_FILE)
+    w3 = Web3(Web3.HTTPProvider(config.ALCHEMY_RPC_URL))
+    if not w3.is_connected():
+        print("❌ CRITICAL: Could not connect to the Ethereum blockchain.")
+        exit()
+
+    # Usage: python ingest_swaps.py [from_block] [to_block] [--parquet]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    from_block = int(args[0]) if len(args) > 0 else config.SWAP_INGEST_START_BLOCK
+    to_block = int(args[1]) if len(args) > 1 else None
+    print(f"🔌 Ingesting Swap events of {config.UNISWAP_POOL_ID} into {output_path}...")
+    new_events = ingest(w3, config.UNISWAP_POOL_ID, output_path, from_block, to_block)
+    print(f"✅ Stored {new_events:,} new swap events.")
+
+    if output_path.endswith('.ndjson') and '--parquet' in sys.argv:
+        parquet_path = output_path[:-len('.ndjson')] + '.parquet'
+        convert_to_parquet(output_path, parquet_path)
+        print(f"✅ Wrote {parquet_path}")
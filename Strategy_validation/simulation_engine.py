@@ -3,9 +3,9 @@
 import time
 import logging
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
-import random
+import os
+import sys
 
 # The core libraries for interacting with the blockchain and exchanges
 from web3 import Web3
@@ -15,6 +15,16 @@ import ccxt
 # If you don't have one, create a config.py with the variables below
 import config
 
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.candle_store import CandleStore
+from common.range_model import RangeModel
+from common import lp_math
+from common.result_recorder import ResultRecorder
+from common.block_source import BlockWatcher, chain_head_source
+from common.fee_tracker import PoolFeeReader, PositionFeeTracker, range_ticks, raw_liquidity
+from common.slot0 import SLOT0_CALLDATA, decode_slot0, hex_bytes, slot0_price
+
 # --- Setup Basic Logging (to a file, not the console) ---
 logging.basicConfig(
     level=logging.INFO,
@@ -41,11 +51,16 @@ class SimulationEngine:
         print("✅ Successfully connected to Ethereum blockchain.")
 
         self.cex_exchange = ccxt.binance({'enableRateLimit': True})
+        self.candle_store = CandleStore()
         logging.info("CEX connection successful.")
         print("✅ Successfully connected to Binance public API.")
 
-        self.pool_abi = '[{"inputs":[],"name":"slot0","outputs":[{"internalType":"uint160","name":"sqrtPriceX96","type":"uint160"},{"internalType":"int24","name":"tick","type":"int24"},{"internalType":"uint16","name":"observationIndex","type":"uint16"},{"internalType":"uint16","name":"observationCardinality","type":"uint16"},{"internalType":"uint16","name":"observationCardinalityNext","type":"uint16"},{"internalType":"uint8","name":"feeProtocol","type":"uint8"},{"internalType":"bool","name":"unlocked","type":"bool"}],"stateMutability":"view","type":"function"}]'
-        self.pool_contract = self.w3.eth.contract(address=Web3.to_checksum_address(config.UNISWAP_POOL_ID), abi=self.pool_abi)
+        # slot0() is read with a raw eth_call prepared here, so a read needs no contract
+        # object or web3 ABI decoding.
+        self.slot0_call = {'to': Web3.to_checksum_address(config.UNISWAP_POOL_ID), 'data': SLOT0_CALLDATA}
+        # Fees come from the pool's fee growth inside our range, one batched read per tick.
+        self.fee_reader = PoolFeeReader(self.w3, self.slot0_call['to'])
+        self.fee_tracker = None
         
         # --- CORRECTED STATE MANAGEMENT ---
         self.balance_usd = config.SIMULATION_CAPITAL_USD # Available cash
@@ -56,6 +71,7 @@ class SimulationEngine:
         
         self.simulated_eth_amount = 0.0
         self.simulated_usdt_amount = 0.0
+        self.liquidity = 0.0  # Uniswap V3 liquidity L of the simulated position
         
         self.initial_position_value_usd = 0.0
         self.simulated_fees_earned_total = 0.0
@@ -63,32 +79,29 @@ class SimulationEngine:
         self.price_range_min = 0.0
         self.price_range_max = 0.0
 
+        # New-block notifications when config.PRICE_UPDATES is 'block'.
+        self.block_watcher = None
+        self.last_block = None
+
     def get_current_price_from_chain(self) -> float:
         try:
-            slot0 = self.pool_contract.functions.slot0().call()
-            sqrt_price_x96 = slot0[0]
-            price = ((sqrt_price_x96 / 2**96)**2) * (10**(18-6))
-            return price
+            # Pinned to the block the fees are read at, so price and fees come from one block.
+            block = hex(self.last_block) if self.last_block is not None else 'latest'
+            response = self.w3.provider.make_request('eth_call', [self.slot0_call, block])
+            if 'error' in response:
+                raise ConnectionError(f"slot0 eth_call failed: {response['error']}")
+            sqrt_price_x96, _ = decode_slot0(hex_bytes(response['result']))
+            price = slot0_price(sqrt_price_x96, config.POOL_TOKEN0_DECIMALS, config.POOL_TOKEN1_DECIMALS)
+            return price or 0.0
         except Exception as e:
             logging.error(f"Failed to get live price from chain: {e}", exc_info=True)
             return 0.0
 
-    def get_market_volume(self) -> float:
-        try:
-            ohlcv = self.cex_exchange.fetch_ohlcv('ETH/USDT', '1m', limit=1)
-            return ohlcv[0][5] if ohlcv else 0.0
-        except Exception as e:
-            logging.warning(f"Could not fetch 1m volume data from Binance: {e}")
-            return 0.0
-
     def get_historical_data(self) -> pd.DataFrame:
         try:
             since = self.cex_exchange.parse8601((datetime.utcnow() - timedelta(hours=config.RANGE_LOOKBACK_HOURS)).isoformat())
-            ohlcv = self.cex_exchange.fetch_ohlcv('ETH/USDT', '1h', since=since, limit=config.RANGE_LOOKBACK_HOURS)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            if not df.empty:
-                df['close'] = pd.to_numeric(df['close'])
-            return df
+            df = self.candle_store.sync(self.cex_exchange, 'ETH/USDT', '1h', since)
+            return df.tail(config.RANGE_LOOKBACK_HOURS)
         except Exception as e:
             logging.error(f"Could not fetch historical data from Binance: {e}")
             return pd.DataFrame()
@@ -99,43 +112,71 @@ class SimulationEngine:
             print("⚠️ Could not fetch historical data for range calculation. Exiting.")
             exit()
             
-        average_price = historical_data['close'].mean()
-        price_std_dev = historical_data['close'].std()
-        self.price_range_min = average_price - (price_std_dev * config.VOLATILITY_MULTIPLIER)
-        self.price_range_max = average_price + (price_std_dev * config.VOLATILITY_MULTIPLIER)
+        range_model = RangeModel.from_prices(historical_data['close'])
+        self.price_range_min, self.price_range_max = range_model.bounds(config.VOLATILITY_MULTIPLIER)
         print(f"✅ Optimal range calculated: ${self.price_range_min:,.2f} to ${self.price_range_max:,.2f}\n")
 
-    def _get_dynamic_total_liquidity(self) -> float:
-        base_liquidity = 50_000_000
-        today = datetime.utcnow().weekday()
-        multiplier = 0.85 if today >= 5 else 1.0
-        noise = random.uniform(0.95, 1.05)
-        return base_liquidity * multiplier * noise
-
-    def _estimate_fees(self, volume_1m: float, current_price: float) -> float:
-        if not self.in_position: return 0.0
-        total_liquidity_in_pool = self._get_dynamic_total_liquidity()
-        your_liquidity_value = (self.simulated_eth_amount * current_price) + self.simulated_usdt_amount
-        if total_liquidity_in_pool == 0: return 0.0
-        your_share_of_pool = your_liquidity_value / total_liquidity_in_pool
-        volume_usd_1m = volume_1m * current_price
-        fees = your_share_of_pool * volume_usd_1m * config.FEE_TIER 
-        return fees
+    def _fee_block(self):
+        """The block of the current tick when ticking on blocks, else 'latest'."""
+        return self.last_block if self.last_block is not None else 'latest'
+
+    def _open_fee_tracker(self):
+        """Starts reading the pool's fee growth for the position just opened (None if that fails)."""
+        # The pool's raw price is USDT units per wei of WETH.
+        scale = 10**(config.POOL_TOKEN1_DECIMALS - config.POOL_TOKEN0_DECIMALS)
+        tick_lower, tick_upper = range_ticks(self.price_range_min * scale, self.price_range_max * scale,
+                                             config.POOL_TICK_SPACING)
+        liquidity = raw_liquidity(self.liquidity, config.POOL_TOKEN0_DECIMALS, config.POOL_TOKEN1_DECIMALS)
+        try:
+            return PositionFeeTracker.open(self.fee_reader, tick_lower, tick_upper, liquidity, self._fee_block())
+        except Exception as e:
+            logging.error(f"Could not read the pool's fee growth at entry: {e}", exc_info=True)
+            print(f"⚠️ Could not read the pool's fee growth: {e}. Fees will not be counted for this position.")
+            return None
+
+    def _accrued_fees(self, current_price: float) -> float:
+        """
+        Fees in USDT the position earned since entry. A failed read keeps the amount of
+        the last successful one.
+        """
+        if self.fee_tracker is None:
+            return self.simulated_fees_earned_total
+        try:
+            self.fee_tracker.update(self._fee_block())
+        except Exception as e:
+            logging.warning(f"Could not read the pool's fee growth: {e}")
+        fees0 = self.fee_tracker.fees0 / 10**config.POOL_TOKEN0_DECIMALS
+        fees1 = self.fee_tracker.fees1 / 10**config.POOL_TOKEN1_DECIMALS
+        return fees0 * current_price + fees1
+
+    def _start_block_watcher(self):
+        source = chain_head_source(config.ALCHEMY_WS_URL, self.w3.eth.get_block_number,
+                                   config.BLOCK_POLL_INTERVAL_SECONDS)
+        self.block_watcher = BlockWatcher(source, name='ethereum').start()
+        print("✅ Ticking on every new Ethereum block.")
+
+    def _wait_for_next_tick(self):
+        """Waits for the next block, or LOOP_INTERVAL_SECONDS without block updates."""
+        if self.block_watcher is None or self.block_watcher.stopped:
+            time.sleep(config.LOOP_INTERVAL_SECONDS)
+            return
+        self.last_block = self.block_watcher.wait_for_block(self.last_block)
 
     def _calculate_il(self, current_price: float) -> float:
         if not self.in_position or self.entry_price == 0: return 0.0
-        price_ratio = current_price / self.entry_price
-        il = (2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1
+        il = lp_math.concentrated_il(self.entry_price, current_price, self.price_range_min, self.price_range_max)
         return il * 100
 
-    def _print_status_row(self, status, price, pos_value, il, fees, pnl, alert):
-        timestamp = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    def _print_status_row(self, timestamp, status, price, pos_value, il, fees, pnl, alert):
+        timestamp = timestamp.strftime('%Y-%m-%d %H:%M:%S')
         price_str = f"${price:,.2f}"
         pos_val_str = f"${pos_value:,.2f}"
         il_str = f"{il:.2f}%"
         fees_str = f"${fees:.4f}"
         pnl_str = f"${pnl:,.2f}"
         print(f"{timestamp:<22} | {status:<18} | {price_str:<15} | {pos_val_str:<16} | {il_str:<8} | {fees_str:<12} | {pnl_str:<12} | {alert if alert else '---'}")
+        if status == "EXITED POSITION":
+            print("-" * self._header_width)
 
     def run(self):
         historical_data = self.get_historical_data()
@@ -143,25 +184,36 @@ class SimulationEngine:
         
         header = (f"{'Timestamp (UTC)':<22} | {'Status':<18} | {'Current Price':<15} | "
                   f"{'Position Value':<16} | {'IL':<8} | {'Fees Earned':<12} | {'Total PnL':<12} | {'Alert'}")
+        self._header_width = len(header)
         print(header)
         print("-" * len(header))
-        
+
+        # Every tick is kept in the results file; the console view is set in config.py.
+        recorder = ResultRecorder(config.RESULTS_FILE, flush_every=config.RESULTS_FLUSH_EVERY,
+                                  console=config.CONSOLE_VIEW, printer=self._print_status_row)
+
+        if getattr(config, 'PRICE_UPDATES', 'interval') == 'block':
+            self._start_block_watcher()
+
         while True:
             try:
                 current_price = self.get_current_price_from_chain()
-                volume_1m = self.get_market_volume()
                 if current_price == 0.0:
-                    time.sleep(config.LOOP_INTERVAL_SECONDS)
+                    self._wait_for_next_tick()
                     continue
 
                 status, alert = "OUT OF RANGE", ""
                 il_percent, fees_this_interval, total_pnl, position_value = 0.0, 0.0, 0.0, 0.0
 
                 if self.in_position:
+                    # A concentrated position rebalances between the tokens as the price moves.
+                    self.simulated_eth_amount, self.simulated_usdt_amount = lp_math.token_amounts(
+                        self.liquidity, current_price, self.price_range_min, self.price_range_max)
                     position_value = (self.simulated_eth_amount * current_price) + self.simulated_usdt_amount
                     il_percent = self._calculate_il(current_price)
-                    fees_this_interval = self._estimate_fees(volume_1m, current_price)
-                    self.simulated_fees_earned_total += fees_this_interval
+                    fees_total = self._accrued_fees(current_price)
+                    fees_this_interval = fees_total - self.simulated_fees_earned_total
+                    self.simulated_fees_earned_total = fees_total
                     total_pnl = (position_value - self.initial_position_value_usd) + self.simulated_fees_earned_total - (self.entry_gas_fee + self.exit_gas_fee)
                     
                     if self.price_range_min <= current_price <= self.price_range_max:
@@ -179,6 +231,8 @@ class SimulationEngine:
                         self.in_position = False
                         self.simulated_eth_amount = 0.0
                         self.simulated_usdt_amount = 0.0
+                        self.liquidity = 0.0
+                        self.fee_tracker = None
                         
                 else: # Not in position
                     total_pnl = self.balance_usd - config.SIMULATION_CAPITAL_USD
@@ -196,17 +250,21 @@ class SimulationEngine:
                         self.simulated_fees_earned_total = 0.0
 
                         self.initial_position_value_usd = investment_usd # This is the actual amount invested
-                        self.simulated_usdt_amount = self.initial_position_value_usd / 2
-                        self.simulated_eth_amount = (self.initial_position_value_usd / 2) / current_price
+                        self.liquidity = lp_math.liquidity_for_capital(
+                            self.initial_position_value_usd, current_price, self.price_range_min, self.price_range_max)
+                        self.simulated_eth_amount, self.simulated_usdt_amount = lp_math.token_amounts(
+                            self.liquidity, current_price, self.price_range_min, self.price_range_max)
+                        self.fee_tracker = self._open_fee_tracker()
                         position_value = self.initial_position_value_usd
                         total_pnl = -self.entry_gas_fee # At entry, PnL is just the cost of gas
 
-                self._print_status_row(status, current_price, position_value, il_percent, fees_this_interval, total_pnl, alert)
-                
-                if status == "EXITED POSITION":
-                    print("-" * len(header))
+                equity = self.balance_usd
+                if self.in_position:
+                    equity += position_value + self.simulated_fees_earned_total
+                recorder.record(datetime.utcnow(), status, current_price, position_value, il_percent,
+                                fees_this_interval, total_pnl, alert, equity)
 
-                time.sleep(config.LOOP_INTERVAL_SECONDS)
+                self._wait_for_next_tick()
 
             except KeyboardInterrupt:
                 print("\n🛑 Shutdown signal received. Stopping simulation.")
@@ -214,7 +272,10 @@ class SimulationEngine:
             except Exception as e:
                 logging.error(f"An unexpected error occurred: {e}", exc_info=True)
                 print(f"\n💥 An unexpected error occurred: {e}. Check simulation.log for details.")
-                time.sleep(config.LOOP_INTERVAL_SECONDS)
+                self._wait_for_next_tick()
+
+        recorder.close()
+        print(f"💾 {recorder.rows_recorded:,} ticks saved to {recorder.path}")
 
 if __name__ == '__main__':
     engine = SimulationEngine()
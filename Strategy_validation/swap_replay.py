@@ -0,0 +1,315 @@
+# swap_replay.py
+"""
+Backtests the dynamic-range strategy against the pool's real Swap events.
+
+The events come from a local NDJSON or Parquet file written by ingest_swaps.py, so a
+replay never touches the network. The file is read in chunks of `chunk_rows` events,
+which keeps memory bounded no matter how many events the file holds.
+
+For every swap, the fee is the input amount times the fee tier. While our virtual
+position is open and the swap's tick is inside [tick_lower, tick_upper), we earn
+L_ours / (L_active + L_ours) of that fee. L_active is the pool's active liquidity
+reported by the event. The first swap that leaves the range closes the position, as
+in SimulationEngine. A new range (mean +/- k * std of the last RANGE_LOOKBACK_HOURS
+hourly closes, rounded outward to the tick spacing) is opened as soon as the price is
+inside it again.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import lp_math
+from common.range_model import bounds_series
+
+# Columns of an events file, in the order ingest_swaps.py writes them.
+SWAP_COLUMNS = ['block_number', 'log_index', 'timestamp', 'amount0', 'amount1',
+                'sqrt_price_x96', 'liquidity', 'tick']
+# uint160 / uint128 values do not fit in int64, so the files keep them as strings.
+_STRING_COLUMNS = {'sqrt_price_x96': str, 'liquidity': str}
+
+DEFAULT_CHUNK_ROWS = 500_000
+TICK_BASE = 1.0001
+MIN_TICK, MAX_TICK = -887272, 887272
+_Q96 = 2 ** 96
+
+
+def iter_swap_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields the events of an .ndjson or .parquet file as DataFrames of at most `chunk_rows` rows."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet swap files requires pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=SWAP_COLUMNS):
+            yield batch.to_pandas()
+        return
+
+    with pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=_STRING_COLUMNS,
+                      convert_dates=False) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def tick_to_price(tick, token0_decimals, token1_decimals):
+    """Human price (token1 per token0) at a tick."""
+    return TICK_BASE ** np.asarray(tick, dtype=np.float64) * 10 ** (token0_decimals - token1_decimals)
+
+
+def price_to_tick(price, token0_decimals, token1_decimals):
+    """Tick at a human price (token1 per token0), not rounded."""
+    return np.log(price / 10 ** (token0_decimals - token1_decimals)) / np.log(TICK_BASE)
+
+
+def _first_outside(tick, start, tick_lower, tick_upper):
+    """Index of the first event at or after `start` whose tick is outside the range (len(tick) if none)."""
+    n = len(tick)
+    position = start
+    block = 256
+    while position < n:
+        window = tick[position:position + block]
+        outside = np.flatnonzero((window < tick_lower) | (window >= tick_upper))
+        if len(outside):
+            return position + int(outside[0])
+        position += block
+        # Positions usually last far longer than a few swaps, so the scan grows quickly.
+        block = min(block * 4, 1 << 20)
+    return n
+
+
+class SwapReplayBacktest:
+    """
+    Replays Swap events against a virtual concentrated position.
+
+    Trades are collected in `self.trades` (times in unix seconds, see `trades_frame`).
+    `run` returns a summary dict.
+    """
+
+    def __init__(self,
+                 capital=config.SIMULATION_CAPITAL_USD,
+                 fee_tier=config.FEE_TIER,
+                 lookback_hours=config.RANGE_LOOKBACK_HOURS,
+                 volatility_multiplier=config.VOLATILITY_MULTIPLIER,
+                 gas_fee_usd=config.SIMULATED_GAS_FEE_USD,
+                 token0_decimals=config.POOL_TOKEN0_DECIMALS,
+                 token1_decimals=config.POOL_TOKEN1_DECIMALS,
+                 tick_spacing=config.POOL_TICK_SPACING,
+                 investment_fraction=0.5):
+        self.capital = capital
+        self.fee_tier = fee_tier
+        self.lookback_hours = lookback_hours
+        self.volatility_multiplier = volatility_multiplier
+        self.gas_fee_usd = gas_fee_usd
+        self.token0_decimals = token0_decimals
+        self.token1_decimals = token1_decimals
+        self.tick_spacing = tick_spacing
+        self.investment_fraction = investment_fraction  # SimulationEngine invests half of the cash
+        # Converts human liquidity (lp_math) to the pool's raw units.
+        self.liquidity_scale = 10 ** ((token0_decimals + token1_decimals) / 2)
+
+        self.balance_usd = capital
+        self.in_position = False
+        self.position = None
+        self.trades = []
+        self.events_replayed = 0
+        self.last_price = None
+        self.last_timestamp = None
+
+        # Hourly closes carried from one chunk to the next.
+        self._completed_closes = np.empty(0)
+        self._forming_hour = None
+        self._forming_close = None
+
+    # --- Chunk preparation ---
+
+    def _prices(self, chunk):
+        sqrt_price = chunk['sqrt_price_x96'].astype(float).to_numpy() / _Q96
+        return sqrt_price ** 2 * 10 ** (self.token0_decimals - self.token1_decimals)
+
+    def _hourly_bounds(self, timestamps, prices):
+        """
+        Range bounds valid at every event, from the hourly closes completed before its hour.
+        Closes are the price of the last swap of each hour; hours without swaps are skipped.
+        """
+        hours = timestamps // 3600
+        starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+        chunk_hours = hours[starts]
+        hour_closes = prices[np.r_[starts[1:] - 1, len(prices) - 1]]
+
+        completed = self._completed_closes
+        if self._forming_hour is not None and chunk_hours[0] != self._forming_hour:
+            completed = np.append(completed, self._forming_close)
+        completed = completed[-self.lookback_hours:]
+
+        # bounds_series gives bar k the statistics of the closes before it.
+        closes = np.concatenate([completed, hour_closes])
+        lower, upper = bounds_series(closes, self.lookback_hours, self.volatility_multiplier, ddof=1)
+        hour_of_event = len(completed) + np.cumsum(np.r_[True, hours[1:] != hours[:-1]]) - 1
+
+        self._completed_closes = np.concatenate([completed, hour_closes[:-1]])[-self.lookback_hours:]
+        self._forming_hour = chunk_hours[-1]
+        self._forming_close = hour_closes[-1]
+        return lower[hour_of_event], upper[hour_of_event]
+
+    # --- Position handling ---
+
+    def _open_position(self, timestamp, price, lower, upper):
+        # Round outward to usable ticks; a range reaching below zero starts at the minimum tick.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tick_lower = price_to_tick(max(lower, 0.0), self.token0_decimals, self.token1_decimals)
+        tick_upper = price_to_tick(upper, self.token0_decimals, self.token1_decimals)
+        tick_lower = int(max(np.floor(max(tick_lower, MIN_TICK) / self.tick_spacing), np.ceil(MIN_TICK / self.tick_spacing))) * self.tick_spacing
+        tick_upper = int(min(np.ceil(tick_upper / self.tick_spacing), np.floor(MAX_TICK / self.tick_spacing))) * self.tick_spacing
+        price_min, price_max = tick_to_price([tick_lower, tick_upper], self.token0_decimals, self.token1_decimals)
+
+        investment_usd = self.balance_usd * self.investment_fraction
+        self.balance_usd -= investment_usd + self.gas_fee_usd
+        self.in_position = True
+        self.position = {
+            'entry_time': timestamp,
+            'entry_price': price,
+            'price_range_min': float(price_min),
+            'price_range_max': float(price_max),
+            'tick_lower': tick_lower,
+            'tick_upper': tick_upper,
+            'investment_usd': investment_usd,
+            'liquidity': lp_math.liquidity_for_capital(investment_usd, price, price_min, price_max),
+            'fees_usd': 0.0,
+            'swaps_in_range': 0,
+        }
+        self.position['raw_liquidity'] = self.position['liquidity'] * self.liquidity_scale
+
+    def _position_value(self, price):
+        position = self.position
+        return float(lp_math.position_value(position['liquidity'], price,
+                                            position['price_range_min'], position['price_range_max']))
+
+    def _close_position(self, timestamp, price):
+        position = self.position
+        position_value = self._position_value(price)
+        self.balance_usd += position_value + position['fees_usd'] - self.gas_fee_usd
+        il = lp_math.concentrated_il(position['entry_price'], price,
+                                     position['price_range_min'], position['price_range_max'])
+        self.trades.append({
+            'entry_time': position['entry_time'],
+            'exit_time': timestamp,
+            'entry_price': position['entry_price'],
+            'exit_price': price,
+            'price_range_min': position['price_range_min'],
+            'price_range_max': position['price_range_max'],
+            'swaps_in_range': position['swaps_in_range'],
+            'fees_usd': position['fees_usd'],
+            'il_percent': il * 100,
+            'pnl_usd': position_value - position['investment_usd'] + position['fees_usd'] - 2 * self.gas_fee_usd,
+        })
+        self.in_position = False
+        self.position = None
+
+    # --- Replay ---
+
+    def process_chunk(self, chunk):
+        """Replays one DataFrame of events (ordered by block and log index)."""
+        n = len(chunk)
+        if n == 0:
+            return
+        timestamps = chunk['timestamp'].to_numpy(dtype=np.int64)
+        ticks = chunk['tick'].to_numpy(dtype=np.int64)
+        prices = self._prices(chunk)
+        active_liquidity = chunk['liquidity'].astype(float).to_numpy()
+        amount0 = chunk['amount0'].to_numpy(dtype=np.float64)
+        amount1 = chunk['amount1'].to_numpy(dtype=np.float64)
+        # The fee is taken from the token paid into the pool (the positive amount).
+        fee_usd = np.where(amount0 > 0, amount0 * prices, np.maximum(amount1, 0.0)) * self.fee_tier
+
+        lower, upper = self._hourly_bounds(timestamps, prices)
+        entry_candidates = np.flatnonzero((lower <= prices) & (prices <= upper))
+
+        i = 0
+        while i < n:
+            if not self.in_position:
+                k = np.searchsorted(entry_candidates, i)
+                if k == len(entry_candidates):
+                    break
+                j = int(entry_candidates[k])
+                self._open_position(int(timestamps[j]), float(prices[j]), float(lower[j]), float(upper[j]))
+                i = j + 1
+                continue
+
+            position = self.position
+            exit_at = _first_outside(ticks, i, position['tick_lower'], position['tick_upper'])
+            # Every swap before exit_at has its tick inside our range.
+            our_liquidity = position['raw_liquidity']
+            share = our_liquidity / (active_liquidity[i:exit_at] + our_liquidity)
+            position['fees_usd'] += float((fee_usd[i:exit_at] * share).sum())
+            position['swaps_in_range'] += exit_at - i
+            if exit_at == n:
+                break
+            self._close_position(int(timestamps[exit_at]), float(prices[exit_at]))
+            i = exit_at + 1
+
+        self.events_replayed += n
+        self.last_price = float(prices[-1])
+        self.last_timestamp = int(timestamps[-1])
+
+    def run(self, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Replays a whole events file and returns the summary."""
+        for chunk in iter_swap_chunks(path, chunk_rows):
+            self.process_chunk(chunk)
+        return self.summary()
+
+    def summary(self):
+        open_value = 0.0
+        if self.in_position and self.last_price is not None:
+            open_value = self._position_value(self.last_price) + self.position['fees_usd']
+        fees = sum(trade['fees_usd'] for trade in self.trades)
+        if self.in_position:
+            fees += self.position['fees_usd']
+        return {
+            'events_replayed': self.events_replayed,
+            'trades': len(self.trades),
+            'fees_usd': fees,
+            'final_equity_usd': self.balance_usd + open_value,
+            'total_pnl_usd': self.balance_usd + open_value - self.capital,
+            'in_position': self.in_position,
+        }
+
+    def trades_frame(self):
+        trades = pd.DataFrame(self.trades)
+        for column in ('entry_time', 'exit_time'):
+            if column in trades:
+                trades[column] = pd.to_datetime(trades[column], unit='s')
+        return trades
+
+
+if __name__ == '__main__':
+    events_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), config.SWAP_EVENTS_FILE)
+    if not os.path.exists(events_file):
+        print(f"❌ Swap events file not found: {events_file}. Run ingest_swaps.py first.")
+        exit()
+
+    print(f"🔁 Replaying swap events from {events_file}...")
+    backtest = SwapReplayBacktest()
+    summary = backtest.run(events_file)
+
+    trades = backtest.trades_frame()
+    if not trades.empty:
+        pd.set_option('display.max_columns', None)
+        pd.set_option('display.width', 160)
+        print("\n--- Trades ---")
+        print(trades.to_string(index=False))
+
+    print("\n--- Swap Replay Summary ---")
+    print(f"- Events Replayed: {summary['events_replayed']:,}")
+    print(f"- Positions Closed: {summary['trades']}")
+    print(f"- Fees Earned: ${summary['fees_usd']:,.4f}")
+    print(f"- Final Equity: ${summary['final_equity_usd']:,.2f}")
+    print(f"- Total PnL: ${summary['total_pnl_usd']:,.2f}")
+    if summary['in_position']:
+        print("- A position is still open (valued at the last swap price).")
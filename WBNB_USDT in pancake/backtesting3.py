@@ -1,8 +1,24 @@
+import os
+import sys
 import ccxt
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+# Make the shared modules in the repository root importable when run as a script.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.candle_store import CandleStore
+from common.ohlcv_downloader import download_ohlcv
+from common.backtest_kernel import run_backtest_kernel, STATUS_LABELS, FALLBACK_STD_PCT
+from common.range_model import bounds_series
+from common import lp_math
+from common.param_sweep import run_sweep
+from common.monte_carlo import run_monte_carlo, summarize_paths
+from common.walk_forward import run_walk_forward
+from common.result_recorder import ResultRecorder, CONSOLE_EVENTS, write_results
+from common.backtest_checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint
+from common.intrabar import IntrabarSeries, RESOLUTION_CLOSE, RESOLUTION_HIGH_LOW, RESOLUTION_MINUTE
+
 class BacktestEngine:
     """
     Backtests a dynamic concentrated liquidity strategy for PancakeSwap
@@ -23,44 +39,69 @@ class BacktestEngine:
         self.entry_price = 0.0
         self.token0_amount = 0.0  # Represents WBNB
         self.token1_amount = 0.0  # Represents USDT
+        self.liquidity = 0.0  # Uniswap V3 liquidity L (concentrated position model)
         self.initial_position_value = 0.0
         self.total_fees_earned = 0.0
+        self.realized_pnl = 0.0  # PnL of all closed positions, for the recorded equity curve
         self.price_range_min = 0.0
         self.price_range_max = 0.0
         
         self.exchange = ccxt.binance()
+        self.candle_store = CandleStore()
 
-    def fetch_data(self):
+    def fetch_data(self, days=30):
         """
         Fetches historical hourly data for the specified pair from Binance.
         """
         print(f"📡 Fetching historical data for {self.config['PAIR']} from Binance...")
         try:
-            # Fetch the last 30 days of hourly OHLCV (Open, High, Low, Close, Volume) data.
-            since = self.exchange.parse8601((datetime.utcnow() - pd.Timedelta(days=30)).isoformat())
-            ohlcv = self.exchange.fetch_ohlcv(self.config['PAIR'], '1h', since=since)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+            # Fetch the last `days` days (30 by default) of hourly OHLCV (Open, High, Low, Close, Volume) data.
+            since = self.exchange.parse8601((datetime.utcnow() - pd.Timedelta(days=days)).isoformat())
+            # Served from the local candle store; only candles newer than the stored ones are downloaded,
+            # in concurrent windows under the exchange's rate limit.
+            df = self.candle_store.sync(self.exchange, self.config['PAIR'], '1h', since, fetch=download_ohlcv)
+            if df.empty:
+                print("❌ No data available for the requested period.")
+                return None
             print(f"✅ Successfully fetched {len(df)} hours of data.")
             return df
         except Exception as e:
             print(f"❌ Failed to fetch data: {e}")
             return None
 
-    def _calculate_range(self, data_slice):
+    def fetch_minute_data(self, data):
         """
-        Calculates the optimal liquidity range based on a 2-hour data slice.
-        The range is set based on the mean price and standard deviation.
+        Fetches the 1m candles covering the hourly candles in `data` (from the local candle
+        store, downloading only what is missing).
         """
-        average_price = data_slice['close'].mean()
-        price_std_dev = data_slice['close'].std()
-        
-        # If volatility is very low or zero, use a small percentage as a fallback.
-        if pd.isna(price_std_dev) or price_std_dev == 0:
-            price_std_dev = average_price * 0.01 
-            
-        self.price_range_min = average_price - (price_std_dev * self.config['VOLATILITY_MULTIPLIER'])
-        self.price_range_max = average_price + (price_std_dev * self.config['VOLATILITY_MULTIPLIER'])
+        print(f"📡 Fetching 1m candles for {self.config['PAIR']} from Binance...")
+        try:
+            # Candle timestamps are naive UTC open times.
+            since = int(data['timestamp'].iloc[0].timestamp() * 1000)
+            until = int(data['timestamp'].iloc[-1].timestamp() * 1000) + 3_600_000
+            df = self.candle_store.sync(self.exchange, self.config['PAIR'], '1m', since, until, fetch=download_ohlcv)
+            print(f"✅ Successfully fetched {len(df):,} minutes of data.")
+            return df
+        except Exception as e:
+            print(f"❌ Failed to fetch 1m data: {e}")
+            return None
+
+    def _intrabar_series(self, data):
+        """
+        The intrabar breach detection selected by INTRABAR_RESOLUTION: 'high_low' tests the
+        hourly low / high, '1m' the 1m candles of every hour (down to the breach minute).
+        'close' returns None, i.e. the hourly-close checks of `run`.
+        """
+        resolution = self.config.get('INTRABAR_RESOLUTION', RESOLUTION_CLOSE)
+        if resolution == RESOLUTION_HIGH_LOW:
+            return IntrabarSeries.from_hourly(data)
+        if resolution == RESOLUTION_MINUTE:
+            minutes = self.fetch_minute_data(data)
+            if minutes is None or minutes.empty:
+                print("⚠️ No 1m candles, falling back to the hourly high / low.")
+                return IntrabarSeries.from_hourly(data)
+            return IntrabarSeries.from_minutes(data, minutes)
+        return None
 
     def _estimate_fees(self, position_value, hourly_volume, current_price):
         """
@@ -76,12 +117,25 @@ class BacktestEngine:
         estimated_fees = (hourly_volume_usd * self.config['FEE_TIER']) * our_share_of_activity * self.config['FEE_ESTIMATE_SCALAR']
         return min(estimated_fees, position_value * 0.001) 
 
+    def _is_concentrated(self):
+        return self.config.get('POSITION_MODEL', lp_math.POSITION_MODEL_FIFTY_FIFTY) == lp_math.POSITION_MODEL_CONCENTRATED
+
+    def _position_value(self, current_price):
+        """
+        Values the open position at the given price.
+        """
+        if self._is_concentrated():
+            return lp_math.position_value(self.liquidity, current_price, self.price_range_min, self.price_range_max)
+        return (self.token0_amount * current_price) + self.token1_amount
+
     def _calculate_il(self, current_price):
         """
         Calculates the impermanent loss as a percentage.
         """
         if self.entry_price == 0:
             return 0.0
+        if self._is_concentrated():
+            return lp_math.concentrated_il(self.entry_price, current_price, self.price_range_min, self.price_range_max) * 100
         price_ratio = current_price / self.entry_price
         il = (2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1
         return il * 100
@@ -98,19 +152,76 @@ class BacktestEngine:
         pnl_str = f"${pnl:.2f}"
         print(f"{ts_str:<22} {status:<18} {price_str:<14} {pos_val_str:<14} {il_str:<10} {fees_str:<12} {pnl_str:<12} {alert}")
 
-    def run(self):
+    def _print_console_row(self, timestamp, status, price, pos_value, il, fees, pnl, alert):
+        """
+        Console view of a recorded row; a separator follows every exit for readability.
+        """
+        self._print_status_row(timestamp, status, price, pos_value, il, fees, pnl, alert)
+        if status == "EXITED POSITION":
+            print("-" * self._header_width)
+
+    def _resume_start(self, data):
+        """
+        Restores the state saved in CHECKPOINT_FILE and returns the index of the first bar
+        after it, or None when there is nothing to resume from.
+        """
+        checkpoint = load_checkpoint(self.config.get('CHECKPOINT_FILE'), self.config)
+        if checkpoint is None:
+            return None
+        state, last_timestamp = checkpoint
+        if last_timestamp < data['timestamp'].iloc[0]:
+            print(f"⚠️ Checkpoint at {last_timestamp} is older than the fetched history; replaying from the start.")
+            return None
+        restore_checkpoint(self, state)
+        start = int(data['timestamp'].searchsorted(last_timestamp, side='right'))
+        print(f"⏩ Resuming from the checkpoint at {last_timestamp} ({len(data) - start:,} new bars).")
+        return max(start, self.config['LOOKBACK_PERIOD_HOURS'])
+
+    def run(self, recorder=None, resume=None):
         """
         Main backtesting loop that iterates through the historical data.
+
+        Every bar is recorded by a `ResultRecorder` (written to the config's RESULTS_FILE
+        if set); the console shows the rows selected by CONSOLE_VIEW ('events' by default).
+        Returns the recorder.
+
+        With CHECKPOINT_FILE set, the engine state is saved every CHECKPOINT_EVERY bars and
+        after the last closed candle (a still-forming candle is left for the next run).
+        With `resume` (default: the config's RESUME) a run restores that state and only
+        processes the bars after it, appending to the results file.
         """
         data = self.fetch_data()
         if data is None:
             return
+        checkpoint_path = self.config.get('CHECKPOINT_FILE')
+        checkpoint_every = self.config.get('CHECKPOINT_EVERY', 0)
+        resume = self.config.get('RESUME', False) if resume is None else resume
+        start = self._resume_start(data) if resume else None
+        resumed = start is not None
+        if not resumed:
+            start = self.config['LOOKBACK_PERIOD_HOURS']
+        end = len(data)
+        if checkpoint_path:
+            # Only closed candles go into a checkpoint, so none is skipped when it completes.
+            last_open = pd.Timestamp(datetime.utcnow()) - pd.Timedelta(hours=1)
+            end = int(data['timestamp'].searchsorted(last_open, side='right'))
+        if recorder is None:
+            recorder = ResultRecorder(self.config.get('RESULTS_FILE'),
+                                      console=self.config.get('CONSOLE_VIEW', CONSOLE_EVENTS),
+                                      printer=self._print_console_row, append=resumed)
 
         header = f"{'Timestamp (UTC)':<22} {'Status':<18} {'Current Price':<14} {'Position Value':<14} {'IL':<10} {'Fees Earned':<12} {'Total PnL':<12} {'Alert'}"
+        self._header_width = len(header)
         print(header)
         print("-" * len(header))
 
-        for i in range(self.config['LOOKBACK_PERIOD_HOURS'], len(data)):
+        # Mean +/- k*std of the lookback window before every bar, computed in one pass.
+        lower_bounds, upper_bounds = bounds_series(
+            data['close'].to_numpy(dtype=float), self.config['LOOKBACK_PERIOD_HOURS'],
+            self.config['VOLATILITY_MULTIPLIER'], ddof=1, fallback_std_pct=FALLBACK_STD_PCT)
+
+        # Start after the lookback window (or after the checkpoint when resuming).
+        for i in range(start, end):
             current_row = data.iloc[i]
             current_price = current_row['close']
             current_volume = current_row['volume']
@@ -122,25 +233,26 @@ class BacktestEngine:
             if self.in_position:
                 if self.price_range_min <= current_price <= self.price_range_max:
                     status = "IN RANGE (ACTIVE)"
-                    position_value = (self.token0_amount * current_price) + self.token1_amount
+                    position_value = self._position_value(current_price)
                     il_percent = self._calculate_il(current_price)
                     fees_this_period = self._estimate_fees(position_value, current_volume, current_price)
                     self.total_fees_earned += fees_this_period
                     total_pnl = (position_value - self.initial_position_value) + self.total_fees_earned
                 else:
                     status = "EXITED POSITION"
-                    final_position_value = (self.token0_amount * current_price) + self.token1_amount
+                    final_position_value = self._position_value(current_price)
                     total_pnl = (final_position_value - self.initial_position_value) + self.total_fees_earned
                     alert = f"Exited at ${current_price:,.2f}. Final PnL: ${total_pnl:,.2f}"
                     self.balance_usd += final_position_value
+                    self.realized_pnl += total_pnl
                     
                     self.in_position = False
                     self.total_fees_earned = 0.0
                     position_value = 0.0 
             else:
                 status = "OUT OF POSITION"
-                lookback_data = data.iloc[i-self.config['LOOKBACK_PERIOD_HOURS']:i]
-                self._calculate_range(lookback_data)
+                self.price_range_min = lower_bounds[i]
+                self.price_range_max = upper_bounds[i]
                 
                 if self.price_range_min <= current_price <= self.price_range_max:
                     status = "POSITION OPENED"
@@ -151,16 +263,117 @@ class BacktestEngine:
                     self.entry_price = current_price
                     self.initial_position_value = investment_amount
                     
-                    self.token1_amount = investment_amount / 2  # USDT
-                    self.token0_amount = (investment_amount / 2) / current_price # WBNB
+                    if self._is_concentrated():
+                        self.liquidity = lp_math.liquidity_for_capital(investment_amount, current_price, self.price_range_min, self.price_range_max)
+                        self.token0_amount, self.token1_amount = lp_math.token_amounts(self.liquidity, current_price, self.price_range_min, self.price_range_max)
+                    else:
+                        self.token1_amount = investment_amount / 2  # USDT
+                        self.token0_amount = (investment_amount / 2) / current_price # WBNB
                     
                     position_value = self.initial_position_value
                     alert = f"Entered at ${current_price:,.2f}. Range: [${self.price_range_min:,.2f} - ${self.price_range_max:,.2f}]"
             
-            self._print_status_row(timestamp, status, current_price, position_value, il_percent, fees_this_period, total_pnl, alert)
-            
-            if status == "EXITED POSITION":
-                print("-" * len(header))
+            # Equity as `summarize_backtest` measures it: closed PnL plus the open position's PnL.
+            open_pnl = total_pnl if status == "IN RANGE (ACTIVE)" else 0.0
+            equity = self.config['SIMULATION_CAPITAL_USD'] + self.realized_pnl + open_pnl
+            recorder.record(timestamp, status, current_price, position_value, il_percent, fees_this_period,
+                            total_pnl, alert, equity)
+
+            if checkpoint_path and (i == end - 1 or (checkpoint_every and (i + 1 - start) % checkpoint_every == 0)):
+                # Results are flushed first, so the file never lags behind the checkpoint.
+                recorder.flush()
+                save_checkpoint(checkpoint_path, self, timestamp)
+
+        recorder.close()
+        if recorder.path:
+            print(f"💾 Saved {recorder.rows_recorded:,} bars of results to {recorder.path}")
+        return recorder
+
+    def run_vectorized(self, data=None):
+        """
+        Runs the same strategy as `run` through the array kernel and returns the per-bar
+        results as a DataFrame instead of printing them (also written to RESULTS_FILE if
+        set). Suited to long histories. With INTRABAR_RESOLUTION 'high_low' or '1m', held
+        hours exit as soon as they trade outside the range, at the breach price, and the
+        exit rows carry the `breach_time`.
+        """
+        if data is None:
+            data = self.fetch_data()
+        if data is None:
+            return None
+
+        close = data['close'].to_numpy(dtype=float)
+        result = run_backtest_kernel(close, data['volume'].to_numpy(dtype=float), self.config,
+                                     intrabar=self._intrabar_series(data))
+
+        # Leave the engine in the same state a full `run` would.
+        for attribute, value in result['state'].items():
+            setattr(self, attribute, value)
+
+        bars = result['bar_index']
+        frame = pd.DataFrame({
+            'timestamp': data['timestamp'].to_numpy()[bars],
+            'status': STATUS_LABELS[result['status']],
+            'price': result['price'],
+            'position_value': result['position_value'],
+            'il_percent': result['il_percent'],
+            'fees': result['fees'],
+            'total_pnl': result['total_pnl'],
+            'range_min': result['range_min'],
+            'range_max': result['range_max'],
+        })
+        if result['exit_times'] is not None:
+            exit_bars = result['exit_bars'][result['exit_bars'] < len(close)]
+            breach_time = pd.Series(pd.NaT, index=bars, dtype='datetime64[ns]')
+            breach_time[exit_bars] = pd.to_datetime(result['exit_times'])
+            frame['breach_time'] = breach_time.to_numpy()
+        if self.config.get('RESULTS_FILE'):
+            write_results(frame, self.config['RESULTS_FILE'])
+        return frame
+
+    def run_sweep(self, grid, processes=None):
+        """
+        Backtests many parameter combinations over the same data in a process pool.
+
+        :param grid: A dict of parameter -> list of values, or a list of config overrides.
+        :return: A summary table ranked by final PnL.
+        """
+        data = self.fetch_data()
+        if data is None:
+            return None
+        print(f"🧮 Running {self.config['PAIR']} parameter sweep...")
+        return run_sweep(data, self.config, grid, processes=processes)
+
+    def run_monte_carlo(self, n_paths=10_000, n_bars=720, method='bootstrap', processes=1, seed=None):
+        """
+        Runs the strategy over synthetic continuations of the fetched history to show the
+        spread of outcomes instead of a single path.
+
+        :param method: 'bootstrap' (resampled blocks of real hours) or 'gbm'.
+        :return: (per-path results, distribution summary), or None without data.
+        """
+        data = self.fetch_data()
+        if data is None:
+            return None
+        print(f"🎲 Simulating {n_paths:,} {method} paths of {n_bars} hours for {self.config['PAIR']}...")
+        paths = run_monte_carlo(data, self.config, n_paths=n_paths, n_bars=n_bars, method=method,
+                                seed=seed, processes=processes)
+        return paths, summarize_paths(paths)
+
+    def run_walk_forward(self, grid, days=730, train_days=90, n_folds=24, objective='final_pnl', processes=None):
+        """
+        Walk-forward optimization: on each fold the best grid configuration of the
+        `train_days` window is scored on the window that follows it.
+
+        :param grid: A dict of parameter -> list of values, or a list of config overrides.
+        :return: (per-fold table, stitched out-of-sample equity curve), or None without data.
+        """
+        data = self.fetch_data(days=days)
+        if data is None:
+            return None
+        print(f"🚶 Running {self.config['PAIR']} walk-forward optimization over {n_folds} folds...")
+        return run_walk_forward(data, self.config, grid, train_bars=train_days * 24, n_folds=n_folds,
+                                objective=objective, processes=processes)
 
 
 if __name__ == '__main__':
@@ -172,8 +385,55 @@ if __name__ == '__main__':
         "INVESTMENT_PERCENT": 0.5, 
         "LOOKBACK_PERIOD_HOURS": 2,
         "VOLATILITY_MULTIPLIER": 1.5,
-        "FEE_ESTIMATE_SCALAR": 0.1 
+        "FEE_ESTIMATE_SCALAR": 0.1,
+        "POSITION_MODEL": "concentrated",
+        # Per-bar results file (.csv, .parquet or .arrow); None keeps them in memory only.
+        "RESULTS_FILE": os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'results', 'wbnb_usdt_backtest.csv'),
+        # Engine state after the last processed candle; with RESUME a run only processes newer candles.
+        "CHECKPOINT_FILE": os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'checkpoints', 'wbnb_usdt_backtest.json'),
+        "CHECKPOINT_EVERY": 10_000, # Also checkpoint every n bars of a long run
+        "RESUME": False,
+        "CONSOLE_VIEW": "events", # "all" prints every bar, "events" only entries/exits, "none" nothing
+        "INTRABAR_RESOLUTION": "close" # "high_low" or "1m" to exit on intrabar range breaches
     }
 
+    # Set to a grid (parameter -> list of values) to rank every combination instead of a single run.
+    sweep_grid = None
+
+    # --- Optional Monte Carlo ---
+    # Set to e.g. {"n_paths": 10_000, "n_bars": 720, "method": "bootstrap"} to see the
+    # distribution of PnL, IL and drawdown over synthetic paths instead of a single run.
+    monte_carlo = None
+
+    # --- Optional Walk-Forward Optimization ---
+    # Set to a grid to pick the parameters on each 90-day window and score them on the next one.
+    walk_forward_grid = None
+    # walk_forward_grid = {
+    #     "VOLATILITY_MULTIPLIER": [1.0, 1.5, 2.0, 2.5],
+    #     "LOOKBACK_PERIOD_HOURS": [2, 4, 8, 24],
+    # }
+
     engine = BacktestEngine(simulation_config)
-    engine.run()
\ No newline at end of file
+    if sweep_grid:
+        results = engine.run_sweep(sweep_grid)
+        if results is not None:
+            print(results.head(20).to_string(index=False))
+    elif walk_forward_grid:
+        results = engine.run_walk_forward(walk_forward_grid)
+        if results is not None:
+            folds, equity = results
+            print(folds.to_string(index=False))
+            if len(equity):
+                print(f"\n📊 Out-of-sample PnL: ${equity.iloc[-1] - simulation_config['SIMULATION_CAPITAL_USD']:,.2f}")
+    elif monte_carlo:
+        results = engine.run_monte_carlo(**monte_carlo)
+        if results is not None:
+            print(results[1].to_string())
+    elif simulation_config["INTRABAR_RESOLUTION"] != "close":
+        results = engine.run_vectorized()
+        if results is not None:
+            exits = results[results['status'] == "EXITED POSITION"]
+            print(exits.to_string(index=False))
+            print(f"\n📊 {len(exits)} range breaches over {len(results):,} hours")
+    else:
+        engine.run()
\ No newline at end of file
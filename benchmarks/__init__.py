@@ -0,0 +1,4 @@
+# benchmarks/__init__.py
+"""
+Speed benchmarks for the strategy and analytics hot paths, see ``bench.py``.
+"""
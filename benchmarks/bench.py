@@ -0,0 +1,396 @@
+# benchmarks/bench.py
+"""
+Benchmark suite for the strategy and analytics hot paths.
+
+    python benchmarks/bench.py run [--scale 0.1] [--only NAME ...] [--compare]
+    python benchmarks/bench.py compare [--threshold 0.10] [--baseline -2] [--candidate -1]
+    python benchmarks/bench.py list
+
+`run` times every benchmark on deterministic synthetic data (see synthetic.py) and
+appends the timings to a JSON history file. `compare` checks the latest run against an
+earlier one at the same scale and exits with status 1 when any benchmark got slower
+than the threshold allows, so it can gate a cron job or CI step. Benchmarks whose
+script needs a package that is not installed are reported as skipped.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+from benchmarks.synthetic import SyntheticExchange, make_ohlcv, make_trades, synthetic_slot0_provider
+
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, 'data', 'benchmarks', 'history.json')
+DEFAULT_THRESHOLD = 0.10  # 10% slower than the baseline fails `compare`
+
+ENGINE_CONFIG = {
+    "PAIR": "ETH/USDT",
+    "FEE_TIER": 0.0005,
+    "SIMULATION_CAPITAL_USD": 1000.0,
+    "INVESTMENT_PERCENT": 0.5,
+    "LOOKBACK_PERIOD_HOURS": 2,
+    "VOLATILITY_MULTIPLIER": 1.5,
+    "FEE_ESTIMATE_SCALAR": 0.1,
+    "POSITION_MODEL": "concentrated",
+}
+
+# name -> (setup function, repeats). A setup takes the scale and returns (callable, size).
+BENCHMARKS = {}
+
+
+def benchmark(name, repeats=3):
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeats)
+        return setup
+    return register
+
+
+def load_script(relative_path, module_name):
+    """
+    Imports one of the repository's scripts by path (their folders are not packages).
+    The import runs in a temporary directory so log files the scripts open at import
+    time do not end up in the working tree.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.dirname(spec.origin))  # for the script's own sibling imports
+    cwd = os.getcwd()
+    try:
+        os.chdir(tempfile.gettempdir())
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(os.path.dirname(spec.origin))
+    sys.modules[module_name] = module
+    return module
+
+
+_trades_cache = {}
+
+
+def _trades(scale):
+    """The ~3M-row trades table, prepared the way Clustering_entire_data.py prepares it."""
+    n_rows = int(3_000_000 * scale)
+    if n_rows not in _trades_cache:
+        df = make_trades(n_rows, n_accounts=max(50, int(5_000 * scale)))
+        df = df.sort_values(['Account', 'Timestamp IST'])
+        df['Cumulative PnL'] = df.groupby('Account')['Closed PnL'].cumsum()
+        df['Month'] = df['Timestamp IST'].dt.to_period('M')
+        _trades_cache[n_rows] = df
+    return _trades_cache[n_rows]
+
+
+# --- Strategy ---
+
+@benchmark('backtest_engine_run', repeats=1)
+def _backtest_engine_run(scale):
+    module = load_script('ETH_USDT in pancake/Backtesting2.py', 'bench_backtesting2')
+    data = make_ohlcv(int(1_000_000 * scale))
+
+    def run():
+        with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+            engine = module.BacktestEngine(dict(ENGINE_CONFIG))
+            engine.fetch_data = lambda *args, **kwargs: data
+            engine.run()
+    return run, len(data)
+
+
+@benchmark('backtest_kernel')
+def _backtest_kernel(scale):
+    from common.backtest_kernel import run_backtest_kernel
+    data = make_ohlcv(int(1_000_000 * scale))
+    close = data['close'].to_numpy()
+    volume = data['volume'].to_numpy()
+    return (lambda: run_backtest_kernel(close, volume, ENGINE_CONFIG)), len(data)
+
+
+@benchmark('backtest_kernel_intrabar_1m')
+def _backtest_kernel_intrabar(scale):
+    from common.backtest_kernel import run_backtest_kernel
+    from common.intrabar import IntrabarSeries
+    # A year of 1m candles and the hourly candles built from them.
+    minutes = make_ohlcv(int(525_600 * scale) // 60 * 60, freq='min')
+    grouped = minutes.groupby(minutes['timestamp'].dt.floor('h'))
+    hourly = grouped.agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'),
+                         close=('close', 'last'), volume=('volume', 'sum')).reset_index()
+
+    def run():
+        intrabar = IntrabarSeries.from_minutes(hourly, minutes)
+        run_backtest_kernel(hourly['close'].to_numpy(), hourly['volume'].to_numpy(), ENGINE_CONFIG, intrabar=intrabar)
+    return run, len(minutes)
+
+
+@benchmark('ohlcv_download_concurrent', repeats=1)
+def _ohlcv_download(scale):
+    from common.ohlcv_downloader import TokenBucket, download_ohlcv
+    # Six months of 1m candles from an exchange answering in 50 ms, 100 requests/s allowed.
+    exchange = SyntheticExchange(int(259_200 * scale), latency=0.05)
+    start, end = int(exchange.timestamps[0]), int(exchange.timestamps[-1]) + 60_000
+    return (lambda: download_ohlcv(exchange, 'ETH/USDT', '1m', start, end, limiter=TokenBucket(100))), len(exchange.timestamps)
+
+
+# slot0() of the WETH/USDT pool (as in config.KNOWN_POOLS), read through a provider that
+# answers locally, so the timings are the client-side CPU cost of one price read.
+_POOL = {'pool_address': '0x11b815efb8f581194ae79006d24e0d814b7697f6',
+         'token0': {'symbol': 'WETH', 'decimals': 18}, 'token1': {'symbol': 'USDT', 'decimals': 6}}
+_SLOT0_ABI = [{"inputs": [], "name": "slot0", "stateMutability": "view", "type": "function", "outputs": [
+    {"type": "uint160", "name": "sqrtPriceX96"}, {"type": "int24", "name": "tick"},
+    {"type": "uint16", "name": "observationIndex"}, {"type": "uint16", "name": "observationCardinality"},
+    {"type": "uint16", "name": "observationCardinalityNext"}, {"type": "uint8", "name": "feeProtocol"},
+    {"type": "bool", "name": "unlocked"}]}]
+
+
+@benchmark('onchain_price_contract_call', repeats=1)
+def _onchain_price_contract_call(scale):
+    """The previous `get_onchain_price` hot path: checksum, contract build, slot0().call()."""
+    from web3 import Web3
+    w3 = Web3(synthetic_slot0_provider(4_000_000_000_000_000_000_000_000))
+    n = int(1_000 * scale)
+
+    def run():
+        for _ in range(n):
+            contract = w3.eth.contract(address=w3.to_checksum_address(_POOL['pool_address']), abi=_SLOT0_ABI)
+            contract.functions.slot0().call(block_identifier='latest')
+    return run, n
+
+
+@benchmark('onchain_price_registry')
+def _onchain_price_registry(scale):
+    """The same read from a prebuilt `RegisteredPool`: one raw eth_call, bytes decoded directly."""
+    from web3 import Web3
+    sys.path.append(os.path.join(REPO_ROOT, 'Liquidity Bot'))
+    from core.pool_registry import RegisteredPool
+    w3 = Web3(synthetic_slot0_provider(4_000_000_000_000_000_000_000_000))
+    pool = RegisteredPool('ethereum', 'WETH/USDT', _POOL)
+    n = int(20_000 * scale)
+
+    def run():
+        for _ in range(n):
+            pool.read_price(w3)
+    return run, n
+
+
+@benchmark('monthly_profit_dynamic_range')
+def _monthly_profit(scale):
+    module = load_script('Strategy_validation/Backtesting.py', 'bench_strategy_backtesting')
+    data = make_ohlcv(int(1_000_000 * scale))
+    return (lambda: module.calculate_profit_with_dynamic_range(data)), len(data)
+
+
+@benchmark('il_fee_helpers_scalar')
+def _il_fee_helpers_scalar(scale):
+    """The per-bar `_calculate_il` / `_estimate_fees` calls `BacktestEngine.run` makes."""
+    module = load_script('ETH_USDT in pancake/Backtesting2.py', 'bench_backtesting2')
+    with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+        engine = module.BacktestEngine(dict(ENGINE_CONFIG))
+    engine.in_position = True
+    engine.entry_price = 3000.0
+    engine.price_range_min, engine.price_range_max = 2900.0, 3100.0
+    engine.liquidity = module.lp_math.liquidity_for_capital(500.0, 3000.0, 2900.0, 3100.0)
+    prices = (2900.0 + 200.0 * np.random.default_rng(0).random(int(100_000 * scale))).tolist()
+
+    def run():
+        for price in prices:
+            engine._calculate_il(price)
+            engine._estimate_fees(500.0, 1000.0, price)
+    return run, len(prices)
+
+
+@benchmark('il_fee_helpers_vectorized')
+def _il_fee_helpers_vectorized(scale):
+    from common import lp_math
+    rng = np.random.default_rng(0)
+    n = int(1_000_000 * scale)
+    price = 3000.0 * np.exp(rng.normal(0, 0.02, n))
+    lower, upper = price * 0.97, price * 1.03
+
+    def run():
+        liquidity = lp_math.liquidity_for_capital(500.0, price, lower, upper)
+        lp_math.position_value(liquidity, price * 1.01, lower, upper)
+        lp_math.concentrated_il(price, price * 1.01, lower, upper)
+    return run, n
+
+
+# --- Analytics ---
+
+@benchmark('cluster_traders_large', repeats=1)
+def _cluster_traders_large(scale):
+    module = load_script('Clustering_entire_data.py', 'bench_clustering')
+    df = _trades(scale)
+    return (lambda: module.cluster_traders_large(df, n_clusters=7, batch_size=100)), len(df)
+
+
+@benchmark('drawdown_per_account', repeats=1)
+def _drawdown_per_account(scale):
+    module = load_script('drawdown.py', 'bench_drawdown')
+    df = _trades(scale)
+    accounts = df['Account'].unique()[:max(10, int(200 * scale))]
+
+    def run():
+        for account in accounts:
+            module.account_drawdown(df, account)
+    return run, len(accounts)
+
+
+# --- Running and history ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(names, scale):
+    results, skipped = {}, {}
+    for name in names:
+        setup, repeats = BENCHMARKS[name]
+        try:
+            func, size = setup(scale)
+        except ImportError as e:
+            skipped[name] = f"missing dependency: {e.name or e}"
+            print(f"⏭️  {name:<30} skipped ({skipped[name]})")
+            continue
+
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            'seconds': min(timings),
+            'median_seconds': float(np.median(timings)),
+            'repeats': repeats,
+            'size': size,
+        }
+        print(f"⏱️  {name:<30} {min(timings):>9.3f}s  (size {size:,}, best of {repeats})")
+    return results, skipped
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_history(path, history):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as handle:
+        json.dump(history, handle, indent=2)
+    os.replace(temp_path, path)
+
+
+def compare_runs(history, threshold=DEFAULT_THRESHOLD, baseline=None, candidate=-1):
+    """
+    Prints the timing change of every benchmark between two runs of the history and
+    returns the names of those that slowed down by more than `threshold`.
+    By default the candidate is the latest run and the baseline the previous run at the
+    same scale.
+    """
+    if len(history) < 2:
+        print("ℹ️ Need at least two runs in the history to compare.")
+        return []
+    candidate_index = candidate % len(history)
+    new = history[candidate_index]
+    if baseline is None:
+        earlier = [k for k in range(candidate_index) if history[k]['scale'] == new['scale']]
+        if not earlier:
+            print(f"ℹ️ No earlier run at scale {new['scale']} to compare with.")
+            return []
+        baseline = earlier[-1]
+    old = history[baseline]
+    if old['scale'] != new['scale']:
+        print(f"⚠️ Comparing runs at different scales ({old['scale']} vs {new['scale']}).")
+
+    print(f"Baseline : {old['timestamp']} ({old.get('commit') or 'unknown commit'})")
+    print(f"Candidate: {new['timestamp']} ({new.get('commit') or 'unknown commit'})")
+    regressions = []
+    for name, result in new['results'].items():
+        if name not in old['results']:
+            print(f"🆕 {name:<30} {result['seconds']:>9.3f}s")
+            continue
+        before, after = old['results'][name]['seconds'], result['seconds']
+        change = after / before - 1 if before > 0 else 0.0
+        if change > threshold:
+            regressions.append(name)
+            marker = '❌'
+        else:
+            marker = '✅'
+        print(f"{marker} {name:<30} {before:>9.3f}s -> {after:>9.3f}s  ({change:+.1%})")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) slower than the {threshold:.0%} threshold: {', '.join(regressions)}")
+    else:
+        print(f"\n✅ No benchmark slower than the {threshold:.0%} threshold.")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks and record the timings')
+    run_parser.add_argument('--scale', type=float, default=1.0, help='data size factor (0.1 for a quick run)')
+    run_parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    run_parser.add_argument('--compare', action='store_true', help='compare with the previous run afterwards')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    compare_parser = commands.add_parser('compare', help='compare two recorded runs')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='allowed slowdown as a fraction (0.10 = 10%%)')
+    compare_parser.add_argument('--baseline', type=int, default=None, help='history index of the baseline run')
+    compare_parser.add_argument('--candidate', type=int, default=-1, help='history index of the candidate run')
+
+    commands.add_parser('list', help='list the benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name, (_, repeats) in BENCHMARKS.items():
+            print(f"{name:<30} best of {repeats}")
+        return 0
+
+    history = load_history(args.history)
+    if args.command == 'run':
+        names = args.only or list(BENCHMARKS)
+        print(f"🏁 Running {len(names)} benchmark(s) at scale {args.scale}...")
+        # The analytics scripts log every batch at INFO; keep the console readable.
+        logging.disable(logging.INFO)
+        results, skipped = run_benchmarks(names, args.scale)
+        history.append({
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'scale': args.scale,
+            'results': results,
+            'skipped': skipped,
+        })
+        save_history(args.history, history)
+        print(f"💾 Saved to {args.history}")
+        if not args.compare:
+            return 0
+
+    regressions = compare_runs(history, args.threshold, getattr(args, 'baseline', None), getattr(args, 'candidate', -1))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# benchmarks/synthetic.py
+"""
+Deterministic synthetic data for the benchmarks. The same arguments always give the
+same frame, so timings of different runs are comparable. `SyntheticExchange` serves such
+candles through a ccxt-style `fetch_ohlcv` for the download benchmarks, and
+`synthetic_slot0_provider` answers slot0 eth_calls for the on-chain price benchmarks.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+COINS = np.array(['BTC', 'ETH', 'SOL', 'HYPE', 'DOGE', 'ARB', 'AVAX', 'LINK'])
+_BASE_PRICES = np.array([60_000.0, 3_000.0, 150.0, 20.0, 0.15, 1.1, 35.0, 15.0])
+
+
+def make_ohlcv(n_bars, seed=0, start='2020-01-01', freq='h', start_price=3000.0):
+    """Hourly OHLCV candles as returned by `CandleStore.to_frame` (plus a `time` column)."""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.004, n_bars)))
+    open_ = np.r_[start_price, close[:-1]]
+    wick = np.abs(rng.normal(0, 0.002, (2, n_bars)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    volume = rng.gamma(2.0, 500.0, n_bars)
+    timestamp = pd.date_range(start, periods=n_bars, freq=freq)
+    return pd.DataFrame({
+        'timestamp': timestamp,
+        'time': timestamp,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+    })
+
+
+def make_trades(n_rows, n_accounts=5_000, seed=0, start='2024-01-01', days=180):
+    """
+    A trades table shaped like `simple_straight.csv` (Hyperliquid fills), already parsed
+    the way the analytics scripts parse it: `Closed PnL` as float, `Timestamp IST` as
+    datetime. Roughly 40% of the fills are openings with no closed PnL.
+    """
+    rng = np.random.default_rng(seed)
+    words = rng.integers(0, 2 ** 63, (n_accounts, 3))
+    accounts = np.array([f"0x{a:016x}{b:016x}{c % 2 ** 32:08x}" for a, b, c in words])
+    # A few very active accounts and a long tail, as in the real export.
+    weights = rng.pareto(1.2, n_accounts) + 1
+    account_index = rng.choice(n_accounts, size=n_rows, p=weights / weights.sum())
+    coin_index = rng.integers(0, len(COINS), n_rows)
+
+    price = _BASE_PRICES[coin_index] * np.exp(rng.normal(0, 0.05, n_rows))
+    size_usd = np.round(rng.lognormal(6, 1.5, n_rows), 2)
+    side = np.where(rng.random(n_rows) < 0.5, 'B', 'A')
+    opening = rng.random(n_rows) < 0.4
+    closed_pnl = np.where(opening, 0.0, np.round(size_usd * rng.normal(0.002, 0.03, n_rows), 6))
+    direction = np.where(opening, np.where(side == 'B', 'Open Long', 'Open Short'),
+                         np.where(side == 'B', 'Close Short', 'Close Long'))
+    seconds = np.sort(rng.integers(0, days * 86_400, n_rows))
+    timestamp_ist = pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s')
+
+    return pd.DataFrame({
+        'Account': accounts[account_index],
+        'Coin': COINS[coin_index],
+        'Execution Price': price,
+        'Size Tokens': size_usd / price,
+        'Size USD': size_usd,
+        'Side': side,
+        'Timestamp IST': timestamp_ist,
+        'Start Position': np.round(rng.normal(0, 10, n_rows), 4),
+        'Direction': direction,
+        'Closed PnL': closed_pnl,
+        'Fee': np.round(size_usd * 0.00035, 6),
+        'Timestamp': (seconds + int(pd.Timestamp(start).timestamp())) * 1000,
+    })
+
+
+class SyntheticExchange:
+    """
+    A local stand-in for a ccxt exchange serving `make_ohlcv` candles through
+    `fetch_ohlcv`, with a fixed latency per request and optionally failing requests.
+
+    :param latency: Seconds every request takes.
+    :param fail_every: Every n-th request raises an error (0 = never).
+    """
+
+    def __init__(self, n_bars, timeframe='1m', latency=0.05, fail_every=0, rate_limit=50, seed=0,
+                 exchange_id='synthetic'):
+        freq = {'1m': 'min', '1h': 'h'}[timeframe]
+        candles = make_ohlcv(n_bars, seed=seed, freq=freq)
+        timestamps = candles['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+        self.timeframe = timeframe
+        self.timestamps = timestamps
+        self.rows = np.column_stack([timestamps, candles[['open', 'high', 'low', 'close', 'volume']].to_numpy()])
+        self.latency = latency
+        self.fail_every = fail_every
+        self.rateLimit = rate_limit
+        self.id = exchange_id
+        self.requests = 0
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=1000):
+        self.requests += 1
+        if self.fail_every and self.requests % self.fail_every == 0:
+            raise ConnectionError("synthetic request failure")
+        time.sleep(self.latency)
+        start = 0 if since is None else int(np.searchsorted(self.timestamps, since, side='left'))
+        return [[int(row[0])] + row[1:].tolist() for row in self.rows[start:start + limit]]
+
+
+def synthetic_slot0_provider(sqrt_price_x96, tick=0):
+    """
+    A web3 provider answering every eth_call with the same slot0() return data, so
+    price reads can be timed without a node. Needs web3 (raises ImportError otherwise).
+    """
+    from web3.providers.base import BaseProvider
+
+    words = [sqrt_price_x96, tick % 2**256, 0, 1, 1, 0, 1]
+    result = '0x' + ''.join(f"{word:064x}" for word in words)
+
+    class SyntheticSlot0Provider(BaseProvider):
+        def make_request(self, method, params):
+            if method == 'eth_call':
+                return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+            if method == 'eth_chainId':
+                return {'jsonrpc': '2.0', 'id': 1, 'result': '0x1'}
+            return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32601, 'message': f"{method} not supported"}}
+
+        def is_connected(self, show_traceback=False):
+            return True
+
+    return SyntheticSlot0Provider()
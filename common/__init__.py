@@ -0,0 +1,7 @@
+# common/__init__.py
+"""
+Shared building blocks used by the backtesting, paper trading and live bot scripts.
+
+The strategy folders are run as plain scripts, so each of them puts the repository
+root on ``sys.path`` before importing from here.
+"""
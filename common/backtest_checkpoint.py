@@ -0,0 +1,73 @@
+# common/backtest_checkpoint.py
+"""
+Checkpoints of the PancakeSwap `BacktestEngine` state, so a run can resume where the
+previous one stopped instead of replaying the whole history.
+
+A checkpoint is a small JSON file with the engine's position and balance attributes,
+the timestamp of the last processed bar and the strategy parameters it was produced
+with. A checkpoint from different parameters is ignored, because its state would not
+match a replay under the new ones.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+# Engine attributes that carry over from one bar to the next.
+STATE_ATTRIBUTES = (
+    'balance_usd', 'in_position', 'entry_price', 'token0_amount', 'token1_amount', 'liquidity',
+    'initial_position_value', 'total_fees_earned', 'realized_pnl', 'price_range_min', 'price_range_max',
+)
+# Configuration keys that change the state a replay produces.
+STRATEGY_KEYS = (
+    'PAIR', 'FEE_TIER', 'SIMULATION_CAPITAL_USD', 'INVESTMENT_PERCENT', 'LOOKBACK_PERIOD_HOURS',
+    'VOLATILITY_MULTIPLIER', 'FEE_ESTIMATE_SCALAR', 'POSITION_MODEL',
+)
+
+
+def _strategy_params(config):
+    return {key: config.get(key) for key in STRATEGY_KEYS}
+
+
+def save_checkpoint(path, engine, last_timestamp):
+    """Writes the engine state after the bar at `last_timestamp` (atomically)."""
+    checkpoint = {
+        'last_timestamp': pd.Timestamp(last_timestamp).isoformat(),
+        'strategy': _strategy_params(engine.config),
+        'state': {attribute: getattr(engine, attribute) for attribute in STATE_ATTRIBUTES},
+    }
+    checkpoint['state'] = {key: (bool(value) if key == 'in_position' else float(value))
+                           for key, value in checkpoint['state'].items()}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, config):
+    """
+    Returns (state, last_timestamp) from the checkpoint at `path`, or None when there is
+    no usable checkpoint (missing, unreadable, or written under other strategy parameters).
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+        state = {attribute: checkpoint['state'][attribute] for attribute in STATE_ATTRIBUTES}
+        last_timestamp = pd.Timestamp(checkpoint['last_timestamp'])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if checkpoint.get('strategy') != _strategy_params(config):
+        print(f"⚠️ Checkpoint {path} was written with other strategy parameters; replaying from the start.")
+        return None
+    return state, last_timestamp
+
+
+def restore_checkpoint(engine, state):
+    """Sets the checkpointed attributes on `engine`."""
+    for attribute, value in state.items():
+        setattr(engine, attribute, value)
@@ -0,0 +1,343 @@
+# common/backtest_kernel.py
+"""
+Array-backed kernel for the dynamic-range strategy used by the PancakeSwap backtests.
+
+It runs the same enter / hold / exit state machine as ``BacktestEngine.run`` over plain
+NumPy arrays. Range bounds are precomputed for every bar, the exit of every possible
+entry is found with vectorized scans, and only the per-trade bookkeeping (compounding
+the balance) is done in Python, so the cost grows with the number of trades instead of
+the number of bars. Every value is computed with the same floating point operations as
+the engine, so the results match it exactly.
+
+With an `IntrabarSeries` (see common/intrabar.py) held hours are tested against their
+low / high instead of the close, and exits are priced at the breach point.
+"""
+
+import numpy as np
+
+from common.lp_math import (POSITION_MODEL_CONCENTRATED, POSITION_MODEL_FIFTY_FIFTY, concentrated_il,
+                            position_value as lp_position_value, token_amounts)
+from common.range_model import bounds_series
+
+# --- Per-bar status codes (index into STATUS_LABELS) ---
+STATUS_OUT_OF_POSITION = 0
+STATUS_POSITION_OPENED = 1
+STATUS_IN_RANGE = 2
+STATUS_EXITED = 3
+STATUS_LABELS = np.array(
+    ["OUT OF POSITION", "POSITION OPENED", "IN RANGE (ACTIVE)", "EXITED POSITION"], dtype=object
+)
+
+# Once only this many scans are still unresolved, they are finished one by one.
+_SCALAR_CUTOFF = 32
+# Same fallback as `BacktestEngine`: 1% of the mean when the lookback has no volatility.
+FALLBACK_STD_PCT = 0.01
+
+
+def _scan_for_exit(low, high, range_min, range_max, start):
+    """Finds the first bar at or after `start` trading outside the range, in growing blocks."""
+    n = len(low)
+    block = 64
+    while start < n:
+        outside = ~((range_min <= low[start:start + block]) & (high[start:start + block] <= range_max))
+        if outside.any():
+            return start + int(outside.argmax())
+        start += block
+        block *= 2
+    return n
+
+
+def find_exits(close, lower, upper, entries, low=None, high=None):
+    """
+    For every candidate entry bar, returns the first later bar whose close is outside
+    the range fixed at entry, or len(close) if the position would still be open at the end.
+    With `low` / `high`, a bar whose low or high is outside the range ends the position.
+    """
+    low = close if low is None else low
+    high = close if high is None else high
+    n = len(close)
+    exits = np.full(len(entries), n, dtype=np.int64)
+    range_min = lower[entries]
+    range_max = upper[entries]
+
+    # Advance all unresolved entries one bar at a time; most positions exit within a few bars.
+    active = np.arange(len(entries))
+    offset = 1
+    while active.size > _SCALAR_CUTOFF:
+        bars = entries[active] + offset
+        alive = bars < n
+        active, bars = active[alive], bars[alive]
+        price_low = low[bars]
+        price_high = price_low if high is low else high[bars]
+        outside = ~((range_min[active] <= price_low) & (price_high <= range_max[active]))
+        exits[active[outside]] = bars[outside]
+        active = active[~outside]
+        offset += 1
+
+    # The long tail is cheaper to finish with per-entry block scans.
+    for k in active:
+        exits[k] = _scan_for_exit(low, high, range_min[k], range_max[k], entries[k] + offset)
+    return exits
+
+
+def _segmented_cumsum(values, starts, lengths):
+    """
+    Running sums that restart at every segment, accumulated bar by bar in the same order
+    as the engine's `total_fees_earned += fees`. Returns an array aligned with `values`.
+    """
+    out = np.zeros(len(values))
+    order = np.argsort(-lengths, kind='stable')
+    seg_starts = starts[order]
+    seg_lengths = lengths[order]
+    neg_lengths = -seg_lengths
+    running = np.zeros(len(seg_starts))
+
+    step = 0
+    while True:
+        # Segments are sorted by length, so the ones still running are always a prefix.
+        count = int(np.searchsorted(neg_lengths, -step, side='left'))
+        if count <= _SCALAR_CUTOFF:
+            break
+        bars = seg_starts[:count] + step
+        running[:count] += values[bars]
+        out[bars] = running[:count]
+        step += 1
+
+    for j in range(count):
+        bars = slice(seg_starts[j] + step, seg_starts[j] + seg_lengths[j])
+        out[bars] = np.cumsum(np.concatenate(([running[j]], values[bars])))[1:]
+    return out
+
+
+def run_backtest_kernel(close, volume, config, intrabar=None):
+    """
+    Runs the dynamic-range strategy over arrays of hourly closes and volumes.
+
+    :param close: Close prices, one per bar.
+    :param volume: Base-asset volumes, one per bar.
+    :param config: The same configuration dict used by `BacktestEngine`. `POSITION_MODEL`
+                   selects concentrated Uniswap V3 math or the legacy 50/50 split.
+    :param intrabar: Optional `IntrabarSeries` aligned with `close`. Held hours then exit
+                     on their low / high and at the breach price instead of the close.
+    :return: A dict of per-bar arrays for every scored bar (`bar_index`, `status`,
+             `price`, `position_value`, `il_percent`, `fees`, `total_pnl`, `range_min`,
+             `range_max`), the `entry_bars` / `exit_bars` of every trade (plus the
+             `exit_prices` and, with `intrabar`, the `exit_times` of the closed ones) and
+             the final engine `state`.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    n = len(close)
+    lookback = config['LOOKBACK_PERIOD_HOURS']
+    fee_tier = config['FEE_TIER']
+    fee_scalar = config['FEE_ESTIMATE_SCALAR']
+    investment_percent = config['INVESTMENT_PERCENT']
+    concentrated = config.get('POSITION_MODEL', POSITION_MODEL_FIFTY_FIFTY) == POSITION_MODEL_CONCENTRATED
+
+    lower, upper = bounds_series(close, lookback, config['VOLATILITY_MULTIPLIER'],
+                                 ddof=1, fallback_std_pct=FALLBACK_STD_PCT)
+
+    # --- 1. Resolve the exit of every bar where an entry would be allowed ---
+    candidates = np.flatnonzero((lower <= close) & (close <= upper))
+    if intrabar is None:
+        exits = find_exits(close, lower, upper, candidates)
+    else:
+        exits = find_exits(close, lower, upper, candidates, low=intrabar.low, high=intrabar.high)
+
+    next_candidate = np.full(n + 1, n, dtype=np.int64)
+    next_candidate[candidates] = candidates
+    next_candidate = np.minimum.accumulate(next_candidate[::-1])[::-1]
+    exit_of = np.full(n, n, dtype=np.int64)
+    exit_of[candidates] = exits
+
+    # --- 2. Chain the trades that are actually taken ---
+    next_list = next_candidate.tolist()
+    exit_list = exit_of.tolist()
+    entry_bars, exit_bars = [], []
+    bar = next_list[lookback] if lookback < n else n
+    while bar < n:
+        exit_bar = exit_list[bar]
+        entry_bars.append(bar)
+        exit_bars.append(exit_bar)
+        if exit_bar >= n:
+            break
+        bar = next_list[exit_bar + 1]
+
+    # --- 3. Compound the balance trade by trade ---
+    close_list = close.tolist()
+    entry_bars = np.array(entry_bars, dtype=np.int64)
+    exit_bars = np.array(exit_bars, dtype=np.int64)
+    trade_min, trade_max = lower[entry_bars], upper[entry_bars]
+    exit_price = close[np.minimum(exit_bars, n - 1)]
+    exit_times = None
+    if intrabar is not None:
+        closed = exit_bars < n
+        breach_price, exit_times = intrabar.breach(exit_bars[closed], trade_min[closed], trade_max[closed])
+        exit_price[closed] = breach_price
+    exit_price_list = exit_price.tolist()
+    if concentrated:
+        # Per unit of liquidity, the deposit value and the token amounts at entry and exit
+        # only depend on prices and the range, so they are computed for all trades at once.
+        unit_deposit = lp_position_value(1.0, close[entry_bars], trade_min, trade_max).tolist()
+        entry_units = [units.tolist() for units in token_amounts(1.0, close[entry_bars], trade_min, trade_max)]
+        exit_units = [units.tolist() for units in token_amounts(1.0, exit_price, trade_min, trade_max)]
+
+    balance = config['SIMULATION_CAPITAL_USD']
+    investments, liquidities, token0_amounts, token1_amounts, final_values = [], [], [], [], []
+    for k, (entry_bar, exit_bar) in enumerate(zip(entry_bars.tolist(), exit_bars.tolist())):
+        investment_amount = balance * investment_percent
+        balance -= investment_amount
+        if concentrated:
+            liquidity = investment_amount / unit_deposit[k]
+            token0_amount = liquidity * entry_units[0][k]
+            token1_amount = liquidity * entry_units[1][k]
+        else:
+            liquidity = 0.0
+            token1_amount = investment_amount / 2
+            token0_amount = (investment_amount / 2) / close_list[entry_bar]
+        investments.append(investment_amount)
+        liquidities.append(liquidity)
+        token0_amounts.append(token0_amount)
+        token1_amounts.append(token1_amount)
+        if exit_bar < n:
+            if concentrated:
+                final_value = ((liquidity * exit_units[0][k]) * exit_price_list[k]) + (liquidity * exit_units[1][k])
+            else:
+                final_value = (token0_amount * exit_price_list[k]) + token1_amount
+            balance += final_value
+            final_values.append(final_value)
+
+    investments = np.array(investments)
+    liquidities = np.array(liquidities)
+    token0_amounts = np.array(token0_amounts)
+    token1_amounts = np.array(token1_amounts)
+
+    # --- 4. Value every bar held in range ---
+    status = np.full(n, STATUS_OUT_OF_POSITION, dtype=np.int8)
+    position_value = np.zeros(n)
+    il_percent = np.zeros(n)
+    fees = np.zeros(n)
+    total_pnl = np.zeros(n)
+    range_source = np.arange(n)
+
+    hold_starts = entry_bars + 1
+    hold_lengths = exit_bars - hold_starts
+    trade_of_bar = np.repeat(np.arange(len(entry_bars)), hold_lengths)
+    held = (np.arange(len(trade_of_bar))
+            - np.repeat(np.cumsum(hold_lengths) - hold_lengths, hold_lengths)
+            + np.repeat(hold_starts, hold_lengths))
+
+    price = close[held]
+    entry_price = close[entry_bars][trade_of_bar]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if concentrated:
+            held_min, held_max = lower[entry_bars][trade_of_bar], upper[entry_bars][trade_of_bar]
+            value = lp_position_value(liquidities[trade_of_bar], price, held_min, held_max)
+            il = concentrated_il(entry_price, price, held_min, held_max) * 100
+        else:
+            value = (token0_amounts[trade_of_bar] * price) + token1_amounts[trade_of_bar]
+            price_ratio = price / entry_price
+            il = ((2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1) * 100
+            il = np.where(entry_price == 0, 0.0, il)
+        hourly_volume_usd = volume[held] * price
+        estimated_fees = (hourly_volume_usd * fee_tier) * (value / hourly_volume_usd) * fee_scalar
+        bar_fees = np.where(hourly_volume_usd == 0, 0.0, np.minimum(estimated_fees, value * 0.001))
+
+    status[held] = STATUS_IN_RANGE
+    position_value[held] = value
+    il_percent[held] = il
+    fees[held] = bar_fees
+    running_fees = _segmented_cumsum(fees, hold_starts, hold_lengths)
+    total_pnl[held] = (value - investments[trade_of_bar]) + running_fees[held]
+    range_source[held] = entry_bars[trade_of_bar]
+
+    # --- 5. Entry and exit bars ---
+    status[entry_bars] = STATUS_POSITION_OPENED
+    position_value[entry_bars] = investments
+
+    closed = exit_bars < n
+    closed_exits = exit_bars[closed]
+    bar_price = close.copy()
+    bar_price[closed_exits] = exit_price[closed]
+    fees_at_exit = np.where(hold_lengths[closed] > 0, running_fees[closed_exits - 1], 0.0)
+    status[closed_exits] = STATUS_EXITED
+    total_pnl[closed_exits] = (np.array(final_values) - investments[closed]) + fees_at_exit
+    range_source[closed_exits] = entry_bars[closed]
+
+    # --- 6. Final engine state, as `run` would leave it ---
+    state = {
+        'balance_usd': balance,
+        'in_position': bool(len(exit_bars) and exit_bars[-1] >= n),
+        'total_fees_earned': 0.0,
+    }
+    if len(entry_bars):
+        state.update({
+            'entry_price': close_list[entry_bars[-1]],
+            'token0_amount': float(token0_amounts[-1]),
+            'token1_amount': float(token1_amounts[-1]),
+            'initial_position_value': float(investments[-1]),
+            'liquidity': float(liquidities[-1]),
+        })
+        if state['in_position'] and hold_lengths[-1] > 0:
+            state['total_fees_earned'] = float(running_fees[n - 1])
+    # The range is recomputed on every bar spent out of position, so the last one wins.
+    searched = np.flatnonzero(status[lookback:] <= STATUS_POSITION_OPENED)
+    if len(searched):
+        last_search = lookback + searched[-1]
+        state['price_range_min'] = float(lower[last_search])
+        state['price_range_max'] = float(upper[last_search])
+
+    scored = slice(min(lookback, n), n)
+    return {
+        'bar_index': np.arange(n)[scored],
+        'status': status[scored],
+        'price': bar_price[scored],
+        'position_value': position_value[scored],
+        'il_percent': il_percent[scored],
+        'fees': fees[scored],
+        'total_pnl': total_pnl[scored],
+        'range_min': lower[range_source][scored],
+        'range_max': upper[range_source][scored],
+        'entry_bars': entry_bars,
+        'exit_bars': exit_bars,
+        'exit_prices': exit_price[closed],
+        'exit_times': exit_times,
+        'state': state,
+    }
+
+
+def equity_curve(result, config):
+    """
+    Equity at every scored bar: the starting capital plus the PnL of every closed trade
+    and the running PnL of the open one, which is what the engine reports as "Total PnL".
+    """
+    status = result['status']
+    total_pnl = result['total_pnl']
+    realized = np.cumsum(np.where(status == STATUS_EXITED, total_pnl, 0.0))
+    unrealized = np.where(status == STATUS_IN_RANGE, total_pnl, 0.0)
+    return config['SIMULATION_CAPITAL_USD'] + realized + unrealized
+
+
+def summarize_backtest(result, config):
+    """Condenses a kernel result into the headline numbers used to rank configurations."""
+    status = result['status']
+    exited = status == STATUS_EXITED
+    equity = equity_curve(result, config)
+
+    if len(equity):
+        drawdown = np.maximum.accumulate(equity) - equity
+        max_drawdown_usd = float(drawdown.max())
+        max_drawdown_pct = float((drawdown / np.maximum.accumulate(equity)).max() * 100)
+        final_pnl = float(equity[-1] - config['SIMULATION_CAPITAL_USD'])
+        active = (status == STATUS_IN_RANGE) | (status == STATUS_POSITION_OPENED)
+        in_range_pct = float(active.mean() * 100)
+    else:
+        max_drawdown_usd = max_drawdown_pct = final_pnl = in_range_pct = 0.0
+
+    return {
+        'final_pnl': final_pnl,
+        'in_range_pct': in_range_pct,
+        'rebalances': int(exited.sum()),
+        'max_drawdown_usd': max_drawdown_usd,
+        'max_drawdown_pct': max_drawdown_pct,
+    }
@@ -0,0 +1,165 @@
+# common/block_source.py
+"""
+New-block notifications for the live bots.
+
+The live loops read the pool price on a fixed timer, so a range exit is noticed up to a
+whole interval late, while most reads return a price from a block that was already seen.
+A `BlockWatcher` follows the chain head in a background thread instead and wakes its
+users once per new block. The head comes from a `newHeads` websocket subscription when
+the `websockets` package and a websocket URL are available. Otherwise, and while the
+websocket is down, it comes from polling `eth_blockNumber`.
+
+A block source is any iterable of block numbers. A local fake, such as a list or a
+generator that sleeps between blocks, can stand in for the chain.
+"""
+
+import json
+import threading
+import time
+
+DEFAULT_POLL_INTERVAL = 2.0
+# How long the polling fallback runs before the websocket is tried again.
+WEBSOCKET_RETRY_SECONDS = 60
+# A subscription that announces nothing for this long is treated as dropped.
+WEBSOCKET_IDLE_TIMEOUT = 60
+
+
+def poll_block_numbers(get_block_number, poll_interval=DEFAULT_POLL_INTERVAL, stop_event=None, duration=None):
+    """
+    Yields the chain head every time it moves, from one `get_block_number()` call (an
+    eth_blockNumber request) per poll.
+
+    :param duration: Stop after this many seconds; None polls until `stop_event` is set.
+    """
+    stop_event = stop_event or threading.Event()
+    deadline = None if duration is None else time.monotonic() + duration
+    last = None
+    while not stop_event.is_set():
+        try:
+            number = int(get_block_number())
+        except Exception as e:
+            print(f"⚠️ eth_blockNumber failed: {e}")
+        else:
+            if last is None or number > last:
+                last = number
+                yield number
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        stop_event.wait(poll_interval)
+
+
+def newheads_block_numbers(ws_url, idle_timeout=WEBSOCKET_IDLE_TIMEOUT):
+    """
+    Yields the number of every head announced by an `eth_subscribe('newHeads')`
+    subscription.
+
+    :raises ImportError: If the `websockets` package is not installed.
+    :raises ConnectionError: If the node rejects the subscription. A dropped connection
+                             raises the websocket library's own error.
+    """
+    from websockets.sync.client import connect
+
+    with connect(ws_url, open_timeout=idle_timeout) as ws:
+        ws.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+        reply = json.loads(ws.recv(idle_timeout))
+        if 'error' in reply:
+            raise ConnectionError(f"newHeads subscription rejected: {reply['error']}")
+        while True:
+            message = json.loads(ws.recv(idle_timeout))
+            head = (message.get('params') or {}).get('result') or {}
+            if 'number' in head:
+                yield int(head['number'], 16)
+
+
+def chain_head_source(ws_url=None, get_block_number=None, poll_interval=DEFAULT_POLL_INTERVAL, stop_event=None,
+                      retry_seconds=WEBSOCKET_RETRY_SECONDS):
+    """
+    Block numbers from `newHeads` when `ws_url` is given, falling back to polling
+    `get_block_number` while the websocket is unavailable. After a dropped subscription
+    the websocket is tried again every `retry_seconds`.
+    """
+    stop_event = stop_event or threading.Event()
+    if not ws_url and get_block_number is None:
+        raise ValueError("A websocket URL or a get_block_number function is required")
+    while not stop_event.is_set():
+        if ws_url:
+            try:
+                yield from newheads_block_numbers(ws_url)
+            except ImportError:
+                print("⚠️ The websockets package is not installed; polling eth_blockNumber for new blocks.")
+                ws_url = None
+            except Exception as e:
+                print(f"⚠️ newHeads subscription lost ({e}); polling eth_blockNumber for new blocks.")
+        if get_block_number is None:
+            stop_event.wait(retry_seconds)
+            continue
+        yield from poll_block_numbers(get_block_number, poll_interval, stop_event,
+                                      duration=retry_seconds if ws_url else None)
+
+
+class BlockWatcher:
+    """
+    Follows a block source in a daemon thread and keeps the newest block number.
+
+    Numbers that are not newer than the last one (repeats after a reconnect) are dropped,
+    and a consumer that is busy for several blocks only sees the newest one afterwards.
+
+    :param source: Iterable of block numbers, e.g. from `chain_head_source`.
+    :param name: Chain name used in messages.
+    """
+
+    def __init__(self, source, name='chain'):
+        self.source = source
+        self.name = name
+        self.block = None
+        self.blocks_seen = 0
+        self.stopped = False
+        self._condition = threading.Condition()
+        self._listeners = []
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name=f"blocks-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Wakes all waiters; the thread ends with the next block from the source."""
+        with self._condition:
+            self.stopped = True
+            self._condition.notify_all()
+
+    def subscribe(self, callback):
+        """Calls `callback(block_number)` from the watcher thread on every new block."""
+        self._listeners.append(callback)
+
+    def _follow(self):
+        try:
+            for number in self.source:
+                with self._condition:
+                    if self.stopped:
+                        break
+                    if self.block is not None and number <= self.block:
+                        continue
+                    self.block = number
+                    self.blocks_seen += 1
+                    self._condition.notify_all()
+                for callback in list(self._listeners):
+                    callback(number)
+        except Exception as e:
+            print(f"❌ {self.name}: block source failed: {e}")
+        finally:
+            self.stop()
+
+    def _newer(self, after):
+        return self.block is not None and (after is None or self.block > after)
+
+    def wait_for_block(self, after=None, timeout=None):
+        """
+        Waits for a block newer than `after` and returns the newest block number. Returns
+        None on timeout, or once the watcher stopped and no newer block is left.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.stopped or self._newer(after), timeout)
+            return self.block if self._newer(after) else None
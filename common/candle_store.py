@@ -0,0 +1,258 @@
+# common/candle_store.py
+"""
+Persistent local OHLCV store with incremental sync.
+
+Candles are kept per (exchange, symbol, timeframe) in a flat binary file of fixed-size
+records that is memory-mapped on read, so loading months of 1m candles costs a file
+map instead of hundreds of paged API calls. `sync` only asks the exchange for candles
+after the last stored one (refreshing that last, possibly still forming, candle) and
+backfills holes found inside the stored history.
+"""
+
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# One record per candle; timestamps are candle open times in milliseconds (UTC).
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+OHLCV_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+DEFAULT_STORE_DIR = os.environ.get(
+    'CANDLE_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'candles'),
+)
+
+_TIMEFRAME_UNITS_MS = {'s': 1_000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+
+
+def timeframe_to_ms(timeframe):
+    """Converts a ccxt timeframe string such as '1m', '4h' or '1d' to milliseconds."""
+    match = re.fullmatch(r'(\d+)([smhdw])', timeframe)
+    if not match:
+        raise ValueError(f"Unsupported timeframe '{timeframe}'")
+    return int(match.group(1)) * _TIMEFRAME_UNITS_MS[match.group(2)]
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class IncompleteDownload(RuntimeError):
+    """
+    A download that got only part of its span. `candles` holds what did arrive (ccxt-style
+    lists) and `failed_spans` the (start_ms, end_ms) spans that are still missing.
+    """
+
+    def __init__(self, message, candles, failed_spans):
+        super().__init__(message)
+        self.candles = candles
+        self.failed_spans = failed_spans
+
+
+def fetch_ohlcv_range(exchange, symbol, timeframe, start_ms, end_ms, limit=1000):
+    """
+    Pages through `exchange.fetch_ohlcv` from `start_ms` up to (excluding) `end_ms`.
+    Returns the raw candle lists in the order the exchange returned them.
+    """
+    candles = []
+    since = start_ms
+    while since < end_ms:
+        page = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        if not page:
+            break
+        candles.extend(candle for candle in page if candle[0] < end_ms)
+        last_timestamp = page[-1][0]
+        if last_timestamp < since:
+            break
+        since = last_timestamp + 1
+        time.sleep(exchange.rateLimit / 2000)
+    return candles
+
+
+def to_records(candles):
+    """Turns ccxt-style candle lists into a sorted, de-duplicated record array."""
+    if len(candles) == 0:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    raw = np.asarray(candles, dtype=np.float64).reshape(-1, len(OHLCV_COLUMNS))
+    records = np.empty(len(raw), dtype=CANDLE_DTYPE)
+    records['timestamp'] = raw[:, 0].astype(np.int64)
+    for column_index, column in enumerate(OHLCV_COLUMNS[1:], start=1):
+        records[column] = raw[:, column_index]
+    return _sorted_unique(records)
+
+
+def _sorted_unique(records):
+    """Sorts by timestamp and keeps the last occurrence of every duplicate."""
+    order = np.argsort(records['timestamp'], kind='stable')
+    records = records[order]
+    keep = np.ones(len(records), dtype=bool)
+    keep[:-1] = records['timestamp'][1:] != records['timestamp'][:-1]
+    return records[keep]
+
+
+class CandleStore:
+    """
+    A directory of memory-mapped candle files, one per (exchange, symbol, timeframe).
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+
+    def path(self, exchange_id, symbol, timeframe):
+        safe_symbol = symbol.replace('/', '_').replace(':', '_')
+        return os.path.join(self.root, exchange_id, safe_symbol, f"{timeframe}.bin")
+
+    # --- Reading ---
+
+    def read(self, exchange_id, symbol, timeframe, since=None, until=None):
+        """Returns the stored candles as a read-only record array (memory-mapped)."""
+        path = self.path(exchange_id, symbol, timeframe)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        records = np.memmap(path, dtype=CANDLE_DTYPE, mode='r')
+        timestamps = records['timestamp']
+        start = 0 if since is None else int(np.searchsorted(timestamps, since, side='left'))
+        end = len(records) if until is None else int(np.searchsorted(timestamps, until, side='left'))
+        return records[start:end]
+
+    def to_frame(self, exchange_id, symbol, timeframe, since=None, until=None):
+        """Returns the stored candles as a DataFrame with a datetime `timestamp` column."""
+        records = self.read(exchange_id, symbol, timeframe, since, until)
+        df = pd.DataFrame({column: np.asarray(records[column]) for column in OHLCV_COLUMNS})
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def last_timestamp(self, exchange_id, symbol, timeframe):
+        records = self.read(exchange_id, symbol, timeframe)
+        return int(records['timestamp'][-1]) if len(records) else None
+
+    def find_gaps(self, exchange_id, symbol, timeframe):
+        """Returns (start_ms, end_ms) spans of missing candles inside the stored history."""
+        timestamps = np.asarray(self.read(exchange_id, symbol, timeframe)['timestamp'])
+        step = timeframe_to_ms(timeframe)
+        holes = np.flatnonzero(np.diff(timestamps) > step)
+        return [(int(timestamps[i]) + step, int(timestamps[i + 1])) for i in holes]
+
+    # --- Writing ---
+
+    def write(self, exchange_id, symbol, timeframe, records):
+        """
+        Merges new records into the store; newer values win for repeated timestamps.
+        Candles at or after the last stored one are appended in place, anything else
+        rewrites the file.
+        """
+        if len(records) == 0:
+            return
+        records = _sorted_unique(np.asarray(records, dtype=CANDLE_DTYPE))
+        path = self.path(exchange_id, symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        existing = self.read(exchange_id, symbol, timeframe)
+
+        if len(existing) == 0 or records['timestamp'][0] >= existing['timestamp'][-1]:
+            keep = int(np.searchsorted(existing['timestamp'], records['timestamp'][0], side='left'))
+            del existing
+            with open(path, 'ab') as handle:
+                handle.truncate(keep * CANDLE_DTYPE.itemsize)
+                handle.write(records.tobytes())
+            return
+
+        merged = _sorted_unique(np.concatenate([np.asarray(existing), records]))
+        del existing
+        temp_path = path + '.tmp'
+        merged.tofile(temp_path)
+        os.replace(temp_path, path)
+
+    def _load_meta(self, exchange_id, symbol, timeframe):
+        path = self.path(exchange_id, symbol, timeframe) + '.json'
+        if not os.path.exists(path):
+            return {'history_start': None, 'checked_gaps': []}
+        with open(path) as handle:
+            return json.load(handle)
+
+    def _save_meta(self, exchange_id, symbol, timeframe, meta):
+        path = self.path(exchange_id, symbol, timeframe) + '.json'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as handle:
+            json.dump(meta, handle)
+
+    # --- Syncing ---
+
+    def _download(self, fetch, exchange, symbol, timeframe, start, end):
+        """
+        Stores the candles `fetch` downloads for [start, end). When only part of the span
+        arrives (`IncompleteDownload`), that part is stored before the error is raised, and
+        the missing spans stay gaps for a later sync to backfill.
+        """
+        try:
+            candles = fetch(exchange, symbol, timeframe, start, end)
+        except IncompleteDownload as e:
+            self.write(exchange.id, symbol, timeframe, to_records(e.candles))
+            raise
+        self.write(exchange.id, symbol, timeframe, to_records(candles))
+
+    def sync(self, exchange, symbol, timeframe, since, until=None, fill_gaps=True, fetch=fetch_ohlcv_range):
+        """
+        Brings the stored history for `symbol` up to date and returns it from `since` on.
+
+        Only candles after the last stored one are downloaded (the last one is fetched
+        again in case it was still forming). History before the first stored candle and
+        holes inside it are backfilled once; spans the exchange has no data for are
+        remembered so they are not requested on every run. Network errors are reported
+        and the stored data is returned as-is; the candles an incomplete download did get
+        are stored first.
+
+        :param exchange: A ccxt exchange instance (anything with `id`, `rateLimit` and
+                         `fetch_ohlcv`).
+        :param since: Start of the wanted history, in milliseconds.
+        :param fetch: Function used to download a span of candles.
+        """
+        until = now_ms() if until is None else until
+        step = timeframe_to_ms(timeframe)
+        exchange_id = exchange.id
+        meta = self._load_meta(exchange_id, symbol, timeframe)
+        stored = self.read(exchange_id, symbol, timeframe)
+
+        spans = []
+        if len(stored) == 0:
+            spans.append((since, until))
+        else:
+            first, last = int(stored['timestamp'][0]), int(stored['timestamp'][-1])
+            history_start = meta['history_start']
+            if since < first and (history_start is None or since < history_start):
+                spans.append((since, first))
+            spans.append((last, until))
+        del stored
+
+        try:
+            for start, end in spans:
+                self._download(fetch, exchange, symbol, timeframe, start, end)
+            meta['history_start'] = min(since, meta['history_start'] or since)
+
+            if fill_gaps:
+                checked = {tuple(gap) for gap in meta['checked_gaps']}
+                for gap in self.find_gaps(exchange_id, symbol, timeframe):
+                    if gap in checked or gap[1] <= since:
+                        continue
+                    print(f"🩹 Backfilling {symbol} {timeframe} gap of {(gap[1] - gap[0]) // step} candles...")
+                    self._download(fetch, exchange, symbol, timeframe, *gap)
+                    checked.add(gap)
+                # Whatever is still missing is a real hole on the exchange side.
+                remaining = set(self.find_gaps(exchange_id, symbol, timeframe))
+                meta['checked_gaps'] = sorted(list(checked & remaining))
+        except Exception as e:
+            print(f"⚠️ Candle sync for {symbol} {timeframe} on {exchange_id} failed: {e}. Using stored data.")
+        finally:
+            self._save_meta(exchange_id, symbol, timeframe, meta)
+
+        return self.to_frame(exchange_id, symbol, timeframe, since=since, until=until)
@@ -0,0 +1,283 @@
+# common/fee_tracker.py
+"""
+Exact fee accrual of a simulated Uniswap V3 / PancakeSwap V3 position from pool state.
+
+The bots estimated fees from CEX volume and an assumed pool TVL (or random noise).
+A V3 pool already tracks the fees it paid: `feeGrowthGlobal{0,1}X128` grow by the fees
+per unit of in-range liquidity, and each initialized tick stores `feeGrowthOutside`.
+Together they give the fee growth inside any tick range. A position of liquidity L on
+[tick_lower, tick_upper) has earned
+
+    L * (inside_now - inside_at_entry) / 2**128
+
+of each token, as in the pool's own Position.update. `PoolFeeReader` reads all of it
+(the two global values, `liquidity`, the current tick and both range ticks) with one
+Multicall3 `aggregate3` eth_call pinned to one block, and caches the snapshot per block
+number. A check is therefore one RPC call at most, and none when that block was
+already read.
+
+Our position exists only in the simulation, so its range ticks may not be initialized
+in the pool, and an uninitialized tick stores no `feeGrowthOutside`. For such a tick the
+tracker keeps the value the pool would keep. It initializes the value at entry by the
+pool's rule and flips it whenever a check finds the price on the other side of the
+tick. That is exact except for the fees of the block interval in which the crossing
+happened.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+from common.multicall3 import MULTICALL3_ADDRESS, decode_aggregate3, encode_aggregate3
+from common.slot0 import SLOT0_SELECTOR, hex_bytes
+
+FEE_GROWTH_GLOBAL0_SELECTOR = bytes.fromhex('f3058399')  # feeGrowthGlobal0X128()
+FEE_GROWTH_GLOBAL1_SELECTOR = bytes.fromhex('46141319')  # feeGrowthGlobal1X128()
+LIQUIDITY_SELECTOR = bytes.fromhex('1a686502')  # liquidity()
+TICKS_SELECTOR = bytes.fromhex('f30dba93')  # ticks(int24)
+TICK_SPACING_SELECTOR = bytes.fromhex('d0c93a7c')  # tickSpacing()
+GET_BLOCK_NUMBER_SELECTOR = bytes.fromhex('42cbb15c')  # Multicall3.getBlockNumber()
+
+Q128 = 2**128
+UINT256 = 2**256
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+
+def _uint(data, index=0):
+    return int.from_bytes(data[32 * index:32 * (index + 1)], 'big')
+
+
+def _int(data, index=0):
+    return int.from_bytes(data[32 * index:32 * (index + 1)], 'big', signed=True)
+
+
+# --- Price / liquidity conversions ---
+
+def price_to_tick(raw_price):
+    """The (fractional) tick of a raw price, i.e. token1 wei per token0 wei."""
+    return math.log(raw_price) / math.log(1.0001)
+
+
+def _nearest_usable_tick(raw_price, tick_spacing):
+    tick = price_to_tick(raw_price) if raw_price > 0 else MIN_TICK
+    tick = round(min(max(tick, MIN_TICK), MAX_TICK) / tick_spacing) * tick_spacing
+    return min(max(tick, -(-MIN_TICK // tick_spacing) * tick_spacing), (MAX_TICK // tick_spacing) * tick_spacing)
+
+
+def range_ticks(raw_price_a, raw_price_b, tick_spacing):
+    """
+    (tick_lower, tick_upper) of the range between two raw prices (in any order), each
+    rounded to the nearest usable tick and at least one tick spacing apart. A price of
+    zero or below maps to the lowest usable tick, an infinite one to the highest.
+    """
+    low, high = sorted((raw_price_a, raw_price_b))
+    tick_lower = _nearest_usable_tick(low, tick_spacing)
+    tick_upper = _nearest_usable_tick(high, tick_spacing)
+    if tick_upper <= tick_lower:
+        if tick_lower + tick_spacing <= MAX_TICK:
+            tick_upper = tick_lower + tick_spacing
+        else:
+            tick_lower = tick_upper - tick_spacing
+    return tick_lower, tick_upper
+
+
+def raw_liquidity(liquidity, token0_decimals, token1_decimals):
+    """
+    The pool's liquidity units for a `common.lp_math` liquidity, which is computed on
+    decimal-adjusted prices and amounts. It does not depend on which token is the quote.
+    """
+    return int(liquidity * 10 ** ((token0_decimals + token1_decimals) / 2))
+
+
+# --- Pool reads ---
+
+class TickState:
+    """`ticks(tick)` of one tick: whether it is initialized and its fee growth outside."""
+
+    __slots__ = ('initialized', 'outside0', 'outside1')
+
+    def __init__(self, initialized, outside0, outside1):
+        self.initialized = initialized
+        self.outside0 = outside0
+        self.outside1 = outside1
+
+
+class FeeSnapshot:
+    """The fee-growth state of a pool and two of its ticks at one block."""
+
+    __slots__ = ('block', 'tick', 'liquidity', 'global0', 'global1', 'lower', 'upper')
+
+    def __init__(self, block, tick, liquidity, global0, global1, lower, upper):
+        self.block = block
+        self.tick = tick
+        self.liquidity = liquidity
+        self.global0 = global0
+        self.global1 = global1
+        self.lower = lower
+        self.upper = upper
+
+
+class PoolFeeReader:
+    """
+    Reads `FeeSnapshot`s of one pool through `w3.provider`, one aggregate3 eth_call per
+    block, with the last `cache_blocks` snapshots kept per (block, tick range).
+
+    :param w3: A connected Web3 instance of the pool's chain.
+    :param pool_address: Checksummed pool address.
+    """
+
+    def __init__(self, w3, pool_address, multicall_address=MULTICALL3_ADDRESS, cache_blocks=16):
+        self.w3 = w3
+        self.pool_address = pool_address
+        self.multicall_address = multicall_address
+        self.cache_blocks = cache_blocks
+        self.calls_made = 0  # eth_calls sent, for monitoring
+        self._tick_spacing = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _eth_call(self, to, data, block):
+        response = self.w3.provider.make_request('eth_call', [{'to': to, 'data': '0x' + data.hex()}, block])
+        self.calls_made += 1
+        if 'error' in response:
+            raise ConnectionError(f"eth_call to {to} failed: {response['error']}")
+        return hex_bytes(response['result'])
+
+    @property
+    def tick_spacing(self):
+        """The pool's tick spacing, read once."""
+        if self._tick_spacing is None:
+            self._tick_spacing = _int(self._eth_call(self.pool_address, TICK_SPACING_SELECTOR, 'latest'))
+        return self._tick_spacing
+
+    def _calls(self, tick_lower, tick_upper):
+        pool = self.pool_address
+        return [
+            (self.multicall_address, False, GET_BLOCK_NUMBER_SELECTOR),
+            (pool, False, SLOT0_SELECTOR),
+            (pool, False, LIQUIDITY_SELECTOR),
+            (pool, False, FEE_GROWTH_GLOBAL0_SELECTOR),
+            (pool, False, FEE_GROWTH_GLOBAL1_SELECTOR),
+            (pool, False, TICKS_SELECTOR + (tick_lower % UINT256).to_bytes(32, 'big')),
+            (pool, False, TICKS_SELECTOR + (tick_upper % UINT256).to_bytes(32, 'big')),
+        ]
+
+    def snapshot(self, tick_lower, tick_upper, block='latest'):
+        """
+        The snapshot at `block` (a block number, or 'latest'). A block number that was
+        read before is served from the cache.
+        """
+        key = (block, tick_lower, tick_upper)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        data = encode_aggregate3(self._calls(tick_lower, tick_upper))
+        block_id = hex(block) if isinstance(block, int) else block
+        results = decode_aggregate3(self._eth_call(self.multicall_address, data, block_id))
+        (_, number), (_, slot0), (_, liquidity), (_, global0), (_, global1), (_, lower), (_, upper) = results
+        # ticks(): liquidityGross, liquidityNet, feeGrowthOutside0X128, feeGrowthOutside1X128, ...
+        snapshot = FeeSnapshot(_uint(number), _int(slot0, 1), _uint(liquidity), _uint(global0), _uint(global1),
+                               TickState(_uint(lower) > 0, _uint(lower, 2), _uint(lower, 3)),
+                               TickState(_uint(upper) > 0, _uint(upper, 2), _uint(upper, 3)))
+        with self._lock:
+            # Stored under the block it was read at, so 'latest' also fills the cache.
+            self._cache[(snapshot.block, tick_lower, tick_upper)] = snapshot
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return snapshot
+
+
+# --- Position ---
+
+class _RangeTick:
+    """
+    One range tick of the tracked position: its state at entry and, for when the pool
+    does not track it, the fee growth outside the pool would hold.
+    """
+
+    def __init__(self, tick, state, snapshot):
+        self.tick = tick
+        self.pool_tracked = state.initialized  # initialized in every snapshot since entry
+        self.entry_outside = (state.outside0, state.outside1)
+        # The pool's rule on initialization: all growth so far counts as below the tick.
+        self.virtual_above = snapshot.tick >= tick
+        virtual = (snapshot.global0, snapshot.global1) if self.virtual_above else (0, 0)
+        self.entry_virtual = self.virtual = virtual
+
+    def observe(self, state, snapshot):
+        self.pool_tracked = self.pool_tracked and state.initialized
+        above = snapshot.tick >= self.tick
+        if above != self.virtual_above:
+            # Crossed since the last check: flip like Tick.cross, with the growth of now.
+            self.virtual = ((snapshot.global0 - self.virtual[0]) % UINT256,
+                            (snapshot.global1 - self.virtual[1]) % UINT256)
+            self.virtual_above = above
+
+    def outside(self, state):
+        """(entry, current) fee growth outside, both from the same source."""
+        if self.pool_tracked:
+            return self.entry_outside, (state.outside0, state.outside1)
+        return self.entry_virtual, self.virtual
+
+
+def _fee_growth_inside(tick_current, tick_lower, tick_upper, global_growth, outside_lower, outside_upper):
+    """Tick.getFeeGrowthInside for one token, with uint256 wraparound."""
+    below = outside_lower if tick_current >= tick_lower else global_growth - outside_lower
+    above = outside_upper if tick_current < tick_upper else global_growth - outside_upper
+    return (global_growth - below - above) % UINT256
+
+
+class PositionFeeTracker:
+    """
+    Fees earned by a simulated position of `liquidity` (pool units) on
+    [tick_lower, tick_upper), from the pool's fee growth since `open`.
+
+    :param reader: The pool's `PoolFeeReader`.
+    """
+
+    def __init__(self, reader, tick_lower, tick_upper, liquidity, entry):
+        self.reader = reader
+        self.tick_lower = tick_lower
+        self.tick_upper = tick_upper
+        self.liquidity = liquidity
+        self.entry = entry
+        self.last = entry
+        self.fees0 = 0  # raw token0 earned, as of the last successful update
+        self.fees1 = 0
+        self._lower = _RangeTick(tick_lower, entry.lower, entry)
+        self._upper = _RangeTick(tick_upper, entry.upper, entry)
+
+    @classmethod
+    def open(cls, reader, tick_lower, tick_upper, liquidity, block='latest'):
+        """Starts tracking at `block`, the block the position is entered at."""
+        return cls(reader, tick_lower, tick_upper, liquidity, reader.snapshot(tick_lower, tick_upper, block))
+
+    def _inside(self, snapshot, lower_outside, upper_outside):
+        return [_fee_growth_inside(snapshot.tick, self.tick_lower, self.tick_upper, global_growth,
+                                   lower_outside[token], upper_outside[token])
+                for token, global_growth in enumerate((snapshot.global0, snapshot.global1))]
+
+    def update(self, block='latest'):
+        """
+        Reads the pool at `block` and returns the raw (token0, token1) fees earned since
+        entry. A block older than the last one read returns the last result.
+        """
+        snapshot = self.reader.snapshot(self.tick_lower, self.tick_upper, block)
+        if snapshot.block < self.last.block:
+            return self.fees0, self.fees1
+        self._lower.observe(snapshot.lower, snapshot)
+        self._upper.observe(snapshot.upper, snapshot)
+        lower_entry, lower_now = self._lower.outside(snapshot.lower)
+        upper_entry, upper_now = self._upper.outside(snapshot.upper)
+        inside_entry = self._inside(self.entry, lower_entry, upper_entry)
+        inside_now = self._inside(snapshot, lower_now, upper_now)
+        self.fees0, self.fees1 = (self.liquidity * ((now - entry) % UINT256) // Q128
+                                  for now, entry in zip(inside_now, inside_entry))
+        self.last = snapshot
+        return self.fees0, self.fees1
+
+    def pool_share(self):
+        """Our liquidity as a fraction of the pool's active liquidity at the last read."""
+        active = self.last.liquidity + self.liquidity
+        return self.liquidity / active if active else 0.0
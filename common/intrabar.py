@@ -0,0 +1,142 @@
+# common/intrabar.py
+"""
+Intrabar range-breach detection for the hourly dynamic-range backtests.
+
+The hourly kernel compares every hour's close with the range, so an hour that wicked out
+of the range and came back is scored as fully in range and an exit is seen up to an
+hour late. An `IntrabarSeries` keeps the hourly candles for the range calculation but
+lets the kernel test every held hour's low / high instead. They come either from the
+hourly candle itself or from the 1m candles of that hour. With 1m candles the exact
+breach minute is located as well. Both searches are vectorized: one mask row per exit
+hour, and the first crossing is found with `argmax`.
+"""
+
+import numpy as np
+import pandas as pd
+
+RESOLUTION_CLOSE = 'close'  # hourly closes only (the plain kernel / `BacktestEngine.run`)
+RESOLUTION_HIGH_LOW = 'high_low'  # hourly high / low
+RESOLUTION_MINUTE = '1m'  # 1m candles aggregated per hour, exact breach minute
+
+# Upper bound on the padded (exit hour x minute) mask elements held at once.
+_MASK_CHUNK_ELEMENTS = 4_000_000
+
+
+def _datetime_ns(values):
+    """Timestamps (datetime-like or epoch milliseconds) as int64 nanoseconds."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.int64) * 1_000_000
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def _breach_price(open_, low, high, range_min, range_max):
+    """
+    Price at which a bar left the range: its open when it already opened outside (a gap),
+    otherwise the bound it crossed. A bar that crossed both bounds is exited at the lower
+    one, the conservative choice when the order inside the bar is unknown.
+    """
+    gapped = (open_ < range_min) | (open_ > range_max)
+    crossed = np.where(low < range_min, range_min, range_max)
+    return np.where(gapped, open_, crossed)
+
+
+class IntrabarSeries:
+    """
+    Per-hour low / high used to detect range breaches, aligned with the hourly candles.
+
+    Build it with `from_hourly` or `from_minutes`. The kernel tests held hours with
+    `low` / `high` and prices every exit with `breach`.
+    """
+
+    def __init__(self, hour_times, open_, high, low, minutes=None):
+        self.hour_times = hour_times
+        self.open = open_
+        self.high = high
+        self.low = low
+        # (first minute index and minute count of every hour, then the 1m times / open /
+        # high / low), or None without 1m candles.
+        self.minutes = minutes
+
+    @property
+    def resolution(self):
+        return RESOLUTION_MINUTE if self.minutes is not None else RESOLUTION_HIGH_LOW
+
+    @classmethod
+    def from_hourly(cls, hourly):
+        """Uses the low / high of the hourly candles (`open`, `high`, `low` columns)."""
+        return cls(_datetime_ns(hourly['timestamp']),
+                   hourly['open'].to_numpy(dtype=np.float64),
+                   hourly['high'].to_numpy(dtype=np.float64),
+                   hourly['low'].to_numpy(dtype=np.float64))
+
+    @classmethod
+    def from_minutes(cls, hourly, minutes):
+        """
+        Aggregates 1m candles into the hours of `hourly`. Hours without 1m candles keep
+        the hourly candle's low / high, and their breaches are priced at hour level.
+
+        :param hourly: The hourly candles the backtest runs on (`timestamp`, `open`, `high`, `low`).
+        :param minutes: 1m candles (`timestamp`, `open`, `high`, `low`), sorted by time.
+        """
+        series = cls.from_hourly(hourly)
+        hour_times = series.hour_times
+        if not len(hour_times):
+            return series
+        minute_times = _datetime_ns(minutes['timestamp'])
+        minute_open = minutes['open'].to_numpy(dtype=np.float64)
+        minute_high = minutes['high'].to_numpy(dtype=np.float64)
+        minute_low = minutes['low'].to_numpy(dtype=np.float64)
+
+        # Minutes before the first hour or after the last one do not belong to any bar.
+        hour_step = np.diff(hour_times).min() if len(hour_times) > 1 else 3_600_000_000_000
+        keep = (minute_times >= hour_times[0]) & (minute_times < hour_times[-1] + hour_step)
+        minute_times, minute_open = minute_times[keep], minute_open[keep]
+        minute_high, minute_low = minute_high[keep], minute_low[keep]
+        if not len(minute_times):
+            return series
+
+        start = np.searchsorted(minute_times, hour_times, side='left')
+        end = np.r_[start[1:], len(minute_times)]
+        count = end - start
+        covered = np.flatnonzero(count > 0)
+        if len(covered):
+            high = series.high.copy()
+            low = series.low.copy()
+            high[covered] = np.maximum.reduceat(minute_high, start[covered])
+            low[covered] = np.minimum.reduceat(minute_low, start[covered])
+            # reduceat runs to the next covered hour's start, which is this hour's end.
+            series.high, series.low = high, low
+        series.minutes = (start, count, minute_times, minute_open, minute_high, minute_low)
+        return series
+
+    def breach(self, exit_bars, range_min, range_max):
+        """
+        Price and time (int64 ns) of every exit, for exits at hours `exit_bars` out of the
+        ranges `range_min` / `range_max`. Without 1m candles the time is the hour's open.
+        """
+        exit_bars = np.asarray(exit_bars, dtype=np.int64)
+        price = _breach_price(self.open[exit_bars], self.low[exit_bars], self.high[exit_bars],
+                              range_min, range_max)
+        time = self.hour_times[exit_bars].copy()
+        if self.minutes is None or not len(exit_bars):
+            return price, time
+
+        start, count, minute_times, minute_open, minute_high, minute_low = self.minutes
+        width = max(int(count[exit_bars].max()), 1)
+        rows_per_chunk = max(1, _MASK_CHUNK_ELEMENTS // width)
+        for first in range(0, len(exit_bars), rows_per_chunk):
+            rows = slice(first, first + rows_per_chunk)
+            bars = exit_bars[rows]
+            offsets = np.arange(width)
+            valid = offsets < count[bars][:, None]
+            index = np.where(valid, start[bars][:, None] + offsets, 0)
+            low_min, high_max = range_min[rows][:, None], range_max[rows][:, None]
+            outside = valid & ((minute_low[index] < low_min) | (minute_high[index] > high_max))
+            found = outside.any(axis=1)
+            minute = index[np.arange(len(bars)), outside.argmax(axis=1)][found]
+            hits = np.flatnonzero(found) + first
+            price[hits] = _breach_price(minute_open[minute], minute_low[minute], minute_high[minute],
+                                        range_min[hits], range_max[hits])
+            time[hits] = minute_times[minute]
+        return price, time
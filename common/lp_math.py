@@ -0,0 +1,69 @@
+# common/lp_math.py
+"""
+Uniswap V3 / PancakeSwap V3 concentrated-liquidity position math.
+
+Prices are "human" prices: units of token1 (quote, e.g. USDT) per unit of token0
+(base, e.g. ETH), and values are expressed in token1. Every function accepts scalars
+or NumPy arrays and broadcasts, so whole price series (or many ranges at once) are
+valued in a single call.
+
+For a position with liquidity L on [Pa, Pb] at price P (sqrt prices sa, sb, sp):
+    amount0 = L * (1/sp - 1/sb)     amount1 = L * (sp - sa)     with sp clipped to [sa, sb]
+"""
+
+import numpy as np
+
+# --- Position models understood by the backtest engines ---
+POSITION_MODEL_CONCENTRATED = 'concentrated'
+# Legacy model: a 50/50 split valued as a full-range position.
+POSITION_MODEL_FIFTY_FIFTY = 'fifty_fifty'
+
+
+def _clipped_sqrt_prices(price, price_lower, price_upper):
+    sqrt_lower = np.sqrt(price_lower)
+    sqrt_upper = np.sqrt(price_upper)
+    sqrt_price = np.minimum(np.maximum(np.sqrt(price), sqrt_lower), sqrt_upper)
+    return sqrt_price, sqrt_lower, sqrt_upper
+
+
+def token_amounts(liquidity, price, price_lower, price_upper):
+    """Returns (amount0, amount1) held by a position of `liquidity` at `price`."""
+    sqrt_price, sqrt_lower, sqrt_upper = _clipped_sqrt_prices(price, price_lower, price_upper)
+    amount0 = liquidity * (1 / sqrt_price - 1 / sqrt_upper)
+    amount1 = liquidity * (sqrt_price - sqrt_lower)
+    return amount0, amount1
+
+
+def position_value(liquidity, price, price_lower, price_upper):
+    """Value of the position at `price`, in token1."""
+    amount0, amount1 = token_amounts(liquidity, price, price_lower, price_upper)
+    return (amount0 * price) + amount1
+
+
+def liquidity_for_capital(capital, price, price_lower, price_upper):
+    """
+    Liquidity L a deposit of `capital` (in token1) buys on [price_lower, price_upper]
+    when entering at `price`, with the token split the range requires.
+    """
+    return capital / position_value(1.0, price, price_lower, price_upper)
+
+
+def hodl_value(liquidity, entry_price, price, price_lower, price_upper):
+    """Value at `price` of simply holding the tokens deposited at `entry_price`."""
+    amount0, amount1 = token_amounts(liquidity, entry_price, price_lower, price_upper)
+    return (amount0 * price) + amount1
+
+
+def concentrated_il(entry_price, price, price_lower, price_upper):
+    """
+    Impermanent loss of a concentrated position as a fraction (negative = loss):
+    position value / value of holding the deposited tokens - 1. Independent of size.
+    """
+    lp_value = position_value(1.0, price, price_lower, price_upper)
+    return lp_value / hodl_value(1.0, entry_price, price, price_lower, price_upper) - 1
+
+
+def full_range_il(entry_price, price):
+    """Impermanent loss of a full-range (V2 style) position as a fraction."""
+    price_ratio = price / entry_price
+    return (2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1
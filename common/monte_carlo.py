@@ -0,0 +1,248 @@
+# common/monte_carlo.py
+"""
+Monte Carlo paths for the dynamic-range strategy.
+
+Synthetic hourly price/volume paths are generated from the stored history, either by
+block bootstrap of its log returns (keeps volatility clustering and the volume that came
+with each move) or as a GBM calibrated to its returns. The `BacktestEngine` rules are
+then run on every path at once: the state of all paths is held in arrays and advanced
+one bar at a time, so the Python loop runs over bars and never over paths.
+
+Paths are generated and simulated in batches with their own seeds, so results do not
+depend on how many processes the batches are spread over.
+"""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.backtest_kernel import FALLBACK_STD_PCT
+from common.lp_math import (POSITION_MODEL_CONCENTRATED, POSITION_MODEL_FIFTY_FIFTY, concentrated_il,
+                            liquidity_for_capital, position_value as lp_position_value)
+from common.param_sweep import warn_close_only
+from common.range_model import bounds_series
+
+METHOD_BOOTSTRAP = 'bootstrap'
+METHOD_GBM = 'gbm'
+
+
+# --- Path generation ---
+
+def bootstrap_returns(log_returns, volume, n_paths, n_bars, block_size, rng):
+    """
+    Stitches random blocks of `block_size` consecutive historical bars into paths.
+    Returns (log returns, volumes), each shaped (n_paths, n_bars).
+    """
+    block_size = max(1, min(block_size, len(log_returns)))
+    n_blocks = math.ceil(n_bars / block_size)
+    starts = rng.integers(0, len(log_returns) - block_size + 1, size=(n_paths, n_blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :n_bars]
+    return log_returns[index], volume[index]
+
+
+def gbm_returns(log_returns, volume, n_paths, n_bars, rng):
+    """
+    Normal log returns with the mean and std of the historical ones (a discretized GBM).
+    Volumes are drawn independently from the historical volumes.
+    """
+    drift = log_returns.mean()
+    volatility = log_returns.std(ddof=1) if len(log_returns) > 1 else 0.0
+    returns = drift + volatility * rng.standard_normal((n_paths, n_bars))
+    return returns, volume[rng.integers(0, len(volume), size=(n_paths, n_bars))]
+
+
+def generate_paths(close, volume, n_paths, n_bars, warmup_bars, method=METHOD_BOOTSTRAP,
+                   block_size=24, calibration_bars=None, rng=None):
+    """
+    Generates (n_paths, warmup_bars + n_bars) close and volume arrays.
+
+    Every path starts with the last `warmup_bars` real candles (the range lookback) and
+    continues from the last close with `n_bars` synthetic ones.
+
+    :param calibration_bars: Only the most recent bars of history are sampled / used to
+                             calibrate the GBM (defaults to all of it).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    if calibration_bars:
+        close, volume = close[-(calibration_bars + 1):], volume[-(calibration_bars + 1):]
+    if len(close) < 2:
+        raise ValueError("At least two candles are needed to generate paths")
+    # The volume of bar i belongs to the move from close[i - 1] to close[i].
+    log_returns = np.diff(np.log(close))
+
+    if method == METHOD_BOOTSTRAP:
+        returns, volumes = bootstrap_returns(log_returns, volume[1:], n_paths, n_bars, block_size, rng)
+    elif method == METHOD_GBM:
+        returns, volumes = gbm_returns(log_returns, volume[1:], n_paths, n_bars, rng)
+    else:
+        raise ValueError(f"Unknown path method '{method}'")
+
+    warmup_bars = min(warmup_bars, len(close))
+    close_paths = np.empty((n_paths, warmup_bars + n_bars))
+    volume_paths = np.empty((n_paths, warmup_bars + n_bars))
+    close_paths[:, :warmup_bars] = close[len(close) - warmup_bars:]
+    volume_paths[:, :warmup_bars] = volume[len(volume) - warmup_bars:]
+    close_paths[:, warmup_bars:] = close[-1] * np.exp(np.cumsum(returns, axis=1))
+    volume_paths[:, warmup_bars:] = volumes
+    return close_paths, volume_paths
+
+
+# --- Strategy simulation ---
+
+def simulate_paths(close, volume, config):
+    """
+    Runs the `BacktestEngine` strategy on every row of (paths, bars) close / volume arrays.
+
+    :return: A DataFrame with one row per path and the `summarize_backtest` columns
+             (`final_pnl`, `in_range_pct`, `rebalances`, `max_drawdown_usd`,
+             `max_drawdown_pct`) plus `worst_il_pct`, the deepest impermanent loss a
+             position reached while held or at its exit.
+    """
+    close = np.atleast_2d(np.asarray(close, dtype=np.float64))
+    volume = np.atleast_2d(np.asarray(volume, dtype=np.float64))
+    n_paths, n = close.shape
+    lookback = config['LOOKBACK_PERIOD_HOURS']
+    fee_tier = config['FEE_TIER']
+    fee_scalar = config['FEE_ESTIMATE_SCALAR']
+    investment_percent = config['INVESTMENT_PERCENT']
+    capital = config['SIMULATION_CAPITAL_USD']
+    concentrated = config.get('POSITION_MODEL', POSITION_MODEL_FIFTY_FIFTY) == POSITION_MODEL_CONCENTRATED
+
+    lower, upper = bounds_series(close, lookback, config['VOLATILITY_MULTIPLIER'],
+                                 fallback_std_pct=FALLBACK_STD_PCT, axis=1)
+
+    # --- Per-path engine state ---
+    balance = np.full(n_paths, float(capital))
+    in_position = np.zeros(n_paths, dtype=bool)
+    entry_price = np.zeros(n_paths)
+    range_min = np.zeros(n_paths)
+    range_max = np.zeros(n_paths)
+    investment = np.zeros(n_paths)
+    liquidity = np.zeros(n_paths)
+    token0_amount = np.zeros(n_paths)
+    token1_amount = np.zeros(n_paths)
+    total_fees = np.zeros(n_paths)
+
+    # --- Per-path results, updated as the bars go by ---
+    realized_pnl = np.zeros(n_paths)
+    peak_equity = np.full(n_paths, np.nan)
+    max_drawdown_usd = np.zeros(n_paths)
+    max_drawdown_pct = np.zeros(n_paths)
+    worst_il_pct = np.zeros(n_paths)
+    rebalances = np.zeros(n_paths, dtype=np.int64)
+    active_bars = np.zeros(n_paths, dtype=np.int64)
+
+    for i in range(min(lookback, n), n):
+        price = close[:, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # --- Open positions: stay in range or exit ---
+            inside = (range_min <= price) & (price <= range_max)
+            holding = in_position & inside
+            exiting = in_position & ~inside
+            if concentrated:
+                value = lp_position_value(liquidity, price, range_min, range_max)
+                il = concentrated_il(entry_price, price, range_min, range_max) * 100
+            else:
+                value = (token0_amount * price) + token1_amount
+                price_ratio = price / entry_price
+                il = np.where(entry_price == 0, 0.0, ((2 * np.sqrt(price_ratio) / (1 + price_ratio)) - 1) * 100)
+            hourly_volume_usd = volume[:, i] * price
+            estimated_fees = (hourly_volume_usd * fee_tier) * (value / hourly_volume_usd) * fee_scalar
+            bar_fees = np.where(hourly_volume_usd == 0, 0.0, np.minimum(estimated_fees, value * 0.001))
+
+        total_fees += np.where(holding, bar_fees, 0.0)
+        worst_il_pct = np.minimum(worst_il_pct, np.where(in_position, il, 0.0))
+        trade_pnl = (value - investment) + total_fees
+        realized_pnl += np.where(exiting, trade_pnl, 0.0)
+        balance += np.where(exiting, value, 0.0)
+        rebalances += exiting
+
+        # --- Flat paths: enter when the close is inside the current range ---
+        entering = ~in_position & (lower[:, i] <= price) & (price <= upper[:, i])
+        new_investment = balance * investment_percent
+        balance = np.where(entering, balance - new_investment, balance)
+        investment = np.where(entering, new_investment, investment)
+        entry_price = np.where(entering, price, entry_price)
+        range_min = np.where(entering, lower[:, i], range_min)
+        range_max = np.where(entering, upper[:, i], range_max)
+        total_fees = np.where(entering, 0.0, total_fees)
+        if concentrated:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                liquidity = np.where(entering, liquidity_for_capital(new_investment, price, range_min, range_max), liquidity)
+        else:
+            token1_amount = np.where(entering, new_investment / 2, token1_amount)
+            token0_amount = np.where(entering, (new_investment / 2) / price, token0_amount)
+        in_position = (in_position & ~exiting) | entering
+        active_bars += holding | entering
+
+        # --- Equity and drawdown, as `summarize_backtest` measures them ---
+        equity = capital + realized_pnl + np.where(holding, trade_pnl, 0.0)
+        peak_equity = np.fmax(peak_equity, equity)
+        drawdown = peak_equity - equity
+        max_drawdown_usd = np.maximum(max_drawdown_usd, drawdown)
+        max_drawdown_pct = np.maximum(max_drawdown_pct, drawdown / peak_equity * 100)
+
+    scored_bars = max(n - lookback, 0)
+    final_equity = equity if scored_bars else np.full(n_paths, float(capital))
+    return pd.DataFrame({
+        'final_pnl': final_equity - capital,
+        'in_range_pct': active_bars / scored_bars * 100 if scored_bars else np.zeros(n_paths),
+        'rebalances': rebalances,
+        'max_drawdown_usd': max_drawdown_usd,
+        'max_drawdown_pct': max_drawdown_pct,
+        'worst_il_pct': worst_il_pct,
+    })
+
+
+def _simulate_batch(task):
+    """Generates and simulates one batch of paths (runs in a worker process when sharded)."""
+    close, volume, config, n_paths, n_bars, method, block_size, calibration_bars, seed = task
+    close_paths, volume_paths = generate_paths(
+        close, volume, n_paths, n_bars, config['LOOKBACK_PERIOD_HOURS'], method=method,
+        block_size=block_size, calibration_bars=calibration_bars, rng=np.random.default_rng(seed))
+    return simulate_paths(close_paths, volume_paths, config)
+
+
+def run_monte_carlo(data, config, n_paths=10_000, n_bars=720, method=METHOD_BOOTSTRAP, block_size=24,
+                    calibration_bars=None, seed=None, processes=1, batch_paths=2_000):
+    """
+    Simulates the strategy over `n_paths` synthetic continuations of the candles in `data`.
+
+    :param data: DataFrame with `close` and `volume` columns (the history to sample from).
+    :param config: The `BacktestEngine` configuration.
+    :param n_bars: Synthetic hourly bars per path (720 = 30 days).
+    :param method: 'bootstrap' (block bootstrap of historical bars) or 'gbm'.
+    :param block_size: Bars per bootstrap block.
+    :param calibration_bars: Only sample / calibrate on the most recent bars of history.
+    :param processes: Worker processes the path batches are sharded over (1 = in process).
+    :param batch_paths: Paths generated and simulated together; bounds memory use.
+    :return: A DataFrame with one row per path, see `simulate_paths`.
+    """
+    # Synthetic paths have closes only, so intrabar exits cannot be simulated on them.
+    warn_close_only([config], "The Monte Carlo simulation")
+    close = data['close'].to_numpy(dtype=float)
+    volume = data['volume'].to_numpy(dtype=float)
+    batch_sizes = [min(batch_paths, n_paths - start) for start in range(0, n_paths, batch_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(close, volume, config, size, n_bars, method, block_size, calibration_bars, batch_seed)
+             for size, batch_seed in zip(batch_sizes, seeds)]
+
+    if processes and processes > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            tables = list(pool.map(_simulate_batch, tasks))
+    else:
+        tables = [_simulate_batch(task) for task in tasks]
+    if not tables:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True)
+
+
+def summarize_paths(table, percentiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    """Distribution of every per-path metric: mean, std, min, percentiles and max."""
+    summary = table.describe(percentiles=list(percentiles)).T.drop(columns='count')
+    summary['prob_negative'] = (table < 0).mean()
+    return summary
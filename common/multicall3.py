@@ -0,0 +1,55 @@
+# common/multicall3.py
+"""
+Hand-written ABI encoding of Multicall3 `aggregate3` calls.
+
+The node executes all calls packed into one `aggregate3` eth_call against the same
+block, in a single RPC round trip. Used by the Liquidity Bot's batched slot0 reads
+(Liquidity Bot/core/multicall.py) and by the fee-growth reads of common/fee_tracker.py.
+"""
+
+# Deployed at the same address on Ethereum, BSC and most other EVM chains.
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+AGGREGATE3_SELECTOR = bytes.fromhex('82ad56cb')  # aggregate3((address,bool,bytes)[])
+
+
+def _word(value):
+    return value.to_bytes(32, 'big')
+
+
+def _address_word(address):
+    return bytes(12) + bytes.fromhex(address[2:] if address.startswith('0x') else address)
+
+
+def _padded(data):
+    return data + bytes(-len(data) % 32)
+
+
+def encode_aggregate3(calls):
+    """
+    Calldata of `aggregate3(Call3[] calls)` for (target, allow_failure, calldata) tuples.
+    """
+    # Every Call3 is a dynamic tuple: address, bool, offset of its bytes, then the bytes.
+    tuples = [
+        _address_word(target) + _word(int(allow_failure)) + _word(0x60) + _word(len(data)) + _padded(data)
+        for target, allow_failure, data in calls
+    ]
+    offsets, position = [], 32 * len(tuples)
+    for encoded in tuples:
+        offsets.append(_word(position))
+        position += len(encoded)
+    return AGGREGATE3_SELECTOR + _word(0x20) + _word(len(tuples)) + b''.join(offsets) + b''.join(tuples)
+
+
+def decode_aggregate3(data):
+    """Decodes the `Result[]` returned by aggregate3 into (success, return_data) tuples."""
+    array = int.from_bytes(data[0:32], 'big')
+    count = int.from_bytes(data[array:array + 32], 'big')
+    heads = array + 32
+    results = []
+    for k in range(count):
+        start = heads + int.from_bytes(data[heads + 32 * k:heads + 32 * (k + 1)], 'big')
+        success = bool(int.from_bytes(data[start:start + 32], 'big'))
+        offset = start + int.from_bytes(data[start + 32:start + 64], 'big')
+        length = int.from_bytes(data[offset:offset + 32], 'big')
+        results.append((success, data[offset + 32:offset + 32 + length]))
+    return results
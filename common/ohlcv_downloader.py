@@ -0,0 +1,146 @@
+# common/ohlcv_downloader.py
+"""
+Concurrent paged OHLCV downloads under a shared rate-limit budget.
+
+`fetch_ohlcv_range` pages through a span one request at a time, so months of 1m candles
+take hundreds of serial round trips. `download_ohlcv` splits the span into windows of
+one page each and fetches them from a thread pool. Every request first takes a token
+from the exchange's `TokenBucket`; the bucket is shared by all downloads from that
+exchange, so they stay inside its request budget together. Failed windows are retried
+on their own, and the candles are reassembled in time order without duplicates. Windows
+that still fail after all retries are reported with the candles of the others, so
+`CandleStore.sync` keeps what did download.
+
+The function has the same signature as `fetch_ohlcv_range`, so it can be passed as the
+`fetch` of `CandleStore.sync`. It only needs `id`, `rateLimit` and `fetch_ohlcv` from
+the exchange, which makes it easy to run against a local fake exchange.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.candle_store import IncompleteDownload, timeframe_to_ms
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up.
+
+    :param clock: Monotonic clock in seconds (replaceable in tests).
+    :param sleep: Sleep function (replaceable in tests).
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1.0):
+        """Blocks until `tokens` are available and takes them."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def limiter_for(exchange):
+    """
+    The `TokenBucket` shared by every download from `exchange.id`. ccxt's `rateLimit`
+    (milliseconds between requests) is the exchange's request budget; one second of it
+    may be spent as a burst.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(exchange.id)
+        if limiter is None:
+            limiter = _limiters[exchange.id] = TokenBucket(1000.0 / max(exchange.rateLimit, 1))
+        return limiter
+
+
+def split_windows(start_ms, end_ms, step_ms, limit):
+    """Splits [start_ms, end_ms) into windows of at most `limit` candles."""
+    span = step_ms * limit
+    return [(start, min(start + span, end_ms)) for start in range(start_ms, end_ms, span)]
+
+
+def _fetch_window(exchange, symbol, timeframe, window, limit, limiter):
+    """Fetches one window; usually one page, more if the exchange returns short pages."""
+    start_ms, end_ms = window
+    step = timeframe_to_ms(timeframe)
+    candles = []
+    since = start_ms
+    while since < end_ms:
+        limiter.acquire()
+        page = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        if not page:
+            break
+        candles.extend(candle for candle in page if since <= candle[0] < end_ms)
+        last_timestamp = page[-1][0]
+        # Stop once the window's last candle is in, instead of asking for the next window.
+        if last_timestamp < since or last_timestamp + step >= end_ms:
+            break
+        since = last_timestamp + 1
+    return candles
+
+
+def download_ohlcv(exchange, symbol, timeframe, start_ms, end_ms, limit=1000, workers=DEFAULT_WORKERS,
+                   retries=DEFAULT_RETRIES, limiter=None, backoff_seconds=1.0):
+    """
+    Downloads the candles in [start_ms, end_ms) with concurrent window requests.
+
+    :param limit: Candles per request (the exchange's page size).
+    :param workers: Concurrent requests; the limiter still caps the request rate.
+    :param retries: Extra attempts for every failed window.
+    :param limiter: A `TokenBucket`; defaults to the one shared for this exchange.
+    :return: ccxt-style candle lists sorted by timestamp, one per timestamp.
+    :raises IncompleteDownload: If some windows still fail after all retries. It carries
+                                the candles of the other windows and the failed spans.
+    """
+    limiter = limiter or limiter_for(exchange)
+    windows = split_windows(start_ms, end_ms, timeframe_to_ms(timeframe), limit)
+    by_timestamp = {}
+    attempt = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(windows) or 1))) as pool:
+        while windows:
+            futures = [(window, pool.submit(_fetch_window, exchange, symbol, timeframe, window, limit, limiter))
+                       for window in windows]
+            failed, errors = [], []
+            for window, future in futures:
+                try:
+                    candles = future.result()
+                except Exception as e:
+                    failed.append(window)
+                    errors.append(e)
+                    continue
+                # Later pages win, like `CandleStore.write` does for refreshed candles.
+                for candle in candles:
+                    by_timestamp[candle[0]] = candle
+            if not failed:
+                break
+            if attempt >= retries:
+                raise IncompleteDownload(
+                    f"{len(failed)} {symbol} {timeframe} windows failed after {retries} retries: {errors[-1]}",
+                    [by_timestamp[timestamp] for timestamp in sorted(by_timestamp)], sorted(failed))
+            attempt += 1
+            print(f"⚠️ {len(failed)} {symbol} {timeframe} windows failed ({errors[-1]}), retry {attempt}/{retries}...")
+            time.sleep(backoff_seconds * 2 ** (attempt - 1))
+            windows = failed
+    return [by_timestamp[timestamp] for timestamp in sorted(by_timestamp)]
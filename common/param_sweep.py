@@ -0,0 +1,131 @@
+# common/param_sweep.py
+"""
+Parallel parameter sweeps for the dynamic-range backtest.
+
+The candle columns are written once to a temporary ``.npy`` file that every worker
+memory-maps when it starts. All workers read the same pages from the OS page cache, the
+data is never pickled per task, and each task only carries its small configuration dict.
+
+Sweeps score hourly closes like `BacktestEngine.run`; an INTRABAR_RESOLUTION other
+than 'close' is not applied, and `warn_close_only` says so.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.backtest_kernel import run_backtest_kernel, summarize_backtest
+from common.intrabar import RESOLUTION_CLOSE
+
+# Candle columns shared with the workers, in block order.
+SHARED_COLUMNS = ('close', 'volume')
+
+# Set in every worker by `attach_worker`.
+_worker_candles = None
+
+
+def expand_grid(grid):
+    """
+    Turns a grid (dict of parameter -> list of values) into a list of config overrides.
+    A list of override dicts is returned as-is.
+    """
+    if isinstance(grid, dict):
+        keys = list(grid)
+        return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    return [dict(overrides) for overrides in grid]
+
+
+def warn_close_only(configs, runner):
+    """Warns when any of `configs` asks for intrabar exits, which `runner` does not apply."""
+    resolutions = {config.get('INTRABAR_RESOLUTION', RESOLUTION_CLOSE) for config in configs} - {RESOLUTION_CLOSE}
+    if resolutions:
+        print(f"⚠️ {runner} scores hourly closes only; INTRABAR_RESOLUTION "
+              f"{', '.join(sorted(resolutions))} is ignored.")
+
+
+class SharedCandles:
+    """
+    OHLCV columns stored in one memory-mapped file, readable from any process by path.
+    """
+
+    def __init__(self, data):
+        self.columns = [column for column in SHARED_COLUMNS if column in data]
+        self.directory = tempfile.mkdtemp(prefix='candles_')
+        self.path = os.path.join(self.directory, 'candles.npy')
+        block = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float64,
+                                          shape=(len(self.columns), len(data)))
+        for row, column in enumerate(self.columns):
+            block[row] = np.asarray(data[column], dtype=np.float64)
+        block.flush()
+        del block
+
+    @property
+    def handle(self):
+        """Everything a worker needs to attach: (file path, column names)."""
+        return self.path, tuple(self.columns)
+
+    @staticmethod
+    def attach(path, columns):
+        """Returns a dict of column -> read-only array view over the shared file."""
+        block = np.load(path, mmap_mode='r')
+        return {column: block[row] for row, column in enumerate(columns)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def attach_worker(path, columns):
+    """Process pool initializer: maps the shared candles into this worker once."""
+    global _worker_candles
+    _worker_candles = SharedCandles.attach(path, columns)
+
+
+def worker_candles():
+    """The shared candle columns of this worker, as mapped by `attach_worker`."""
+    return _worker_candles
+
+
+def _evaluate_config(config):
+    """Runs one configuration over the worker's shared candles."""
+    result = run_backtest_kernel(_worker_candles['close'], _worker_candles['volume'], config)
+    return summarize_backtest(result, config)
+
+
+def run_sweep(data, base_config, grid, processes=None, chunksize=None):
+    """
+    Backtests every configuration of a grid over the same candles in a process pool.
+
+    :param data: DataFrame with at least `close` and `volume` columns.
+    :param base_config: The engine configuration the overrides are applied on top of.
+    :param grid: A dict of parameter -> list of values, or a list of override dicts.
+    :param processes: Number of worker processes (defaults to the CPU count).
+    :return: A DataFrame with one row per configuration, ranked by final PnL.
+    """
+    overrides = expand_grid(grid)
+    if not overrides:
+        return pd.DataFrame()
+    configs = [dict(base_config, **override) for override in overrides]
+    warn_close_only(configs, "The parameter sweep")
+
+    processes = processes or os.cpu_count() or 1
+    if chunksize is None:
+        # A few chunks per worker keeps the pool balanced without per-task overhead.
+        chunksize = max(1, len(configs) // (processes * 4))
+
+    with SharedCandles(data) as shared:
+        with ProcessPoolExecutor(max_workers=processes, initializer=attach_worker,
+                                 initargs=shared.handle) as pool:
+            summaries = list(pool.map(_evaluate_config, configs, chunksize=chunksize))
+
+    table = pd.DataFrame([{**override, **summary} for override, summary in zip(overrides, summaries)])
+    table = table.sort_values('final_pnl', ascending=False, kind='stable').reset_index(drop=True)
+    table.insert(0, 'rank', np.arange(1, len(table) + 1))
+    return table
@@ -0,0 +1,207 @@
+# common/range_model.py
+"""
+Rolling mean +/- k * std range model shared by the backtests, paper traders and live bots.
+
+`RangeModel` keeps the statistics of the last `window` closes in a ring buffer and
+updates them in O(1) per candle (sliding Welford update), so a live bot only feeds it
+the candles it has not seen yet and can ask for the bounds at any multiplier without a
+recompute. `rolling_mean_std` / `bounds_series` give the same statistics for every bar
+of a history in one vectorized call for the backtests.
+"""
+
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Upper bound on the temporary window elements held by the vectorized functions.
+_WINDOW_CHUNK_ELEMENTS = 4_000_000
+# Sliding updates accumulate rounding error, so the sums are recomputed this often.
+_RESYNC_EVERY = 10_000
+
+
+def rolling_mean_std(close, window, ddof=1, fallback_std_pct=None, axis=-1):
+    """
+    Mean and std of the `window` closes before every bar (bar i uses close[i-window:i]).
+
+    Computed with the same operations as pandas' `Series.mean()` / `Series.std()` on each
+    slice, so results match a per-bar recompute exactly. When `fallback_std_pct` is set,
+    a zero or undefined std is replaced by that fraction of the mean. Bars without a
+    full window are NaN. `close` may hold several series (e.g. Monte Carlo paths); the
+    bars run along `axis`.
+    """
+    close = np.moveaxis(np.asarray(close, dtype=np.float64), axis, -1)
+    n = close.shape[-1]
+    mean = np.full(close.shape, np.nan)
+    std = np.full(close.shape, np.nan)
+    if window < 1 or n <= window:
+        return np.moveaxis(mean, -1, axis), np.moveaxis(std, -1, axis)
+
+    series = close.reshape(-1, n)
+    series_mean, series_std = mean.reshape(-1, n), std.reshape(-1, n)
+    # windows[s, k] holds close[s, k:k + window], which is the lookback of bar k + window.
+    windows = sliding_window_view(series, window, axis=1)[:, :-1]
+    bars_per_chunk = max(1, min(windows.shape[1], _WINDOW_CHUNK_ELEMENTS // window))
+    series_per_chunk = max(1, _WINDOW_CHUNK_ELEMENTS // (window * bars_per_chunk))
+    for first in range(0, len(series), series_per_chunk):
+        rows = slice(first, first + series_per_chunk)
+        for start in range(0, windows.shape[1], bars_per_chunk):
+            chunk = windows[rows, start:start + bars_per_chunk]
+            average_price = chunk.sum(axis=2) / window
+            if window > ddof:
+                squared = (average_price[:, :, None] - chunk) ** 2
+                price_std_dev = np.sqrt(squared.sum(axis=2) / (window - ddof))
+            else:
+                price_std_dev = np.full(average_price.shape, np.nan)
+
+            if fallback_std_pct is not None:
+                no_volatility = np.isnan(price_std_dev) | (price_std_dev == 0)
+                price_std_dev = np.where(no_volatility, average_price * fallback_std_pct, price_std_dev)
+
+            bars = slice(start + window, start + window + chunk.shape[1])
+            series_mean[rows, bars] = average_price
+            series_std[rows, bars] = price_std_dev
+    return np.moveaxis(mean, -1, axis), np.moveaxis(std, -1, axis)
+
+
+def bounds_series(close, window, volatility_multiplier, ddof=1, fallback_std_pct=None, axis=-1):
+    """Lower and upper range bounds for every bar, see `rolling_mean_std`."""
+    mean, std = rolling_mean_std(close, window, ddof, fallback_std_pct, axis)
+    return mean - (std * volatility_multiplier), mean + (std * volatility_multiplier)
+
+
+class RangeModel:
+    """
+    Running mean / std over the last `window` closes with O(1) updates.
+
+    :param window: Number of closes in the rolling window.
+    :param ddof: 1 for the sample std (pandas), 0 for the population std (numpy).
+    :param fallback_std_pct: If set, a zero or undefined std is replaced by this
+                             fraction of the mean when computing bounds.
+    """
+
+    def __init__(self, window, ddof=1, fallback_std_pct=None):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.ddof = ddof
+        self.fallback_std_pct = fallback_std_pct
+        self.last_timestamp = None
+        self._reset()
+
+    def _reset(self):
+        self._values = [0.0] * self.window
+        self._head = 0  # Slot the next new value goes into.
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._updates = 0
+
+    @classmethod
+    def from_prices(cls, prices, ddof=1, fallback_std_pct=None, window=None):
+        """Builds a model seeded with `prices` (the window defaults to their count)."""
+        prices = [float(price) for price in prices]
+        model = cls(window or max(1, len(prices)), ddof=ddof, fallback_std_pct=fallback_std_pct)
+        model.seed(prices)
+        return model
+
+    def seed(self, prices):
+        """Replaces the window with the last `window` prices, computed in two passes."""
+        self._reset()
+        prices = [float(price) for price in prices][-self.window:]
+        for price in prices:
+            self._values[self._head] = price
+            self._head = (self._head + 1) % self.window
+        self._count = len(prices)
+        self._resync()
+
+    def _resync(self):
+        """Recomputes mean and M2 exactly from the buffer, the way pandas does."""
+        values = np.array(self.values())
+        if len(values) == 0:
+            self._mean, self._m2 = 0.0, 0.0
+        else:
+            self._mean = float(values.sum() / len(values))
+            self._m2 = float(((self._mean - values) ** 2).sum())
+        self._updates = 0
+
+    def values(self):
+        """The closes in the window, oldest first."""
+        if self._count < self.window:
+            return self._values[:self._count]
+        return self._values[self._head:] + self._values[:self._head]
+
+    def update(self, price):
+        """Adds a new close, dropping the oldest one once the window is full."""
+        price = float(price)
+        if self._count < self.window:
+            self._count += 1
+            delta = price - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (price - self._mean)
+        else:
+            old_price = self._values[self._head]
+            old_mean = self._mean
+            self._mean += (price - old_price) / self._count
+            self._m2 += (price - old_price) * (price - self._mean + old_price - old_mean)
+        self._values[self._head] = price
+        self._head = (self._head + 1) % self.window
+
+        self._updates += 1
+        if self._updates >= _RESYNC_EVERY:
+            self._resync()
+
+    def replace_last(self, price):
+        """Overwrites the most recent close, e.g. while its candle is still forming."""
+        if self._count == 0:
+            self.update(price)
+            return
+        price = float(price)
+        last = (self._head - 1) % self.window
+        old_price = self._values[last]
+        old_mean = self._mean
+        self._mean += (price - old_price) / self._count
+        self._m2 += (price - old_price) * (price - self._mean + old_price - old_mean)
+        self._values[last] = price
+
+    def update_candle(self, timestamp, close):
+        """
+        Feeds one candle: a newer timestamp is a new close, the same timestamp refreshes
+        the last close, and older candles are ignored.
+        """
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            return
+        if timestamp == self.last_timestamp:
+            self.replace_last(close)
+        else:
+            self.update(close)
+            self.last_timestamp = timestamp
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def is_ready(self):
+        return self._count == self.window
+
+    @property
+    def mean(self):
+        return self._mean if self._count else float('nan')
+
+    @property
+    def std(self):
+        if self._count <= self.ddof:
+            return float('nan')
+        return math.sqrt(max(self._m2, 0.0) / (self._count - self.ddof))
+
+    def bounds(self, volatility_multiplier):
+        """Returns (lower, upper) = mean -/+ std * multiplier, or (None, None) without data."""
+        if self._count == 0:
+            return None, None
+        average_price = self.mean
+        price_std_dev = self.std
+        if self.fallback_std_pct is not None and (math.isnan(price_std_dev) or price_std_dev == 0):
+            price_std_dev = average_price * self.fallback_std_pct
+        return (average_price - (price_std_dev * volatility_multiplier),
+                average_price + (price_std_dev * volatility_multiplier))
@@ -0,0 +1,261 @@
+# common/result_recorder.py
+"""
+Columnar per-bar result recording for the backtest and simulation engines.
+
+Instead of formatting and printing one line per bar, the engines append each bar to
+preallocated typed arrays. The rows are flushed to a CSV, Parquet or Arrow file every
+`flush_every` bars (and when the recorder is closed), so long runs are not bound by
+terminal I/O and the results stay on disk for drawdown.py and the plotting scripts. The
+console can still show every row, only the entries / exits, or a sample.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# Per-bar numeric columns, in file order after `timestamp` and `status`.
+VALUE_COLUMNS = ('price', 'position_value', 'il_percent', 'fees', 'total_pnl', 'equity')
+# Rows shown by the 'events' console view (besides any row with an alert).
+EVENT_STATUSES = ('POSITION OPENED', 'EXITED POSITION')
+
+CONSOLE_ALL = 'all'
+CONSOLE_EVENTS = 'events'
+CONSOLE_NONE = 'none'
+
+_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+# Databases written by common/result_sinks.SqliteSink; readable by `read_results`.
+SQLITE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+
+def _file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _FORMATS:
+        raise ValueError(f"Unsupported results file '{path}' (use .csv, .parquet or .arrow)")
+    return _FORMATS[extension]
+
+
+def _require_pyarrow(file_format):
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"Writing {file_format} results requires pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+class ResultRecorder:
+    """
+    Collects per-bar results in typed arrays and streams them to a file.
+
+    :param path: Results file (.csv, .parquet or .arrow). Without a path the rows are
+                 only kept in memory (see `to_frame`).
+    :param flush_every: Rows buffered before they are written (also the buffer size).
+    :param console: 'all' prints every row, 'events' only entries, exits and alerts,
+                    'none' nothing.
+    :param console_every: Additionally print every n-th row (0 = off).
+    :param printer: Called as printer(timestamp, status, price, position_value,
+                    il_percent, fees, total_pnl, alert) for every row shown.
+    :param append: Keep the rows already in `path` (a resumed run) instead of starting
+                   a new file.
+    """
+
+    def __init__(self, path=None, flush_every=10_000, console=CONSOLE_EVENTS, console_every=0, printer=None,
+                 append=False):
+        self.path = path
+        self.file_format = _file_format(path) if path else None
+        if self.file_format in ('parquet', 'arrow'):
+            _require_pyarrow(self.file_format)
+        self.flush_every = max(1, flush_every)
+        self.console = console
+        self.console_every = console_every
+        self.printer = printer
+
+        self.statuses = []  # status labels; the arrays hold their index
+        self._status_codes = {}
+        self.rows_recorded = 0
+        self._writer = None
+        self._frames = []  # in-memory flushed chunks when there is no path
+        self._existing = None  # rows of an appended Parquet / Arrow file, rewritten first
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path):
+                if not append:
+                    os.remove(path)
+                elif self.file_format == 'parquet':
+                    self._existing = _require_pyarrow(self.file_format).parquet.read_table(path)
+                elif self.file_format == 'arrow':
+                    self._existing = _require_pyarrow(self.file_format).ipc.open_file(path).read_all()
+        self._allocate()
+
+    def _allocate(self):
+        self._timestamp = np.empty(self.flush_every, dtype='datetime64[ns]')
+        self._status = np.empty(self.flush_every, dtype=np.int16)
+        self._values = {column: np.empty(self.flush_every, dtype=np.float64) for column in VALUE_COLUMNS}
+        self._alerts = {}  # buffer row -> alert text; alerts are rare
+        self._size = 0
+
+    def _status_code(self, status):
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return code
+
+    def record(self, timestamp, status, price, position_value, il_percent, fees, total_pnl, alert='',
+               equity=np.nan):
+        """Appends one bar."""
+        row = self._size
+        self._timestamp[row] = np.datetime64(pd.Timestamp(timestamp), 'ns')
+        self._status[row] = self._status_code(status)
+        values = self._values
+        values['price'][row] = price
+        values['position_value'][row] = position_value
+        values['il_percent'][row] = il_percent
+        values['fees'][row] = fees
+        values['total_pnl'][row] = total_pnl
+        values['equity'][row] = equity
+        if alert:
+            self._alerts[row] = alert
+        self._size += 1
+        self.rows_recorded += 1
+
+        if self.printer is not None and self._should_print(status, alert):
+            self.printer(timestamp, status, price, position_value, il_percent, fees, total_pnl, alert)
+        if self._size == self.flush_every:
+            self.flush()
+
+    def _should_print(self, status, alert):
+        if self.console == CONSOLE_ALL:
+            return True
+        if self.console == CONSOLE_EVENTS and (alert or status in EVENT_STATUSES):
+            return True
+        return bool(self.console_every) and (self.rows_recorded - 1) % self.console_every == 0
+
+    def _buffer_frame(self):
+        size = self._size
+        alerts = np.full(size, '', dtype=object)
+        for row, text in self._alerts.items():
+            alerts[row] = text
+        frame = pd.DataFrame({
+            'timestamp': self._timestamp[:size].copy(),
+            'status': np.array(self.statuses, dtype=object)[self._status[:size]] if size else np.empty(0, dtype=object),
+            **{column: self._values[column][:size].copy() for column in VALUE_COLUMNS},
+            'alert': alerts,
+        })
+        return frame
+
+    def flush(self):
+        """Writes the buffered rows to the results file (or keeps them in memory)."""
+        if self._size == 0:
+            return
+        frame = self._buffer_frame()
+        if self.file_format == 'csv':
+            frame.to_csv(self.path, mode='a', header=not os.path.exists(self.path), index=False)
+        elif self.file_format in ('parquet', 'arrow'):
+            pyarrow = _require_pyarrow(self.file_format)
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                if self.file_format == 'parquet':
+                    self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+                else:
+                    self._writer = pyarrow.ipc.new_file(self.path, table.schema)
+                if self._existing is not None:
+                    # Parquet and Arrow files cannot be appended to, so the old rows are rewritten.
+                    self._writer.write_table(self._existing.cast(table.schema))
+                    self._existing = None
+            self._writer.write_table(table)
+        else:
+            self._frames.append(frame)
+        self._alerts = {}
+        self._size = 0
+
+    def close(self):
+        """Flushes the remaining rows and finalizes the file. Returns the path."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.path
+
+    def to_frame(self):
+        """All recorded rows as a DataFrame (read back from the file when there is one)."""
+        if self.path:
+            self.close()
+            return read_results(self.path) if os.path.exists(self.path) else self._buffer_frame()
+        return pd.concat(self._frames + [self._buffer_frame()], ignore_index=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_results(frame, path):
+    """Writes a finished results DataFrame (e.g. from `run_vectorized`) to a results file."""
+    file_format = _file_format(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if file_format == 'csv':
+        frame.to_csv(path, index=False)
+    elif file_format == 'parquet':
+        _require_pyarrow(file_format)
+        frame.to_parquet(path, index=False)
+    else:
+        _require_pyarrow(file_format)
+        frame.reset_index(drop=True).to_feather(path)
+    return path
+
+
+def read_results(path, table='results'):
+    """
+    Reads a results file written by `ResultRecorder` or `write_results`, or the `table`
+    of an SQLite database written by `SqliteSink`.
+    """
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        import sqlite3
+        with sqlite3.connect(path) as connection:
+            frame = pd.read_sql(f'SELECT * FROM {table}', connection)
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        # NaN values come back as NULL.
+        frame[list(VALUE_COLUMNS)] = frame[list(VALUE_COLUMNS)].astype(float)
+        frame['alert'] = frame['alert'].fillna('')
+        return frame
+    file_format = _file_format(path)
+    if file_format == 'csv':
+        frame = pd.read_csv(path, keep_default_na=False, na_values=[''])
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        if 'alert' in frame:
+            frame['alert'] = frame['alert'].fillna('')
+        return frame
+    if file_format == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_feather(path)
+
+
+def results_drawdown(frame):
+    """
+    Equity, running peak and drawdown (USD and %) for every row of a results frame.
+    Uses the recorded `equity` column; frames without it (vectorized backtest output)
+    are rebuilt the way `summarize_backtest` does from `status` and `total_pnl`.
+    """
+    if 'equity' in frame and frame['equity'].notna().all():
+        equity = frame['equity'].to_numpy(dtype=float)
+    else:
+        total_pnl = frame['total_pnl'].to_numpy(dtype=float)
+        status = frame['status'].to_numpy()
+        realized = np.cumsum(np.where(status == 'EXITED POSITION', total_pnl, 0.0))
+        unrealized = np.where(status == 'IN RANGE (ACTIVE)', total_pnl, 0.0)
+        # Only the changes matter for the drawdown, so the curve starts at zero PnL.
+        equity = realized + unrealized
+    peak = np.maximum.accumulate(equity) if len(equity) else equity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = np.where(peak > 0, (peak - equity) / peak * 100, np.nan)
+    return pd.DataFrame({
+        'timestamp': frame['timestamp'].to_numpy(),
+        'equity': equity,
+        'running_max': peak,
+        'drawdown': peak - equity,
+        'drawdown_pct': drawdown_pct,
+    })
@@ -0,0 +1,249 @@
+# common/result_sinks.py
+"""
+Typed result records of the paper-trading bots, fanned out to several sinks.
+
+The paper-trading bots used to append one row per cycle to Google Sheets, with every
+value pre-formatted as a string ("$1,234.56", "-0.12%"). That is readable in the
+Sheet, but the numbers have to be parsed back before any analysis. A bot now records
+one `ResultRecord` of plain numbers per cycle into `ResultSinks`. It returns at once,
+and a background thread hands the record to every sink:
+
+- `SheetSink`: the Google Sheet for people, written by a `SheetWriter` (batched,
+  spooled while Sheets is unreachable). Numbers are sent as numbers, so the Sheet's own
+  number formats decide how they look.
+- `FileSink`: a .csv, .parquet or .arrow file through a `ResultRecorder`, in the
+  results layout drawdown.py and the plotting scripts read.
+- `SqliteSink`: a table in an SQLite database. Every flush is a committed transaction,
+  so a killed bot loses at most the rows buffered since the last flush.
+
+Each sink buffers records and writes them when it holds `flush_rows` of them or its
+oldest one is `flush_seconds` old, so the Sheet can stay near real time while a file is
+written once every few minutes. A sink that fails keeps its records and tries again at
+its next flush; the other sinks are not affected.
+"""
+
+import atexit
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import pandas as pd
+
+from common.result_recorder import CONSOLE_NONE, SQLITE_EXTENSIONS, VALUE_COLUMNS, ResultRecorder
+from common.sheet_writer import SheetWriter
+
+RECORD_COLUMNS = ('timestamp', 'status') + VALUE_COLUMNS + ('alert',)
+
+# One bot cycle. `timestamp` is a datetime, `status` / `alert` are text and the value
+# columns are floats in USD (percent for il_percent); `equity` is NaN when unknown.
+ResultRecord = namedtuple('ResultRecord', RECORD_COLUMNS, defaults=(math.nan, ''))
+
+_CLOSE = object()
+
+
+class ResultSink:
+    """
+    Buffers records and writes them in batches. Subclasses implement `_write`.
+
+    :param flush_rows: Records buffered before they are written.
+    :param flush_seconds: Most seconds a record waits to be written (None = no limit).
+    """
+
+    def __init__(self, flush_rows=1, flush_seconds=None, name='sink'):
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = flush_seconds
+        self.name = name
+        self.records_written = 0
+        self._buffer = []
+        self._oldest = None  # monotonic time the oldest buffered record arrived
+
+    def add(self, record):
+        if not self._buffer:
+            self._oldest = time.monotonic()
+        self._buffer.append(record)
+
+    def due(self, now):
+        if not self._buffer:
+            return False
+        if len(self._buffer) >= self.flush_rows:
+            return True
+        return self.flush_seconds is not None and now - self._oldest >= self.flush_seconds
+
+    def flush(self):
+        """Writes the buffered records. On failure they stay buffered for the next flush."""
+        count = len(self._buffer)
+        if not count:
+            return
+        try:
+            self._write(self._buffer)
+        except Exception as e:
+            # Counted from now, so a failing sink retries once per flush interval.
+            self._oldest = time.monotonic()
+            print(f"⚠️ Could not write {count} results to {self.name} "
+                  f"({e.__class__.__name__}: {e}). Keeping them for the next flush.")
+            return
+        self.records_written += count
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    def _write(self, records):
+        raise NotImplementedError
+
+
+class SheetSink(ResultSink):
+    """
+    Rows for a Google Sheet, queued on a `SheetWriter`, which batches them itself. The
+    timestamp is sent as 'YYYY-MM-DD HH:MM:SS' text, which USER_ENTERED turns into a date.
+    """
+
+    def __init__(self, open_worksheet, spool_path, flush_rows=1, flush_seconds=None, name='Google Sheet',
+                 **writer_options):
+        super().__init__(flush_rows, flush_seconds, name)
+        writer_options.setdefault('value_input_option', 'USER_ENTERED')
+        self.writer = SheetWriter(open_worksheet, spool_path, name=name, **writer_options)
+
+    @staticmethod
+    def row(record):
+        # il_percent goes out as a fraction: the Sheet used to get "-0.12%", which
+        # USER_ENTERED stores as -0.0012, so the column keeps one scale.
+        values = [getattr(record, column) / 100 if column == 'il_percent' else getattr(record, column)
+                  for column in VALUE_COLUMNS if column != 'equity']
+        values = [None if math.isnan(value) else value for value in values]
+        return [pd.Timestamp(record.timestamp).strftime('%Y-%m-%d %H:%M:%S'), record.status, *values, record.alert]
+
+    def _write(self, records):
+        for record in records:
+            self.writer.append(self.row(record))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+class FileSink(ResultSink):
+    """
+    A results file (.csv, .parquet or .arrow) written by a `ResultRecorder`. Rows of an
+    existing file are kept. A Parquet / Arrow file is only complete once the sink is
+    closed, so a bot that may be killed is better served by .csv or SQLite.
+    """
+
+    def __init__(self, path, flush_rows=60, flush_seconds=300, name=None):
+        super().__init__(flush_rows, flush_seconds, name or path)
+        self.recorder = ResultRecorder(path, console=CONSOLE_NONE, append=True)
+
+    def _write(self, records):
+        # Taken out of the sink's buffer as the recorder takes them, so a failed flush is
+        # retried by the recorder and never records a row twice.
+        while records:
+            self.recorder.record(**records.pop(0)._asdict())
+        self.recorder.flush()
+
+    def close(self):
+        super().close()
+        self.recorder.close()
+
+
+class SqliteSink(ResultSink):
+    """
+    Records appended to `table` of an SQLite database, one committed transaction per
+    flush. Timestamps are stored as ISO 8601 text; `read_results` reads the table back.
+    """
+
+    def __init__(self, path, table='results', flush_rows=60, flush_seconds=300, name=None):
+        super().__init__(flush_rows, flush_seconds, name or path)
+        self.path = path
+        self.table = table
+        self._connection = None
+
+    def _connect(self):
+        # Opened by the thread that writes, since sqlite3 connections are bound to theirs.
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            columns = ', '.join(['timestamp TEXT', 'status TEXT', *(f'{column} REAL' for column in VALUE_COLUMNS),
+                                 'alert TEXT'])
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({columns})')
+        return self._connection
+
+    def _write(self, records):
+        connection = self._connect()
+        placeholders = ', '.join('?' * len(RECORD_COLUMNS))
+        with connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} ({', '.join(RECORD_COLUMNS)}) VALUES ({placeholders})",
+                [(pd.Timestamp(record.timestamp).isoformat(), *record[1:]) for record in records])
+
+    def close(self):
+        super().close()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def file_sink(path, flush_rows=60, flush_seconds=300):
+    """A `SqliteSink` for .sqlite / .sqlite3 / .db paths, otherwise a `FileSink`."""
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return SqliteSink(path, flush_rows=flush_rows, flush_seconds=flush_seconds)
+    return FileSink(path, flush_rows=flush_rows, flush_seconds=flush_seconds)
+
+
+class ResultSinks:
+    """
+    Hands every recorded `ResultRecord` to all sinks from a background thread.
+
+    :param sinks: The `ResultSink`s to write to.
+    :param poll_seconds: How often the thread checks the time-based flushes.
+    """
+
+    def __init__(self, sinks, poll_seconds=1.0):
+        self.sinks = list(sinks)
+        self.poll_seconds = poll_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def record(self, *values, **fields):
+        """Queues one record (the `ResultRecord` fields); never blocks on a sink."""
+        self._start()
+        self._queue.put(ResultRecord(*values, **fields))
+
+    def close(self, timeout=30.0):
+        """Writes everything buffered and closes the sinks."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='result-sinks', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                record = None
+            if record is _CLOSE:
+                break
+            if record is not None:
+                for sink in self.sinks:
+                    sink.add(record)
+            now = time.monotonic()
+            for sink in self.sinks:
+                if sink.due(now):
+                    sink.flush()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"⚠️ Could not close {sink.name}: {e}")
@@ -0,0 +1,183 @@
+# common/sheet_writer.py
+"""
+Write-behind batching of rows for a Google Sheet.
+
+Appending each row with its own `append_row` call, after authenticating and opening the
+worksheet again, costs an OAuth handshake and three API round trips per row, all inside
+the trading loop. A `SheetWriter` takes rows through a queue and returns at once. A
+background thread keeps the worksheet open, collects the queued rows into
+`append_rows` batches and backs off exponentially when Sheets fails (quota errors
+included).
+
+While Sheets is unreachable, rows go to a local append-only spool file (JSON lines) and
+are sent from it, in order, once writes succeed again. Rows still spooled at exit are
+sent by the next run. A crash between a successful send and the spool update can send
+those rows twice, but none are lost.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+_CLOSE = object()
+
+
+def _is_quota_error(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429
+
+
+class SheetWriter:
+    """
+    Appends rows to a worksheet from a background thread.
+
+    :param open_worksheet: Returns the worksheet to append to (e.g. via gspread). It is
+                           called once and again only after a failed write.
+    :param spool_path: Append-only file holding rows while Sheets is unreachable.
+    :param batch_size: Most rows sent in one `append_rows` call.
+    :param linger_seconds: How long the writer waits for more rows to join a batch.
+    :param value_input_option: Passed to `append_rows` ('RAW' or 'USER_ENTERED').
+    """
+
+    def __init__(self, open_worksheet, spool_path, batch_size=200, linger_seconds=1.0, value_input_option='RAW',
+                 initial_backoff_seconds=5.0, max_backoff_seconds=300.0, name='sheet'):
+        self.open_worksheet = open_worksheet
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.value_input_option = value_input_option
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.name = name
+        self.rows_sent = 0
+        self._queue = queue.Queue()
+        self._worksheet = None
+        self._spooled = None  # rows in the spool file, counted when the thread starts
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # --- Caller side ---
+
+    def append(self, row):
+        """Queues one row; never blocks on Google."""
+        self._start()
+        self._queue.put(list(row))
+
+    def close(self, timeout=10.0):
+        """Sends the queued rows (or spools them) and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"sheet-writer-{self.name}", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    # --- Spool file (only touched by the writer thread) ---
+
+    def _read_spool(self, limit=None):
+        if not os.path.exists(self.spool_path):
+            return []
+        rows = []
+        with open(self.spool_path) as f:
+            for line in f:
+                if limit is not None and len(rows) >= limit:
+                    break
+                if line.strip():
+                    rows.append(json.loads(line))
+        return rows
+
+    def _spool(self, rows):
+        os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+        with open(self.spool_path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=str) + '\n')
+        self._spooled += len(rows)
+
+    def _drop_spooled(self, count):
+        """Removes the first `count` rows of the spool file, once they were sent."""
+        remaining = self._read_spool()[count:]
+        temporary = f"{self.spool_path}.tmp"
+        with open(temporary, 'w') as f:
+            for row in remaining:
+                f.write(json.dumps(row, default=str) + '\n')
+        os.replace(temporary, self.spool_path)
+        self._spooled = len(remaining)
+
+    # --- Writer thread ---
+
+    def _collect(self, timeout):
+        """
+        Waits up to `timeout` seconds for a row, then takes the rows arriving within
+        `linger_seconds`, up to `batch_size`. Returns (rows, closing).
+        """
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return [], False
+        rows = []
+        deadline = time.monotonic() + self.linger_seconds
+        while True:
+            if item is _CLOSE:
+                return rows, True
+            rows.append(item)
+            if len(rows) >= self.batch_size:
+                return rows, False
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return rows, False
+
+    def _send(self, rows):
+        if self._worksheet is None:
+            self._worksheet = self.open_worksheet()
+        self._worksheet.append_rows(rows, value_input_option=self.value_input_option)
+        self.rows_sent += len(rows)
+
+    def _run(self):
+        self._spooled = len(self._read_spool())
+        if self._spooled:
+            print(f"📤 {self._spooled} spooled {self.name} rows from an earlier run will be sent first.")
+        backoff, retry_at, closing = 0.0, 0.0, False
+        while True:
+            if closing:
+                rows, _ = self._collect(0.0)
+            else:
+                wait = None if not self._spooled else max(0.0, retry_at - time.monotonic())
+                rows, closing = self._collect(wait)
+            if self._spooled and rows:
+                # Spooled rows go first, so new ones queue up behind them.
+                self._spool(rows)
+                rows = []
+
+            from_spool = False
+            if not rows and self._spooled and time.monotonic() >= retry_at:
+                rows, from_spool = self._read_spool(self.batch_size), True
+            if rows:
+                try:
+                    self._send(rows)
+                except Exception as e:
+                    if not from_spool:
+                        self._spool(rows)
+                    if not _is_quota_error(e):
+                        self._worksheet = None  # reopen on the next attempt
+                    backoff = min(self.max_backoff_seconds, backoff * 2 or self.initial_backoff_seconds)
+                    retry_at = time.monotonic() + backoff
+                    print(f"⚠️ Google Sheets write failed ({e.__class__.__name__}: {e}). "
+                          f"{self._spooled} rows spooled to {self.spool_path}, retrying in {backoff:.0f}s.")
+                    if closing:
+                        break
+                    continue
+                if from_spool:
+                    self._drop_spooled(len(rows))
+                backoff = 0.0
+
+            if closing and self._queue.empty() and not (self._spooled and time.monotonic() >= retry_at):
+                break
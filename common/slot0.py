@@ -0,0 +1,39 @@
+# common/slot0.py
+"""
+Decoding of a Uniswap V3 style pool's `slot0()` and its sqrtPriceX96 -> price conversion.
+
+The Liquidity Bot (core/pool_registry.py, core/multicall.py) and the Strategy_validation
+simulation read slot0 with raw eth_calls and decode the returned bytes here, so every
+price comes from the same formula. Only the direction differs: the Liquidity Bot quotes
+token0 per token1, the simulation token1 per token0.
+"""
+
+SLOT0_SELECTOR = bytes.fromhex('3850c7bd')  # slot0()
+SLOT0_CALLDATA = '0x' + SLOT0_SELECTOR.hex()
+
+
+def hex_bytes(value):
+    """The bytes of a hex string as JSON-RPC returns it, with or without '0x'."""
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+
+
+def decode_slot0(data):
+    """Returns (sqrtPriceX96, tick) from the raw return data of slot0()."""
+    if len(data) < 64:
+        raise ValueError(f"slot0 returned {len(data)} bytes")
+    sqrt_price_x96 = int.from_bytes(data[0:32], 'big')
+    tick = int.from_bytes(data[32:64], 'big', signed=True)
+    return sqrt_price_x96, tick
+
+
+def slot0_price(sqrt_price_x96, decimals0, decimals1, token0_per_token1=False):
+    """
+    The price of token0 in token1 for a sqrtPriceX96, scaled by the token decimals, or
+    token0 per token1 with `token0_per_token1`. None for an uninitialized pool.
+    """
+    raw_price_t1_per_t0 = (sqrt_price_x96 / 2**96)**2
+    if raw_price_t1_per_t0 == 0:
+        return None
+    if token0_per_token1:
+        return (1 / raw_price_t1_per_t0) * (10**decimals1 / 10**decimals0)
+    return raw_price_t1_per_t0 * (10**decimals0 / 10**decimals1)
@@ -0,0 +1,123 @@
+# common/walk_forward.py
+"""
+Walk-forward optimization for the dynamic-range strategy.
+
+History is split into rolling folds: a training window followed by the test window right
+after it. On every fold the best configuration of a grid (e.g. volatility multiplier and
+lookback) is picked on the training window and then scored, untouched, on the test
+window. The test windows follow each other, so their equity curves stitch into one
+out-of-sample curve.
+
+Folds are independent and run in a process pool over the same memory-mapped candle
+file as the parameter sweeps (see `param_sweep.SharedCandles`).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from common.backtest_kernel import equity_curve, run_backtest_kernel, summarize_backtest
+from common.param_sweep import SharedCandles, attach_worker, expand_grid, warn_close_only, worker_candles
+
+# Metrics where a lower value is the better one.
+_LOWER_IS_BETTER = {'max_drawdown_usd', 'max_drawdown_pct', 'rebalances'}
+
+
+def make_folds(n_bars, train_bars, test_bars=None, n_folds=None):
+    """
+    Returns (train_start, train_end, test_start, test_end) bar windows, ends exclusive.
+
+    Either `test_bars` or `n_folds` is given; with `n_folds` the bars after the first
+    training window are split into that many equal test windows.
+    """
+    if test_bars is None:
+        if not n_folds:
+            raise ValueError("Either test_bars or n_folds is required")
+        test_bars = (n_bars - train_bars) // n_folds
+    if test_bars < 1 or train_bars < 1:
+        raise ValueError(f"Not enough bars ({n_bars}) for the requested walk-forward windows")
+
+    folds = []
+    test_start = train_bars
+    while test_start + test_bars <= n_bars and (n_folds is None or len(folds) < n_folds):
+        folds.append((test_start - train_bars, test_start, test_start, test_start + test_bars))
+        test_start += test_bars
+    return folds
+
+
+def _run_fold(task):
+    """Optimizes on one training window and scores the winner on the following test window."""
+    fold, (train_start, train_end, test_start, test_end), base_config, overrides, objective = task
+    candles = worker_candles()
+    close, volume = candles['close'], candles['volume']
+
+    train_scores = []
+    for override in overrides:
+        config = dict(base_config, **override)
+        result = run_backtest_kernel(close[train_start:train_end], volume[train_start:train_end], config)
+        train_scores.append(summarize_backtest(result, config)[objective])
+    train_scores = np.array(train_scores)
+    best = int(np.argmin(train_scores) if objective in _LOWER_IS_BETTER else np.argmax(train_scores))
+    config = dict(base_config, **overrides[best])
+
+    # The bars before the test window only warm up the range; scoring starts at test_start.
+    start = max(test_start - config['LOOKBACK_PERIOD_HOURS'], 0)
+    result = run_backtest_kernel(close[start:test_end], volume[start:test_end], config)
+    return {
+        'fold': fold,
+        'train_start': train_start,
+        'train_end': train_end,
+        'test_start': test_start,
+        'test_end': test_end,
+        **overrides[best],
+        f'train_{objective}': float(train_scores[best]),
+        **{f'test_{metric}': value for metric, value in summarize_backtest(result, config).items()},
+        'bar_index': result['bar_index'] + start,
+        'equity': equity_curve(result, config),
+    }
+
+
+def run_walk_forward(data, base_config, grid, train_bars, test_bars=None, n_folds=None,
+                     objective='final_pnl', processes=None):
+    """
+    Walk-forward optimization of `grid` over the candles in `data`.
+
+    :param data: DataFrame with `close` and `volume` columns (and optionally `timestamp`).
+    :param base_config: The engine configuration the grid overrides are applied on top of.
+    :param grid: A dict of parameter -> list of values, or a list of override dicts.
+    :param train_bars: Bars in every training window.
+    :param test_bars: Bars in every test window (or give `n_folds` instead).
+    :param objective: `summarize_backtest` metric the training windows are ranked by.
+    :param processes: Number of worker processes (defaults to the CPU count).
+    :return: (folds, equity): one row per fold with the chosen parameters and its
+             in-sample / out-of-sample metrics, and the stitched out-of-sample equity curve.
+    """
+    overrides = expand_grid(grid)
+    folds = make_folds(len(data), train_bars, test_bars, n_folds)
+    if not overrides or not folds:
+        return pd.DataFrame(), pd.Series(dtype=float)
+    warn_close_only([dict(base_config, **override) for override in overrides], "The walk-forward optimization")
+    tasks = [(k, fold, base_config, overrides, objective) for k, fold in enumerate(folds)]
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    with SharedCandles(data) as shared:
+        with ProcessPoolExecutor(max_workers=processes, initializer=attach_worker,
+                                 initargs=shared.handle) as pool:
+            results = list(pool.map(_run_fold, tasks))
+
+    # Every test window starts from fresh capital, so the curves are chained by their returns.
+    capital = base_config['SIMULATION_CAPITAL_USD']
+    growth = 1.0
+    bars, curves = [], []
+    for result in results:
+        equity = result.pop('equity')
+        bars.append(result.pop('bar_index'))
+        curves.append(equity * growth)
+        if len(equity):
+            growth *= equity[-1] / capital
+    bars = np.concatenate(bars)
+    index = data['timestamp'].to_numpy()[bars] if 'timestamp' in data else bars
+    equity = pd.Series(np.concatenate(curves), index=index, name='oos_equity')
+    return pd.DataFrame(results), equity
@@ -3,10 +3,14 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from pathlib import Path
 import logging
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common.result_recorder import read_results, results_drawdown
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +21,48 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
+
+def account_drawdown(df, account_id):
+    """
+    Returns the trades of one account in time order with its cumulative Closed PnL,
+    the running maximum of it and the drawdown below that maximum (in USD).
+    """
+    account_data = df[df['Account'] == account_id].sort_values('Timestamp IST')
+    account_data = account_data.copy()  # Avoid SettingWithCopyWarning
+    account_data['cumulative_pnl'] = account_data['Closed PnL'].cumsum()
+    account_data['running_max'] = account_data['cumulative_pnl'].cummax()
+    account_data['drawdown'] = (account_data['running_max'] - account_data['cumulative_pnl']).astype(float)
+    return account_data
+
+def plot_results_drawdown(results_path, output_dir='drawdown_curve'):
+    """
+    Plots the equity curve and drawdown of a backtest / simulation results file written
+    by `ResultRecorder` (e.g. data/results/eth_usdt_backtest.csv). Returns the PNG path.
+    """
+    results = read_results(results_path)
+    curve = results_drawdown(results)
+    logger.info(f"{results_path}: {len(results):,} rows, max drawdown ${curve['drawdown'].max():,.2f}")
+
+    fig, (ax_equity, ax_drawdown) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+    ax_equity.plot(curve['timestamp'], curve['equity'], color='steelblue', linewidth=1)
+    ax_equity.plot(curve['timestamp'], curve['running_max'], color='grey', linewidth=0.8, linestyle='--')
+    ax_equity.set_title(f'Equity: {Path(results_path).stem}', pad=20)
+    ax_equity.set_ylabel('Equity (USD)')
+    ax_equity.grid(True, alpha=0.3)
+    ax_drawdown.fill_between(curve['timestamp'], curve['drawdown'], color='red', alpha=0.3)
+    ax_drawdown.plot(curve['timestamp'], curve['drawdown'], color='red', linewidth=1)
+    ax_drawdown.set_xlabel('Date')
+    ax_drawdown.set_ylabel('Drawdown (USD)')
+    ax_drawdown.grid(True, alpha=0.3)
+    plt.tight_layout()
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"{Path(results_path).stem}.png")
+    fig.savefig(output_path, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+    logger.info(f"Saved drawdown curve to {output_path}")
+    return output_path
+
 def main():
     try:
         logger.info("Starting trading analysis script")
@@ -117,17 +163,11 @@ def main():
             raise
         def plot_interactive_drawdown(account_id):
             try:
-                account_data = df[df['Account'] == account_id].sort_values('Timestamp IST')
+                account_data = account_drawdown(df, account_id)
                 if len(account_data) == 0:
                     logger.warning(f"No data for account {account_id}")
                     return None
                 
-                # Ensure we have valid data
-                account_data = account_data.copy()  # Avoid SettingWithCopyWarning
-                account_data['cumulative_pnl'] = account_data['Closed PnL'].cumsum()
-                account_data['running_max'] = account_data['cumulative_pnl'].cummax()
-                account_data['drawdown'] = (account_data['running_max'] - account_data['cumulative_pnl']).astype(float)
-                
                 # Convert timestamps to datetime objects if they aren't already
                 if not pd.api.types.is_datetime64_any_dtype(account_data['Timestamp IST']):
                     account_data['Timestamp IST'] = pd.to_datetime(account_data['Timestamp IST'], errors='coerce')
@@ -198,5 +238,10 @@ def main():
         logger.info("Script execution finished")
 
 if __name__ == "__main__":
-    main()
+    # `python drawdown.py <results file> ...` plots backtest results instead of the trades export.
+    if len(sys.argv) > 1:
+        for results_path in sys.argv[1:]:
+            plot_results_drawdown(results_path)
+    else:
+        main()
     
\ No newline at end of file